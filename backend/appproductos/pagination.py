@@ -0,0 +1,80 @@
+"""
+Paginación compartida de los listados grandes.
+
+Por defecto es la paginación por número de página de siempre (`?page=`), con
+dos opciones que el cliente elige por query param:
+
+- `?cursor=` (vacío para la primera página): paginación por cursor sobre el
+  orden indexado que declara la vista en `ordenamiento_cursor`. Cada página
+  se busca desde la última fila de la anterior (sin OFFSET) y no hay COUNT;
+  la respuesta trae `next`/`previous` con el cursor a usar.
+- `?contar=false`: páginas por número pero sin el COUNT; `count` vuelve en
+  null y `next` existe si hay al menos una fila más.
+"""
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class _PaginacionCursor(CursorPagination):
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+
+class PaginacionCursorOpcional(PageNumberPagination):
+    """Paginación por número de página, con cursor o sin COUNT a pedido del cliente"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    contar_query_param = 'contar'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self._cursor = None
+        self._sin_contar = None
+
+        ordenamiento = getattr(view, 'ordenamiento_cursor', None)
+        if ordenamiento and self.cursor_query_param in request.query_params:
+            self._cursor = _PaginacionCursor(ordenamiento, self.get_page_size(request))
+            return self._cursor.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get(self.contar_query_param, '').lower() in ('false', '0', 'no'):
+            return self._paginar_sin_contar(queryset, request)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def _paginar_sin_contar(self, queryset, request):
+        page_size = self.get_page_size(request)
+        try:
+            numero = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            numero = 0
+        if numero < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=numero, message='Página inválida.'))
+
+        # Una fila de más alcanza para saber si hay página siguiente
+        inicio = (numero - 1) * page_size
+        filas = list(queryset[inicio:inicio + page_size + 1])
+        self.request = request
+        self._sin_contar = (numero, len(filas) > page_size)
+        return filas[:page_size]
+
+    def get_paginated_response(self, data):
+        if self._cursor is not None:
+            return self._cursor.get_paginated_response(data)
+        if self._sin_contar is not None:
+            numero, hay_siguiente = self._sin_contar
+            url = self.request.build_absolute_uri()
+            anterior = None
+            if numero == 2:
+                anterior = remove_query_param(url, self.page_query_param)
+            elif numero > 2:
+                anterior = replace_query_param(url, self.page_query_param, numero - 1)
+            return Response({
+                'count': None,
+                'next': replace_query_param(url, self.page_query_param, numero + 1) if hay_siguiente else None,
+                'previous': anterior,
+                'results': data,
+            })
+        return super().get_paginated_response(data)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,6 +55,7 @@ INSTALLED_APPS = [
     'ventas',
     'ofertas',
     'notificaciones',
+    'tareas',
 ]
 
 MIDDLEWARE = [
@@ -211,11 +213,52 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Headers propios que envían las cajas (además de los estándar)
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'x-terminal-id',
+    'idempotency-key',
+)
+
+# Headers de respuesta que el frontend puede leer
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'Retry-After']
+
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # Solo en desarrollo
 
 # Configuración adicional para desarrollo
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
 
+# Cantidad de números de venta que reserva cada terminal (X-Terminal-Id) por vez.
+# Con 1 cada venta toma su número directamente de la secuencia del día.
+VENTAS_BLOQUE_NUMERACION = config('VENTAS_BLOQUE_NUMERACION', default=1, cast=int)
+
+# Generador de tickets PDF: 'canvas' (diseño fijo dibujado directo, más rápido)
+# o 'platypus' (generador original con maquetado de ReportLab)
+VENTAS_TICKET_RENDERER = config('VENTAS_TICKET_RENDERER', default='canvas')
+
+# Caracteres por línea de los tickets ESC/POS (48 para papel de 80mm con la fuente A)
+VENTAS_ESCPOS_COLUMNAS = config('VENTAS_ESCPOS_COLUMNAS', default=48, cast=int)
+
+# Horas que se guardan las respuestas de los requests con Idempotency-Key
+VENTAS_IDEMPOTENCIA_TTL_HORAS = config('VENTAS_IDEMPOTENCIA_TTL_HORAS', default=24, cast=int)
+
+# Minutos que un carrito en curso mantiene apartado el stock de sus items
+VENTAS_RESERVA_MINUTOS = config('VENTAS_RESERVA_MINUTOS', default=15, cast=int)
+
+# Segundos que la caché del escaneo guarda los datos y precio de un código de barras
+# y, por separado, el stock disponible (que cambia con cada venta)
+VENTAS_ESCANEO_CACHE_SEGUNDOS = config('VENTAS_ESCANEO_CACHE_SEGUNDOS', default=300, cast=int)
+VENTAS_ESCANEO_STOCK_SEGUNDOS = config('VENTAS_ESCANEO_STOCK_SEGUNDOS', default=5, cast=int)
+
+# Segundos máximos que se guarda la copia serializada del catálogo de las cajas
+# (cualquier cambio del catálogo la reemplaza antes)
+VENTAS_CATALOGO_CACHE_SEGUNDOS = config('VENTAS_CATALOGO_CACHE_SEGUNDOS', default=3600, cast=int)
+
+# Prefijo interno del proxy (nginx X-Accel-Redirect) que apunta a MEDIA_ROOT, por
+# ejemplo '/media-interna/'. Si está definido, las descargas de tickets las envía
+# el proxy; vacío, los sirve Django.
+VENTAS_TICKETS_X_ACCEL_PREFIX = config('VENTAS_TICKETS_X_ACCEL_PREFIX', default='')
+
 # URL de la API de reconocimiento de productos
 RECOGNITION_API_URL = config('RECOGNITION_API_URL', default='http://localhost:8080')
@@ -6,6 +6,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'test_db.sqlite3',
+        # Base de pruebas en archivo (no en memoria) para que los tests con hilos
+        # esperen los bloqueos de escritura en lugar de fallar con "table is locked"
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_pruebas.sqlite3',
+        },
     }
 }
 
@@ -14,3 +19,11 @@ MEDIA_ROOT = BASE_DIR / 'test_media'
 
 # Permitir todos los orígenes en pruebas
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Sin caché compartida entre tests (los ids y las versiones del catálogo se
+# repiten de un test a otro); los tests de la caché la activan con override_settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
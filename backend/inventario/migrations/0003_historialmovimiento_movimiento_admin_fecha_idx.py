@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0002_detalletransferencia_transferencia_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialmovimiento',
+            index=models.Index(fields=['administrador', '-fecha', '-id'], name='movimiento_admin_fecha_idx'),
+        ),
+    ]
@@ -270,6 +270,10 @@ class HistorialMovimiento(models.Model):
         verbose_name = "Movimiento de Inventario"
         verbose_name_plural = "Movimientos de Inventario"
         ordering = ['-fecha']
+        indexes = [
+            # Historial del supermercado paginado por cursor (más nuevos primero)
+            models.Index(fields=['administrador', '-fecha', '-id'], name='movimiento_admin_fecha_idx'),
+        ]
         
     def __str__(self):
         origen = self.deposito_origen.nombre if self.deposito_origen else "N/A"
@@ -21,6 +21,7 @@ from productos.models import ProductoDeposito
 from notificaciones.models import Notificacion
 from authentication.models import EmpleadoUser
 from empleados.models import Empleado
+from appproductos.pagination import PaginacionCursorOpcional
 
 
 class DepositoListCreateView(generics.ListCreateAPIView):
@@ -635,6 +636,9 @@ class HistorialMovimientoListView(generics.ListAPIView):
     """
     serializer_class = HistorialMovimientoSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PaginacionCursorOpcional
+    # Orden del modo cursor (?cursor=): las páginas profundas no recorren el OFFSET
+    ordenamiento_cursor = ('-fecha', '-id')
     
     def get_queryset(self):
         user = self.request.user
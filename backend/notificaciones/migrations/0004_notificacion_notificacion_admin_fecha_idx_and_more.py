@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0003_alter_notificacion_tipo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['admin', '-creada_en', '-id'], name='notificacion_admin_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['empleado', '-creada_en', '-id'], name='notificacion_empleado_idx'),
+        ),
+    ]
@@ -38,6 +38,11 @@ class Notificacion(models.Model):
 
     class Meta:
         ordering = ["-creada_en"]
+        indexes = [
+            # Notificaciones de cada destinatario paginadas por cursor
+            models.Index(fields=["admin", "-creada_en", "-id"], name="notificacion_admin_fecha_idx"),
+            models.Index(fields=["empleado", "-creada_en", "-id"], name="notificacion_empleado_idx"),
+        ]
 
     def __str__(self) -> str:
         target = self.empleado.get_nombre_completo() if self.empleado else (self.admin.nombre_supermercado if self.admin else "-")
@@ -3,6 +3,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.db.models import Q
 
+from appproductos.pagination import PaginacionCursorOpcional
 from .models import Notificacion
 from .serializers import NotificacionSerializer
 from authentication.models import EmpleadoUser
@@ -11,6 +12,8 @@ from authentication.models import EmpleadoUser
 class MisNotificacionesListView(generics.ListAPIView):
     serializer_class = NotificacionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PaginacionCursorOpcional
+    ordenamiento_cursor = ('-creada_en', '-id')
 
     def get_queryset(self):
         user = self.request.user
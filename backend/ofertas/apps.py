@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OfertasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ofertas'
+
+    def ready(self):
+        # Señales que recalculan la línea de tiempo de precios y los precios de las asignaciones
+        from . import asignaciones, intervalos  # noqa: F401
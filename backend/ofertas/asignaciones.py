@@ -0,0 +1,178 @@
+"""
+Asignación masiva de productos a una oferta y recálculo de sus precios.
+
+Los productos se eligen por ids, por categoría o por búsqueda (o una
+combinación) y se asignan por conjunto: una consulta para los productos, otra
+para los pares (producto, oferta) que ya existen, el precio con descuento
+calculado en memoria con Decimal y un solo bulk_create. Como bulk_create no
+pasa por ProductoOferta.save() ni dispara señales, al final se recalcula la
+línea de tiempo de precios de los productos y se invalidan la versión del
+catálogo y la caché del escaneo.
+
+Las asignaciones guardan el precio del producto y el precio con descuento del
+momento en que se hicieron. Cuando cambia el precio de un producto (al
+guardarlo o en una carga masiva, con `encolar_repreciado`) se encola una
+tarea que recalcula las asignaciones de sus ofertas no vencidas como si se
+volvieran a asignar, por lotes: una lectura y un upsert por id cada
+LOTE_REPRECIADO productos. Las de ofertas vencidas no se tocan: conservan el
+precio que se cobró. En las ofertas en curso el precio nuevo rige desde el
+recálculo: la línea de tiempo se corta en ese instante y el tramo anterior
+queda con el precio que se cobró hasta entonces (ver ofertas.intervalos).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from productos.busqueda import filtrar_busqueda
+from productos.models import Producto
+from productos.versiones import incrementar_version
+from .intervalos import reconstruir_intervalos
+from tareas.cola import encolar
+from .models import ProductoOferta
+
+# Productos por lote del recálculo (y por tarea encolada)
+LOTE_REPRECIADO = 1000
+
+# Precisión de los precios guardados: el recálculo compara contra la base
+CENTAVO = Decimal('0.01')
+
+
+def productos_a_asignar(productos_ids=None, categoria_id=None, busqueda=None):
+    """Productos activos que cumplen todos los criterios indicados (None si no se indicó ninguno)"""
+    if not productos_ids and not categoria_id and not busqueda:
+        return None
+    productos = Producto.objects.filter(activo=True).select_related('categoria')
+    if productos_ids:
+        productos = productos.filter(id__in=productos_ids)
+    if categoria_id:
+        productos = productos.filter(categoria_id=categoria_id)
+    if busqueda:
+        productos = filtrar_busqueda(productos, busqueda)
+    return productos
+
+
+def calculadora_descuento(oferta):
+    """
+    Función precio -> precio con descuento de la oferta, redondeado a
+    centavos como se guarda en la base. El descuento se calcula aunque la
+    oferta todavía no haya empezado (las fechas las resuelve la línea de
+    tiempo); solo una oferta desactivada deja el precio sin descuento.
+    """
+    if not oferta.activo:
+        return lambda precio: precio
+    if oferta.tipo_descuento == 'porcentaje':
+        proporcion = oferta.valor_descuento / Decimal('100')
+        return lambda precio: max(precio - precio * proporcion, Decimal('0')).quantize(CENTAVO)
+    return lambda precio: max(precio - min(oferta.valor_descuento, precio), Decimal('0')).quantize(CENTAVO)
+
+
+def asignar_productos(oferta, productos):
+    """
+    Asigna a la oferta los productos del queryset que todavía no la tienen.
+    Devuelve (asignaciones creadas, releídas con su id, y productos que ya la
+    tenían).
+    """
+    productos = list(productos)
+    existentes = set(ProductoOferta.objects.filter(
+        oferta=oferta, producto_id__in=[producto.id for producto in productos]
+    ).values_list('producto_id', flat=True))
+
+    descontar = calculadora_descuento(oferta)
+    nuevas = [
+        ProductoOferta(
+            producto=producto,
+            oferta=oferta,
+            precio_original=producto.precio,
+            precio_con_descuento=descontar(producto.precio)
+        )
+        for producto in productos if producto.id not in existentes
+    ]
+
+    with transaction.atomic():
+        # Otra asignación simultánea del mismo par no es un error: queda la primera
+        ProductoOferta.objects.bulk_create(nuevas, ignore_conflicts=True, batch_size=1000)
+        reconstruir_intervalos(asignacion.producto_id for asignacion in nuevas)
+        if nuevas:
+            _invalidar_precios()
+
+    creadas = ProductoOferta.objects.filter(
+        oferta=oferta, producto_id__in=[asignacion.producto_id for asignacion in nuevas]
+    ).select_related('producto__categoria', 'oferta')
+    ya_asignados = [producto for producto in productos if producto.id in existentes]
+    return list(creadas), ya_asignados
+
+
+def _invalidar_precios():
+    from ventas.escaneo import invalidar_escaneo
+
+    incrementar_version()
+    transaction.on_commit(invalidar_escaneo)
+
+
+def encolar_repreciado(productos_ids):
+    """
+    Encola el recálculo de las asignaciones de ofertas no vencidas de los
+    productos (una tarea cada LOTE_REPRECIADO productos), solo si tienen alguna.
+    Dentro de una transacción, las tareas existen solo si se confirma.
+    """
+    productos_ids = sorted(set(productos_ids))
+    if not productos_ids or not ProductoOferta.objects.filter(
+        producto_id__in=productos_ids, oferta__fecha_fin__gte=timezone.now()
+    ).exists():
+        return 0
+    for inicio in range(0, len(productos_ids), LOTE_REPRECIADO):
+        encolar('ofertas.repreciar_asignaciones', productos_ids=productos_ids[inicio:inicio + LOTE_REPRECIADO])
+    return len(productos_ids)
+
+
+def repreciar_asignaciones(productos_ids):
+    """
+    Recalcula precio original y precio con descuento de las asignaciones de
+    ofertas no vencidas de los productos con su precio actual, de ahora en
+    adelante en la línea de tiempo. Devuelve cuántas asignaciones cambiaron.
+    """
+    productos_ids = list(productos_ids)
+    cambiadas = 0
+    for inicio in range(0, len(productos_ids), LOTE_REPRECIADO):
+        lote = productos_ids[inicio:inicio + LOTE_REPRECIADO]
+        with transaction.atomic():
+            asignaciones = ProductoOferta.objects.filter(
+                producto_id__in=lote, oferta__fecha_fin__gte=timezone.now()
+            ).select_related('oferta', 'producto')
+
+            calculadoras, actualizadas = {}, []
+            for asignacion in asignaciones:
+                if asignacion.oferta_id not in calculadoras:
+                    calculadoras[asignacion.oferta_id] = calculadora_descuento(asignacion.oferta)
+                precio = asignacion.producto.precio
+                precio_con_descuento = calculadoras[asignacion.oferta_id](precio)
+                if (asignacion.precio_original, asignacion.precio_con_descuento) != (precio, precio_con_descuento):
+                    asignacion.precio_original = precio
+                    asignacion.precio_con_descuento = precio_con_descuento
+                    actualizadas.append(asignacion)
+
+            # Upsert por id en lugar de bulk_update (ver productos.importacion)
+            ProductoOferta.objects.bulk_create(
+                actualizadas,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=['precio_original', 'precio_con_descuento']
+            )
+            if actualizadas:
+                reconstruir_intervalos(asignacion.producto_id for asignacion in actualizadas)
+                _invalidar_precios()
+        cambiadas += len(actualizadas)
+    return cambiadas
+
+
+@receiver(post_save, sender=Producto)
+def repreciar_por_cambio_de_precio(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'precio' not in update_fields):
+        return
+    anterior = getattr(instance, '_precio_guardado', instance.precio)
+    instance._precio_guardado = instance.precio
+    if anterior != instance.precio:
+        encolar_repreciado([instance.pk])
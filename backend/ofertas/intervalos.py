@@ -0,0 +1,188 @@
+"""
+Línea de tiempo de precios con oferta.
+
+Por cada producto se guardan en IntervaloPrecio los tramos [desde, hasta)
+sin superposición en los que tiene alguna oferta activa, con el precio y la
+asignación de la mejor oferta de cada tramo. El precio efectivo en un
+instante es el del tramo que lo contiene (una búsqueda por rango sobre el
+índice (producto, desde)) o, si no hay tramo, el precio del producto en ese
+instante según el historial de precios. Sirve tanto para el precio actual
+como para auditar el precio de un ticket pasado.
+
+Los tramos de un producto se recalculan al guardar o borrar sus asignaciones
+de ofertas y al guardar una oferta (los de todos sus productos), dentro de la
+misma transacción. El recálculo va de ahora en adelante: los tramos que ya
+terminaron no se tocan y el que está en curso se corta en ese instante, así
+que desactivar una oferta o cambiar un precio no reescribe lo que ya se
+cobró. Las asignaciones creadas o borradas de forma masiva (sin señales)
+tienen que llamar a `reconstruir_intervalos`;
+`python manage.py reconstruir_intervalos_precio` recalcula todo.
+"""
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from productos.models import HistorialPrecio, Producto
+from .models import IntervaloPrecio, Oferta, ProductoOferta
+
+# Las ofertas valen hasta fecha_fin inclusive y los tramos excluyen `hasta`
+UN_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+def calcular_tramos(asignaciones):
+    """
+    Tramos (desde, hasta, asignación) de un producto a partir de sus
+    asignaciones de ofertas activas (con la oferta cargada). En cada tramo
+    gana la de menor precio con descuento; los tramos contiguos con la misma
+    asignación se unen.
+    """
+    periodos = [
+        (asignacion.oferta.fecha_inicio, asignacion.oferta.fecha_fin + UN_MICROSEGUNDO, asignacion)
+        for asignacion in asignaciones
+    ]
+    limites = sorted({inicio for inicio, _fin, _asignacion in periodos} | {fin for _inicio, fin, _asignacion in periodos})
+
+    tramos = []
+    for desde, hasta in zip(limites, limites[1:]):
+        vigentes = [asignacion for inicio, fin, asignacion in periodos if inicio <= desde and hasta <= fin]
+        if not vigentes:
+            continue
+        mejor = min(vigentes, key=lambda asignacion: (asignacion.precio_con_descuento, asignacion.id))
+        if tramos and tramos[-1][1] == desde and tramos[-1][2].id == mejor.id:
+            tramos[-1] = (tramos[-1][0], hasta, mejor)
+        else:
+            tramos.append((desde, hasta, mejor))
+    return tramos
+
+
+def asignaciones_por_producto(asignaciones):
+    """Agrupa por producto las asignaciones de ofertas activas del queryset: (producto_id, [asignaciones])"""
+    filas = asignaciones.filter(oferta__activo=True).select_related('oferta').order_by('producto_id')
+    for producto_id, grupo in groupby(filas.iterator(chunk_size=2000), key=attrgetter('producto_id')):
+        yield producto_id, list(grupo)
+
+
+def reconstruir_intervalos(productos_ids=None):
+    """
+    Recalcula desde ahora los tramos de los productos (sin productos: de
+    todos). Los tramos terminados quedan como están; el que está en curso se
+    corta ahora o, si sigue con la misma asignación y precio, se extiende.
+    Devuelve la cantidad de tramos nuevos.
+    """
+    asignaciones = ProductoOferta.objects.all()
+    intervalos = IntervaloPrecio.objects.all()
+    if productos_ids is not None:
+        productos_ids = set(productos_ids)
+        if not productos_ids:
+            return 0
+        asignaciones = asignaciones.filter(producto_id__in=productos_ids)
+        intervalos = intervalos.filter(producto_id__in=productos_ids)
+
+    with transaction.atomic():
+        ahora = timezone.now()
+        en_curso = {
+            intervalo.producto_id: intervalo
+            for intervalo in intervalos.filter(desde__lt=ahora, hasta__gt=ahora).select_for_update()
+        }
+        for intervalo in en_curso.values():
+            intervalo.hasta = ahora
+
+        nuevos = []
+        for producto_id, grupo in asignaciones_por_producto(asignaciones):
+            for desde, hasta, asignacion in calcular_tramos(grupo):
+                if hasta <= ahora:
+                    continue
+                anterior = en_curso.get(producto_id)
+                if (
+                    desde <= ahora and anterior is not None
+                    and anterior.producto_oferta_id == asignacion.id
+                    and anterior.precio == asignacion.precio_con_descuento
+                ):
+                    anterior.hasta = hasta
+                    continue
+                nuevos.append(IntervaloPrecio(
+                    producto_id=producto_id,
+                    producto_oferta=asignacion,
+                    desde=max(desde, ahora),
+                    hasta=hasta,
+                    precio=asignacion.precio_con_descuento
+                ))
+
+        intervalos.filter(desde__gte=ahora).delete()
+        # Upsert por id en lugar de bulk_update (ver productos.importacion)
+        IntervaloPrecio.objects.bulk_create(
+            list(en_curso.values()),
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['hasta']
+        )
+        IntervaloPrecio.objects.bulk_create(nuevos, batch_size=1000)
+    return len(nuevos)
+
+
+def intervalos_en(momento=None):
+    """Tramos que contienen el instante (a lo sumo uno por producto)"""
+    momento = momento or timezone.now()
+    return IntervaloPrecio.objects.filter(desde__lte=momento, hasta__gt=momento)
+
+
+def intervalos_productos(productos_ids, momento=None):
+    """{producto_id: IntervaloPrecio} vigente en el instante, con la asignación y su oferta cargadas"""
+    return {
+        intervalo.producto_id: intervalo
+        for intervalo in intervalos_en(momento).filter(
+            producto_id__in=productos_ids
+        ).select_related('producto_oferta__oferta')
+    }
+
+
+def precios_base_en(productos_ids, momento):
+    """
+    {producto_id: precio del producto en el instante} según el historial de
+    precios: el nuevo del último cambio hasta el instante o, si no hubo, el
+    anterior del primer cambio posterior (sin cambios: el precio actual)
+    """
+    cambios = HistorialPrecio.objects.filter(producto=OuterRef('pk'))
+    hasta_el_momento = cambios.filter(fecha__lte=momento).order_by('-fecha', '-id').values('precio_nuevo')[:1]
+    despues = cambios.filter(fecha__gt=momento).order_by('fecha', 'id').values('precio_anterior')[:1]
+    return dict(
+        Producto.objects.filter(pk__in=productos_ids).annotate(
+            precio_en=Coalesce(Subquery(hasta_el_momento), Subquery(despues), F('precio'))
+        ).values_list('pk', 'precio_en')
+    )
+
+
+def precios_en(productos, momento=None):
+    """
+    {producto_id: precio efectivo} de los productos (instancias) en el
+    instante, con una consulta. Para otro instante, los productos sin tramo
+    toman el precio del historial con una consulta más.
+    """
+    productos = list(productos)
+    intervalos = intervalos_productos([producto.pk for producto in productos], momento)
+    precios = {
+        producto.pk: intervalos[producto.pk].precio if producto.pk in intervalos else producto.precio
+        for producto in productos
+    }
+    sin_tramo = [producto_id for producto_id in precios if producto_id not in intervalos]
+    if momento is not None and sin_tramo:
+        precios.update(precios_base_en(sin_tramo, momento))
+    return precios
+
+
+@receiver([post_save, post_delete], sender=ProductoOferta)
+def reconstruir_por_asignacion(sender, instance, **kwargs):
+    reconstruir_intervalos([instance.producto_id])
+
+
+@receiver(post_save, sender=Oferta)
+def reconstruir_por_oferta(sender, instance, **kwargs):
+    # Cambian las fechas, el estado o el descuento de todos sus productos
+    reconstruir_intervalos(instance.productos_asignados.values_list('producto_id', flat=True))
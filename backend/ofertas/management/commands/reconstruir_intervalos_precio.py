@@ -0,0 +1,26 @@
+"""
+Comando Django para recalcular la línea de tiempo de precios con oferta (por
+ejemplo después de cargar ofertas con SQL o de una restauración). Como el
+recálculo al guardar, va de ahora en adelante: los tramos pasados no cambian.
+
+Uso: python manage.py reconstruir_intervalos_precio [--producto ID ...]
+"""
+
+from django.core.management.base import BaseCommand
+from ofertas.intervalos import reconstruir_intervalos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los intervalos de precio con oferta de los productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--producto',
+            type=int,
+            nargs='+',
+            help='IDs de los productos a recalcular; por defecto, todos'
+        )
+
+    def handle(self, *args, **options):
+        cantidad = reconstruir_intervalos(options['producto'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Línea de tiempo de precios recalculada: {cantidad} intervalos'))
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:20
+
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+UN_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+# Copia de ofertas.intervalos.calcular_tramos al momento de esta migración
+def calcular_tramos(asignaciones):
+    periodos = [
+        (asignacion.oferta.fecha_inicio, asignacion.oferta.fecha_fin + UN_MICROSEGUNDO, asignacion)
+        for asignacion in asignaciones
+    ]
+    limites = sorted({inicio for inicio, _fin, _asignacion in periodos} | {fin for _inicio, fin, _asignacion in periodos})
+
+    tramos = []
+    for desde, hasta in zip(limites, limites[1:]):
+        vigentes = [asignacion for inicio, fin, asignacion in periodos if inicio <= desde and hasta <= fin]
+        if not vigentes:
+            continue
+        mejor = min(vigentes, key=lambda asignacion: (asignacion.precio_con_descuento, asignacion.id))
+        if tramos and tramos[-1][1] == desde and tramos[-1][2].id == mejor.id:
+            tramos[-1] = (tramos[-1][0], hasta, mejor)
+        else:
+            tramos.append((desde, hasta, mejor))
+    return tramos
+
+
+def completar_intervalos(apps, schema_editor):
+    ProductoOferta = apps.get_model('ofertas', 'ProductoOferta')
+    IntervaloPrecio = apps.get_model('ofertas', 'IntervaloPrecio')
+    asignaciones = ProductoOferta.objects.filter(
+        oferta__activo=True
+    ).select_related('oferta').order_by('producto_id')
+    IntervaloPrecio.objects.bulk_create(
+        [
+            IntervaloPrecio(
+                producto_id=producto_id,
+                producto_oferta=asignacion,
+                desde=desde,
+                hasta=hasta,
+                precio=asignacion.precio_con_descuento
+            )
+            for producto_id, grupo in groupby(asignaciones.iterator(chunk_size=2000), key=attrgetter('producto_id'))
+            for desde, hasta, asignacion in calcular_tramos(list(grupo))
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0008_estadisticacategoria'),
+        ('ofertas', '0003_crear_producto_oferta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntervaloPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DateTimeField(verbose_name='Desde')),
+                ('hasta', models.DateTimeField(verbose_name='Hasta (excluido)')),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Precio con descuento')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intervalos_precio', to='productos.producto', verbose_name='Producto')),
+                ('producto_oferta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='intervalos', to='ofertas.productooferta', verbose_name='Producto en oferta')),
+            ],
+            options={
+                'verbose_name': 'Intervalo de Precio',
+                'verbose_name_plural': 'Intervalos de Precio',
+                'ordering': ['producto', 'desde'],
+                'indexes': [models.Index(fields=['producto', 'desde', 'hasta'], name='intervalo_producto_desde_idx')],
+            },
+        ),
+        migrations.RunPython(completar_intervalos, migrations.RunPython.noop),
+    ]
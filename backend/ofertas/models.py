@@ -141,3 +141,41 @@ class ProductoOferta(models.Model):
         if self.precio_original > 0:
             return ((self.precio_original - self.precio_con_descuento) / self.precio_original) * 100
         return 0
+
+
+class IntervaloPrecio(models.Model):
+    """
+    Tramo de tiempo [desde, hasta) en el que un producto tiene oferta vigente,
+    con el precio y la asignación de la mejor oferta del tramo (ver
+    ofertas.intervalos). Fuera de los tramos rige el precio del producto.
+    Los tramos pasados conservan su precio aunque se borre la asignación.
+    """
+    producto = models.ForeignKey(
+        'productos.Producto',
+        on_delete=models.CASCADE,
+        related_name='intervalos_precio',
+        verbose_name="Producto"
+    )
+    producto_oferta = models.ForeignKey(
+        ProductoOferta,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='intervalos',
+        verbose_name="Producto en oferta"
+    )
+    desde = models.DateTimeField(verbose_name="Desde")
+    hasta = models.DateTimeField(verbose_name="Hasta (excluido)")
+    precio = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Precio con descuento")
+
+    class Meta:
+        verbose_name = "Intervalo de Precio"
+        verbose_name_plural = "Intervalos de Precio"
+        ordering = ['producto', 'desde']
+        indexes = [
+            # Precio en un instante: búsqueda por rango sobre (producto, desde)
+            models.Index(fields=['producto', 'desde', 'hasta'], name='intervalo_producto_desde_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.precio} ({self.desde} - {self.hasta})"
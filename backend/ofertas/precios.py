@@ -0,0 +1,86 @@
+"""
+Resolución de precios efectivos con las ofertas vigentes.
+
+Para un conjunto de productos arma, en un mismo instante de referencia (el
+`ahora` que se pasa o uno tomado una sola vez), el precio efectivo, la mejor
+oferta y la lista de ofertas activas. Así el listado de ofertas, el catálogo
+de las cajas y el alta de items no consultan oferta por oferta ni ven
+instantes distintos en la misma respuesta.
+
+El precio efectivo y la mejor oferta salen siempre de los tramos
+precalculados de ofertas.intervalos, la misma fuente que usan el catálogo,
+el escaneo y el cobro; la lista de ofertas vigentes es solo informativa.
+"""
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .intervalos import intervalos_en, intervalos_productos
+from .models import ProductoOferta
+
+
+def q_oferta_vigente(ahora, prefijo=''):
+    """Condición de oferta vigente en `ahora` (prefijo: camino hasta la oferta, p. ej. 'ofertas_aplicadas__')"""
+    return Q(**{
+        f'{prefijo}oferta__activo': True,
+        f'{prefijo}oferta__fecha_inicio__lte': ahora,
+        f'{prefijo}oferta__fecha_fin__gte': ahora,
+    })
+
+
+def ofertas_vigentes(ahora=None):
+    """ProductoOferta de ofertas activas y dentro de sus fechas en `ahora`"""
+    return ProductoOferta.objects.filter(q_oferta_vigente(ahora or timezone.now()))
+
+
+def subconsulta_precio_oferta(ahora=None, producto='pk'):
+    """
+    Subconsulta con el precio de la mejor oferta vigente del producto (None si
+    no tiene), leído del tramo de la línea de tiempo que contiene `ahora`.
+    `producto` es el campo de la consulta externa con el id del producto.
+    """
+    return Subquery(intervalos_en(ahora).filter(producto=OuterRef(producto)).values('precio')[:1])
+
+
+class PrecioResuelto:
+    """Precio efectivo y mejor oferta (del tramo vigente) y ofertas vigentes de un producto"""
+
+    def __init__(self, producto, ofertas, intervalo=None):
+        self.producto = producto
+        # Ordenadas de menor a mayor precio con descuento
+        self.ofertas = ofertas
+        self.intervalo = intervalo
+        self.mejor_oferta = intervalo.producto_oferta if intervalo else None
+
+    @property
+    def tiene_ofertas_activas(self):
+        return self.intervalo is not None
+
+    @property
+    def precio_efectivo(self):
+        return self.intervalo.precio if self.intervalo else self.producto.precio
+
+
+def resolver_precios(productos, ahora=None):
+    """
+    {producto_id: PrecioResuelto} de los productos (instancias) en `ahora`,
+    con dos consultas: los tramos vigentes y las ofertas vigentes. Las
+    ofertas quedan con su Oferta y su producto cargados.
+    """
+    ahora = ahora or timezone.now()
+    productos = {producto.pk: producto for producto in productos}
+    ofertas = {producto_id: [] for producto_id in productos}
+    intervalos = {}
+    if productos:
+        intervalos = intervalos_productos(productos.keys(), ahora)
+        for producto_oferta in ofertas_vigentes(ahora).filter(
+            producto_id__in=productos.keys()
+        ).select_related('oferta').order_by('producto_id', 'precio_con_descuento', 'id'):
+            producto_oferta.producto = productos[producto_oferta.producto_id]
+            ofertas[producto_oferta.producto_id].append(producto_oferta)
+        for producto_id, intervalo in intervalos.items():
+            if intervalo.producto_oferta is not None:
+                intervalo.producto_oferta.producto = productos[producto_id]
+    return {
+        producto_id: PrecioResuelto(producto, ofertas[producto_id], intervalos.get(producto_id))
+        for producto_id, producto in productos.items()
+    }
@@ -0,0 +1,9 @@
+"""Tareas en segundo plano de ofertas (las ejecuta `python manage.py procesar_tareas`)"""
+from tareas.cola import registrar
+from .asignaciones import repreciar_asignaciones
+
+
+@registrar('ofertas.repreciar_asignaciones')
+def repreciar(productos_ids):
+    """Recalcula las asignaciones de ofertas de los productos con su precio actual"""
+    repreciar_asignaciones(productos_ids)
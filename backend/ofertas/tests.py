@@ -1,3 +1,379 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ofertas.asignaciones import repreciar_asignaciones
+from ofertas.intervalos import intervalos_productos, precios_en
+from ofertas.models import IntervaloPrecio, Oferta, ProductoOferta
+from ofertas.precios import resolver_precios
+from productos.models import Categoria, Producto
+from tareas.cola import procesar_pendientes
+from tareas.models import Tarea
+
+
+class ResolverPreciosTestCase(TestCase):
+    """Tests para la resolución de precios efectivos por conjunto"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            email='admin@ofertas.com',
+            username='admin_ofertas',
+            password='StrongPass1!',
+            nombre_supermercado='Super Ofertas',
+            cuil='20121212121',
+            provincia='Buenos Aires',
+            localidad='La Plata',
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.ahora = timezone.now()
+        categoria = Categoria.objects.create(nombre='Ofertas')
+        self.productos = [
+            Producto.objects.create(nombre=f'Producto {i}', categoria=categoria, precio=Decimal('100.00'))
+            for i in range(4)
+        ]
+        self.diez = self._oferta('Diez', '10', timedelta(days=-1), timedelta(days=1))
+        self.veinte = self._oferta('Veinte', '20', timedelta(days=-1), timedelta(days=1))
+        futura = self._oferta('Futura', '50', timedelta(days=1), timedelta(days=2))
+        for producto in self.productos[:3]:
+            ProductoOferta.objects.create(producto=producto, oferta=self.diez)
+        ProductoOferta.objects.create(producto=self.productos[0], oferta=self.veinte)
+        # Todavía no empezó: no cuenta
+        ProductoOferta.objects.create(
+            producto=self.productos[3], oferta=futura,
+            precio_original=Decimal('100.00'), precio_con_descuento=Decimal('50.00')
+        )
+
+    def _oferta(self, nombre, porcentaje, desde, hasta):
+        return Oferta.objects.create(
+            nombre=nombre,
+            tipo_descuento='porcentaje',
+            valor_descuento=Decimal(porcentaje),
+            fecha_inicio=self.ahora + desde,
+            fecha_fin=self.ahora + hasta
+        )
+
+    def test_resolver_precios_en_consultas_fijas(self):
+        """Precio efectivo y mejor oferta (de los tramos) y ofertas vigentes de todos los productos con dos consultas"""
+        with CaptureQueriesContext(connection) as consultas:
+            precios = resolver_precios(self.productos)
+            nombre_mejor = precios[self.productos[0].id].mejor_oferta.oferta.nombre
+        self.assertEqual(len(consultas.captured_queries), 2)
+
+        self.assertEqual(nombre_mejor, 'Veinte')
+        self.assertEqual(precios[self.productos[0].id].precio_efectivo, Decimal('80.00'))
+        self.assertEqual(len(precios[self.productos[0].id].ofertas), 2)
+        self.assertEqual(precios[self.productos[1].id].precio_efectivo, Decimal('90.00'))
+        self.assertFalse(precios[self.productos[3].id].tiene_ofertas_activas)
+        self.assertEqual(precios[self.productos[3].id].precio_efectivo, Decimal('100.00'))
+
+    def test_resolver_precios_en_otro_instante(self):
+        """El instante de referencia decide qué ofertas están vigentes"""
+        precios = resolver_precios(self.productos, self.ahora + timedelta(days=1, hours=12))
+        self.assertEqual(precios[self.productos[3].id].precio_efectivo, Decimal('50.00'))
+        self.assertFalse(precios[self.productos[0].id].tiene_ofertas_activas)
+
+    def test_productos_con_ofertas_consultas_fijas(self):
+        """El listado no hace consultas por producto y filtra por estado en la consulta"""
+        url = reverse('producto-ofertas-productos-con-ofertas')
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(consultas.captured_queries), 3)
+
+        datos = {producto['id']: producto for producto in response.data}
+        primero = datos[self.productos[0].id]
+        self.assertEqual(primero['precio_con_descuento'], Decimal('80.00'))
+        self.assertEqual(primero['mejor_oferta']['oferta_nombre'], 'Veinte')
+        self.assertEqual(len(primero['ofertas_aplicadas']), 2)
+        self.assertIsNone(datos[self.productos[3].id]['mejor_oferta'])
+
+        response = self.client.get(url, {'estado_oferta': 'sin_oferta'})
+        self.assertEqual([producto['id'] for producto in response.data], [self.productos[3].id])
+
+    def test_el_precio_sale_de_los_tramos(self):
+        """Si la asignación y los tramos difieren, manda el tramo (el mismo precio que se cobra)"""
+        ProductoOferta.objects.filter(producto=self.productos[1]).update(precio_con_descuento=Decimal('10.00'))
+        precio = self.productos[1].precio_resuelto()
+        self.assertEqual(precio.precio_efectivo, Decimal('90.00'))
+        self.assertEqual(precio.precio_efectivo, self.productos[1].get_precio_con_descuento())
+        self.assertEqual(precio.mejor_oferta.id, self.productos[1].get_mejor_oferta().id)
+
+
+class LineaTiempoPreciosTestCase(TestCase):
+    """Tests para los intervalos de precio precalculados"""
+
+    def setUp(self):
+        self.ahora = timezone.now()
+        categoria = Categoria.objects.create(nombre='Línea de tiempo')
+        self.producto = Producto.objects.create(nombre='Producto', categoria=categoria, precio=Decimal('100.00'))
+        # Diez: días 0 a 10; Treinta: días 3 a 5 (mejor mientras dura)
+        self.diez = self._asignar('Diez', '10', 0, 10)
+        self.treinta = self._asignar('Treinta', '30', 3, 5)
+
+    def _asignar(self, nombre, porcentaje, desde, hasta):
+        oferta = Oferta.objects.create(
+            nombre=nombre,
+            tipo_descuento='porcentaje',
+            valor_descuento=Decimal(porcentaje),
+            fecha_inicio=self.ahora + timedelta(days=desde),
+            fecha_fin=self.ahora + timedelta(days=hasta)
+        )
+        return ProductoOferta.objects.create(
+            producto=self.producto,
+            oferta=oferta,
+            precio_original=self.producto.precio,
+            precio_con_descuento=self.producto.precio * (100 - Decimal(porcentaje)) / 100
+        )
+
+    def _precio(self, dias):
+        return precios_en([self.producto], self.ahora + timedelta(days=dias))[self.producto.id]
+
+    def test_tramos_con_la_mejor_oferta(self):
+        """Los tramos no se superponen y cada uno tiene la mejor oferta del momento"""
+        tramos = list(IntervaloPrecio.objects.filter(producto=self.producto).values_list('producto_oferta', 'precio'))
+        self.assertEqual(tramos, [
+            (self.diez.id, Decimal('90.00')),
+            (self.treinta.id, Decimal('70.00')),
+            (self.diez.id, Decimal('90.00')),
+        ])
+
+        self.assertEqual(self._precio(-1), Decimal('100.00'))
+        self.assertEqual(self._precio(1), Decimal('90.00'))
+        self.assertEqual(self._precio(4), Decimal('70.00'))
+        self.assertEqual(self._precio(10), Decimal('90.00'))
+        self.assertEqual(self._precio(11), Decimal('100.00'))
+
+    def test_cambios_de_ofertas_actualizan_los_tramos(self):
+        """Desactivar una oferta o quitar una asignación recalcula los tramos del producto"""
+        self.treinta.oferta.activo = False
+        self.treinta.oferta.save()
+        self.assertEqual(self._precio(4), Decimal('90.00'))
+
+        self.diez.delete()
+        self.assertEqual(self._precio(4), Decimal('100.00'))
+        self.assertFalse(IntervaloPrecio.objects.filter(producto=self.producto, hasta__gt=timezone.now()).exists())
+
+    def test_el_pasado_no_cambia(self):
+        """Desactivar la oferta y cambiar el precio no reescribe lo que ya se cobró"""
+        cobro = timezone.now()
+        self.assertEqual(precios_en([self.producto], cobro)[self.producto.id], Decimal('90.00'))
+
+        self.diez.oferta.activo = False
+        self.diez.oferta.save()
+        self.producto.precio = Decimal('200.00')
+        self.producto.save()
+        self.diez.delete()
+
+        self.assertEqual(precios_en([self.producto], cobro)[self.producto.id], Decimal('90.00'))
+        # Antes de la oferta regía el precio anterior al cambio, no el actual
+        self.assertEqual(self._precio(-1), Decimal('100.00'))
+        self.assertEqual(precios_en([self.producto])[self.producto.id], Decimal('200.00'))
+
+    def test_mejor_oferta_en_un_instante(self):
+        """La consulta por instante trae la asignación con su oferta, para el cobro y las auditorías"""
+        with CaptureQueriesContext(connection) as consultas:
+            intervalo = intervalos_productos([self.producto.id], self.ahora + timedelta(days=4))[self.producto.id]
+            nombre = intervalo.producto_oferta.oferta.nombre
+        self.assertEqual(len(consultas.captured_queries), 1)
+        self.assertEqual(nombre, 'Treinta')
+
+    def test_comando_reconstruir(self):
+        IntervaloPrecio.objects.all().delete()
+        call_command('reconstruir_intervalos_precio', stdout=StringIO())
+        self.assertEqual(IntervaloPrecio.objects.filter(producto=self.producto).count(), 3)
+
+
+class AsignarProductosTestCase(TestCase):
+    """Tests para la asignación masiva de productos a una oferta"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            email='admin@asignar.com',
+            username='admin_asignar',
+            password='StrongPass1!',
+            nombre_supermercado='Super Asignar',
+            cuil='20131313131',
+            provincia='Buenos Aires',
+            localidad='La Plata',
+        )
+        self.client.force_authenticate(user=self.admin)
+        ahora = timezone.now()
+        self.oferta = Oferta.objects.create(
+            nombre='Lácteos 20%',
+            tipo_descuento='porcentaje',
+            valor_descuento=Decimal('20'),
+            fecha_inicio=ahora - timedelta(days=1),
+            fecha_fin=ahora + timedelta(days=1)
+        )
+        self.lacteos = Categoria.objects.create(nombre='Lácteos')
+        otra = Categoria.objects.create(nombre='Otra')
+        self.leches = [
+            Producto.objects.create(nombre=f'Leche {i}', categoria=self.lacteos, precio=Decimal('10.50') + i)
+            for i in range(5)
+        ]
+        self.otro = Producto.objects.create(nombre='Leche de otra categoría', categoria=otra, precio=Decimal('10.00'))
+        ProductoOferta.objects.create(producto=self.leches[0], oferta=self.oferta)
+        self.url = reverse('ofertas-asignar-productos', kwargs={'pk': self.oferta.pk})
+
+    def test_asignar_por_categoria(self):
+        """Asigna los productos de la categoría que todavía no tienen la oferta, con el precio calculado"""
+        response = self.client.post(self.url, {'categoria_id': self.lacteos.id}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['asignaciones']), 4)
+        self.assertEqual(len(response.data['errores']), 1)
+        self.assertTrue(all(asignacion['id'] for asignacion in response.data['asignaciones']))
+        self.assertFalse(ProductoOferta.objects.filter(producto=self.otro).exists())
+
+        asignacion = ProductoOferta.objects.get(producto=self.leches[1], oferta=self.oferta)
+        self.assertEqual(asignacion.precio_original, Decimal('11.50'))
+        self.assertEqual(asignacion.precio_con_descuento, Decimal('9.20'))
+        # La línea de tiempo de precios queda actualizada
+        self.assertEqual(precios_en([self.leches[1]])[self.leches[1].id], Decimal('9.20'))
+
+    def test_asignar_consultas_fijas(self):
+        """La cantidad de consultas no depende de la cantidad de productos"""
+        def consultas(productos):
+            ProductoOferta.objects.filter(oferta=self.oferta).exclude(producto=self.leches[0]).delete()
+            with CaptureQueriesContext(connection) as capturadas:
+                response = self.client.post(
+                    self.url, {'productos_ids': [producto.id for producto in productos]}, format='json'
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(capturadas.captured_queries)
+
+        self.assertEqual(consultas(self.leches[1:2]), consultas(self.leches[1:]))
+
+    def test_asignar_por_busqueda_y_sin_criterios(self):
+        response = self.client.post(self.url, {'busqueda': 'otra categoria'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['asignaciones'][0]['producto'], self.otro.id)
+
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RepreciadoAsignacionesTestCase(TestCase):
+    """Tests para el recálculo de las asignaciones cuando cambia el precio de un producto"""
+
+    def setUp(self):
+        ahora = timezone.now()
+        categoria = Categoria.objects.create(nombre='Repreciado')
+        self.vigente = Oferta.objects.create(
+            nombre='Vigente 10%', tipo_descuento='porcentaje', valor_descuento=Decimal('10'),
+            fecha_inicio=ahora - timedelta(days=1), fecha_fin=ahora + timedelta(days=1)
+        )
+        self.vencida = Oferta.objects.create(
+            nombre='Vencida', tipo_descuento='monto_fijo', valor_descuento=Decimal('5'),
+            fecha_inicio=ahora - timedelta(days=10), fecha_fin=ahora - timedelta(days=5)
+        )
+        self.producto = Producto.objects.create(nombre='Yerba', categoria=categoria, precio=Decimal('100.00'))
+        self.asignacion = ProductoOferta.objects.create(producto=self.producto, oferta=self.vigente)
+        self.historica = ProductoOferta.objects.create(
+            producto=self.producto, oferta=self.vencida,
+            precio_original=Decimal('100.00'), precio_con_descuento=Decimal('95.00')
+        )
+
+    def test_cambio_de_precio_encola_y_recalcula(self):
+        """El cambio de precio encola una tarea que recalcula solo las ofertas no vencidas"""
+        producto = Producto.objects.get(pk=self.producto.pk)
+        producto.precio = Decimal('200.00')
+        producto.save()
+        self.assertEqual(Tarea.objects.filter(tipo='ofertas.repreciar_asignaciones').count(), 1)
+
+        procesar_pendientes()
+
+        self.asignacion.refresh_from_db()
+        self.historica.refresh_from_db()
+        self.assertEqual((self.asignacion.precio_original, self.asignacion.precio_con_descuento),
+                         (Decimal('200.00'), Decimal('180.00')))
+        self.assertEqual(self.historica.precio_con_descuento, Decimal('95.00'))
+        # El cobro usa el precio nuevo
+        self.assertEqual(precios_en([producto])[producto.id], Decimal('180.00'))
+
+    def test_repreciado_no_cambia_lo_ya_cobrado(self):
+        """La oferta en curso mantiene el precio anterior hasta el recálculo y el nuevo desde ahí"""
+        cobro = timezone.now()
+        producto = Producto.objects.get(pk=self.producto.pk)
+        producto.precio = Decimal('200.00')
+        producto.save()
+        procesar_pendientes()
+
+        tramos = IntervaloPrecio.objects.filter(producto_oferta=self.asignacion)
+        self.assertEqual(list(tramos.values_list('precio', flat=True)), [Decimal('90.00'), Decimal('180.00')])
+        self.assertEqual(precios_en([producto], cobro)[producto.id], Decimal('90.00'))
+        self.assertEqual(precios_en([producto])[producto.id], Decimal('180.00'))
+
+    def test_repreciar_dos_veces_no_cambia_nada(self):
+        """El precio con descuento se redondea a centavos como en la base: el segundo recálculo no cambia nada"""
+        quince = Oferta.objects.create(
+            nombre='Quince', tipo_descuento='porcentaje', valor_descuento=Decimal('15'),
+            fecha_inicio=timezone.now() - timedelta(days=1), fecha_fin=timezone.now() + timedelta(days=1)
+        )
+        ProductoOferta.objects.create(producto=self.producto, oferta=quince)
+        Producto.objects.filter(pk=self.producto.pk).update(precio=Decimal('9.99'))
+
+        self.assertEqual(repreciar_asignaciones([self.producto.pk]), 2)
+        self.assertEqual(
+            ProductoOferta.objects.get(oferta=quince).precio_con_descuento, Decimal('8.49')
+        )
+        tramos = IntervaloPrecio.objects.count()
+        self.assertEqual(repreciar_asignaciones([self.producto.pk]), 0)
+        self.assertEqual(IntervaloPrecio.objects.count(), tramos)
+
+    def test_repreciar_oferta_futura_conserva_el_descuento(self):
+        """Una oferta que todavía no empezó recalcula el descuento en lugar de perderlo"""
+        futura = Oferta.objects.create(
+            nombre='Futura 20%', tipo_descuento='porcentaje', valor_descuento=Decimal('20'),
+            fecha_inicio=timezone.now() + timedelta(days=2), fecha_fin=timezone.now() + timedelta(days=3)
+        )
+        asignacion = ProductoOferta.objects.create(
+            producto=self.producto, oferta=futura,
+            precio_original=Decimal('100.00'), precio_con_descuento=Decimal('80.00')
+        )
+        Producto.objects.filter(pk=self.producto.pk).update(precio=Decimal('200.00'))
+
+        repreciar_asignaciones([self.producto.pk])
+
+        asignacion.refresh_from_db()
+        self.assertEqual(asignacion.precio_con_descuento, Decimal('160.00'))
+        self.assertEqual(
+            precios_en([self.producto], timezone.now() + timedelta(days=2, hours=12))[self.producto.id],
+            Decimal('160.00')
+        )
+
+    def test_guardar_sin_cambiar_precio_no_encola(self):
+        producto = Producto.objects.get(pk=self.producto.pk)
+        producto.descripcion = 'Otra descripción'
+        producto.save()
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_importacion_encola_los_precios_cambiados(self):
+        """Una carga masiva que cambia precios encola el recálculo de sus asignaciones"""
+        from productos.importacion import importar_productos
+
+        admin = get_user_model().objects.create_user(
+            email='admin@repreciado.com', username='admin_repreciado', password='StrongPass1!',
+            nombre_supermercado='Super Repreciado', cuil='20141414141',
+            provincia='Buenos Aires', localidad='La Plata',
+        )
+        # La importación solo modifica productos de categorías propias
+        Categoria.objects.filter(nombre='Repreciado').update(usuario=admin)
+        filas = [(2, {'nombre': 'Yerba', 'categoria': 'Repreciado', 'precio': '150'})]
+        importar_productos(iter(filas), admin)
+        procesar_pendientes()
 
-# Create your tests here.
+        self.asignacion.refresh_from_db()
+        self.assertEqual(self.asignacion.precio_con_descuento, Decimal('135.00'))
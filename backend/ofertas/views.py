@@ -3,11 +3,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 from authentication.permissions import IsSupermercadoAdmin
 from productos.models import Producto
+from . import asignaciones
+from .intervalos import intervalos_en
 from .models import Oferta, ProductoOferta
+from .precios import resolver_precios
 from .serializers import OfertaSerializer, OfertaListSerializer, ProductoOfertaSerializer, ProductoConOfertaSerializer
 
 class OfertaViewSet(viewsets.ModelViewSet):
@@ -154,7 +157,10 @@ class OfertaViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def asignar_productos(self, request, pk=None):
-        """Asignar productos a una oferta"""
+        """
+        Asignar productos a una oferta: por `productos_ids`, `categoria_id` y/o
+        `busqueda` (se asignan los productos activos que cumplen todo lo indicado)
+        """
         oferta = self.get_object()
         
         # Verificar que la oferta esté vigente
@@ -164,33 +170,24 @@ class OfertaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        productos_ids = request.data.get('productos_ids', [])
-        if not productos_ids:
+        productos = asignaciones.productos_a_asignar(
+            productos_ids=request.data.get('productos_ids') or None,
+            categoria_id=request.data.get('categoria_id') or None,
+            busqueda=(request.data.get('busqueda') or '').strip() or None
+        )
+        if productos is None:
             return Response(
-                {'error': 'Debe seleccionar al menos un producto.'},
+                {'error': 'Debe seleccionar al menos un producto, una categoría o una búsqueda.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        productos = Producto.objects.filter(id__in=productos_ids, activo=True)
-        asignaciones_creadas = []
-        errores = []
-        
-        for producto in productos:
-            # Verificar si ya tiene esta oferta
-            if ProductoOferta.objects.filter(producto=producto, oferta=oferta).exists():
-                errores.append(f'El producto "{producto.nombre}" ya tiene esta oferta asignada.')
-                continue
-                
-            # Crear la asignación
-            try:
-                producto_oferta = ProductoOferta.objects.create(
-                    producto=producto,
-                    oferta=oferta,
-                    precio_original=producto.precio
-                )
-                asignaciones_creadas.append(producto_oferta)
-            except Exception as e:
-                errores.append(f'Error al asignar "{producto.nombre}": {str(e)}')
+        try:
+            asignaciones_creadas, ya_asignados = asignaciones.asignar_productos(oferta, productos)
+        except Exception as e:
+            return Response(
+                {'error': f'Error al asignar productos: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # Serializar las asignaciones creadas
         serializer = ProductoOfertaSerializer(asignaciones_creadas, many=True)
@@ -200,8 +197,11 @@ class OfertaViewSet(viewsets.ModelViewSet):
             'asignaciones': serializer.data
         }
         
-        if errores:
-            response_data['errores'] = errores
+        if ya_asignados:
+            response_data['errores'] = [
+                f'El producto "{producto.nombre}" ya tiene esta oferta asignada.'
+                for producto in ya_asignados
+            ]
             
         return Response(response_data)
     
@@ -241,46 +241,35 @@ class ProductoOfertaViewSet(viewsets.ModelViewSet):
         categoria_id = request.query_params.get('categoria')
         estado_oferta = request.query_params.get('estado_oferta')  # 'con_oferta', 'sin_oferta'
         
-        productos = Producto.objects.filter(activo=True)
+        productos = Producto.objects.filter(activo=True).select_related('categoria')
         
         if categoria_id:
             productos = productos.filter(categoria_id=categoria_id)
         
+        # Un solo instante para filtrar y resolver precios, y el filtro por estado en la consulta
+        ahora = timezone.now()
+        vigentes = Exists(intervalos_en(ahora).filter(producto=OuterRef('pk')))
+        if estado_oferta == 'con_oferta':
+            productos = productos.filter(vigentes)
+        elif estado_oferta == 'sin_oferta':
+            productos = productos.exclude(vigentes)
+        
+        productos = list(productos)
+        precios = resolver_precios(productos, ahora)
+        
         # Construir respuesta con información de ofertas
         productos_data = []
         for producto in productos:
-            tiene_ofertas = producto.tiene_ofertas_activas()
-            
-            # Filtrar por estado de oferta si se especifica
-            if estado_oferta == 'con_oferta' and not tiene_ofertas:
-                continue
-            elif estado_oferta == 'sin_oferta' and tiene_ofertas:
-                continue
-                
-            producto_data = {
+            precio = precios[producto.id]
+            productos_data.append({
                 'id': producto.id,
                 'nombre': producto.nombre,
                 'categoria': producto.categoria.nombre,
                 'precio': producto.precio,
-                'tiene_ofertas_activas': tiene_ofertas,
-                'precio_con_descuento': producto.get_precio_con_descuento(),
-                'mejor_oferta': None,
-                'ofertas_aplicadas': []
-            }
-            
-            if tiene_ofertas:
-                mejor_oferta = producto.get_mejor_oferta()
-                if mejor_oferta:
-                    producto_data['mejor_oferta'] = ProductoOfertaSerializer(mejor_oferta).data
-                
-                ofertas_aplicadas = ProductoOferta.objects.filter(
-                    producto=producto,
-                    oferta__activo=True,
-                    oferta__fecha_inicio__lte=timezone.now(),
-                    oferta__fecha_fin__gte=timezone.now()
-                )
-                producto_data['ofertas_aplicadas'] = ProductoOfertaSerializer(ofertas_aplicadas, many=True).data
-            
-            productos_data.append(producto_data)
+                'tiene_ofertas_activas': precio.tiene_ofertas_activas,
+                'precio_con_descuento': precio.precio_efectivo,
+                'mejor_oferta': ProductoOfertaSerializer(precio.mejor_oferta).data if precio.mejor_oferta else None,
+                'ofertas_aplicadas': ProductoOfertaSerializer(precio.ofertas, many=True).data
+            })
         
         return Response(productos_data)
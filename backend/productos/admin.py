@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Categoria, Producto, ProductoDeposito
+from .models import Categoria, Producto, ProductoDeposito, CodigoBarras
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -21,3 +21,9 @@ class ProductoDepositoAdmin(admin.ModelAdmin):
     list_filter = ('deposito', 'fecha_creacion')
     search_fields = ('producto__nombre', 'deposito__nombre')
     readonly_fields = ('fecha_creacion', 'fecha_modificacion')
+
+@admin.register(CodigoBarras)
+class CodigoBarrasAdmin(admin.ModelAdmin):
+    list_display = ('codigo', 'producto', 'supermercado', 'fecha_creacion')
+    search_fields = ('codigo', 'producto__nombre')
+    readonly_fields = ('fecha_creacion',)
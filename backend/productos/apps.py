@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'productos'
+
+    def ready(self):
+        # Señales que incrementan la versión del catálogo y marcan las estadísticas
+        from . import estadisticas, versiones  # noqa: F401
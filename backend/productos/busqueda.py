@@ -0,0 +1,258 @@
+"""
+Búsqueda de productos por nombre.
+
+Se busca sobre `Producto.nombre_normalizado` (minúsculas, sin acentos ni
+espacios repetidos), así "cafe" encuentra "Café". Cada palabra buscada tiene
+que aparecer en el nombre; las de menos de 3 letras tienen que ser el comienzo
+de una palabra. Los resultados se ordenan por relevancia: primero los nombres
+que empiezan con lo buscado, después los que tienen una palabra que empieza
+así y al final el resto, cada grupo por orden alfabético.
+
+En PostgreSQL la búsqueda usa el índice de trigramas (pg_trgm) del nombre
+normalizado y el índice de prefijos que Django crea para la columna. En otras
+bases (SQLite en desarrollo y tests) el autocompletado usa un índice de
+n-gramas en memoria, que se mantiene al día con las señales de Producto.
+"""
+import bisect
+import heapq
+import threading
+import unicodedata
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+LARGO_NGRAMA = 3
+
+# Ids candidatos que se filtran por consulta en el índice en memoria
+CANDIDATOS_POR_CONSULTA = 200
+
+# Resultados del autocompletado: por defecto y máximo que se puede pedir
+LIMITE_AUTOCOMPLETAR = 10
+LIMITE_AUTOCOMPLETAR_MAXIMO = 50
+
+
+def normalizar_busqueda(texto):
+    """Minúsculas, sin acentos ni espacios repetidos"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def _coincide(nombre, palabras):
+    return all(
+        palabra in nombre if len(palabra) >= LARGO_NGRAMA
+        else nombre.startswith(palabra) or f' {palabra}' in nombre
+        for palabra in palabras
+    )
+
+
+def q_busqueda(texto, campo='nombre_normalizado'):
+    """Condición (Q) de los productos cuyo nombre coincide con el texto buscado"""
+    condicion = Q()
+    for palabra in normalizar_busqueda(texto).split():
+        if len(palabra) >= LARGO_NGRAMA:
+            condicion &= Q(**{f'{campo}__contains': palabra})
+        else:
+            condicion &= Q(**{f'{campo}__startswith': palabra}) | Q(**{f'{campo}__contains': f' {palabra}'})
+    return condicion
+
+
+def filtrar_busqueda(queryset, texto):
+    """Filtra el queryset de productos por el texto buscado (sin ordenar)"""
+    return queryset.filter(q_busqueda(texto))
+
+
+def ordenar_por_relevancia(queryset, texto):
+    """Anota `relevancia` (0 mejor) y ordena los productos como el autocompletado"""
+    consulta = normalizar_busqueda(texto)
+    return queryset.annotate(
+        relevancia=Case(
+            When(nombre_normalizado__startswith=consulta, then=Value(0)),
+            When(nombre_normalizado__contains=f' {consulta}', then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField()
+        )
+    ).order_by('relevancia', 'nombre_normalizado', 'id')
+
+
+class IndiceNgramas:
+    """
+    Índice en memoria de los nombres normalizados de productos. Tiene los nombres
+    ordenados (para los que empiezan con el texto), los finales de nombre desde
+    cada palabra ordenados (para las palabras que empiezan con el texto) y
+    trigramas -> ids para el resto. Así los primeros resultados salen sin
+    recorrer todas las coincidencias.
+
+    Se construye completo la primera vez que se usa y después se actualiza
+    producto por producto desde las señales. Cada proceso tiene el suyo; los
+    cambios masivos que no disparan señales deben llamar a `invalidar()`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nombres = None
+        self._ordenados = []
+        self._palabras = []
+        self._ngramas = {}
+
+    @staticmethod
+    def _finales(nombre):
+        """Final del nombre desde el comienzo de cada palabra (salvo la primera)"""
+        return [nombre[i + 1:] for i, letra in enumerate(nombre) if letra == ' ']
+
+    @staticmethod
+    def _trigramas(texto):
+        return {texto[i:i + LARGO_NGRAMA] for i in range(len(texto) - LARGO_NGRAMA + 1)}
+
+    def _agregar(self, producto_id, nombre):
+        self._nombres[producto_id] = nombre
+        bisect.insort(self._ordenados, (nombre, producto_id))
+        for final in self._finales(nombre):
+            bisect.insort(self._palabras, (final, producto_id))
+        for trigrama in self._trigramas(nombre):
+            self._ngramas.setdefault(trigrama, set()).add(producto_id)
+
+    @staticmethod
+    def _borrar_ordenado(lista, elemento):
+        posicion = bisect.bisect_left(lista, elemento)
+        if posicion < len(lista) and lista[posicion] == elemento:
+            del lista[posicion]
+
+    def _quitar(self, producto_id):
+        nombre = self._nombres.pop(producto_id, None)
+        if nombre is None:
+            return
+        self._borrar_ordenado(self._ordenados, (nombre, producto_id))
+        for final in self._finales(nombre):
+            self._borrar_ordenado(self._palabras, (final, producto_id))
+        for trigrama in self._trigramas(nombre):
+            ids = self._ngramas.get(trigrama)
+            if ids is not None:
+                ids.discard(producto_id)
+                if not ids:
+                    del self._ngramas[trigrama]
+
+    def _cargar(self):
+        from .models import Producto
+
+        filas = list(Producto.objects.values_list('nombre_normalizado', 'id').iterator())
+        self._nombres = {producto_id: nombre for nombre, producto_id in filas}
+        self._ordenados = sorted(filas)
+        self._palabras = sorted(
+            (final, producto_id) for nombre, producto_id in filas for final in self._finales(nombre)
+        )
+        self._ngramas = {}
+        for nombre, producto_id in filas:
+            for trigrama in self._trigramas(nombre):
+                self._ngramas.setdefault(trigrama, set()).add(producto_id)
+
+    def actualizar(self, producto_id, nombre):
+        with self._lock:
+            if self._nombres is not None:
+                self._quitar(producto_id)
+                self._agregar(producto_id, nombre)
+
+    def quitar(self, producto_id):
+        with self._lock:
+            if self._nombres is not None:
+                self._quitar(producto_id)
+
+    def invalidar(self):
+        with self._lock:
+            self._nombres = None
+            self._ordenados, self._palabras, self._ngramas = [], [], {}
+
+    @staticmethod
+    def _con_prefijo(lista, prefijo):
+        """Elementos (texto, id) de la lista ordenada cuyo texto empieza con el prefijo"""
+        posicion = bisect.bisect_left(lista, (prefijo,))
+        while posicion < len(lista) and lista[posicion][0].startswith(prefijo):
+            yield lista[posicion][1]
+            posicion += 1
+
+    def _resto(self, palabras, vistos, cantidad=None):
+        """Coincidencias que no empiezan como lo buscado, por orden alfabético"""
+        claves = [
+            self._trigramas(palabra) if len(palabra) >= LARGO_NGRAMA else set()
+            for palabra in palabras
+        ]
+        candidatos = None
+        for trigrama in set().union(*claves):
+            ids = self._ngramas.get(trigrama, set())
+            candidatos = set(ids) if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+        if candidatos is None:
+            # Solo palabras cortas: candidatos son los que tienen una palabra que empieza con la primera
+            candidatos = {
+                producto_id
+                for lista in (self._ordenados, self._palabras)
+                for producto_id in self._con_prefijo(lista, palabras[0])
+            }
+        coincidencias = (
+            (self._nombres[producto_id], producto_id) for producto_id in candidatos - vistos
+            if _coincide(self._nombres[producto_id], palabras)
+        )
+        return sorted(coincidencias) if cantidad is None else heapq.nsmallest(cantidad, coincidencias)
+
+    def buscar(self, texto, cantidad=None):
+        """
+        Ids de los productos cuyo nombre coincide, ordenados por relevancia.
+        Con `cantidad` devuelve solo los primeros, sin recorrer el resto.
+        """
+        palabras = normalizar_busqueda(texto).split()
+        if not palabras:
+            return []
+        consulta = ' '.join(palabras)
+
+        with self._lock:
+            if self._nombres is None:
+                self._cargar()
+
+            ids, vistos = [], set()
+            for lista in (self._ordenados, self._palabras):
+                for producto_id in self._con_prefijo(lista, consulta):
+                    if cantidad is not None and len(ids) >= cantidad:
+                        return ids
+                    if producto_id not in vistos and _coincide(self._nombres[producto_id], palabras):
+                        vistos.add(producto_id)
+                        ids.append(producto_id)
+
+            faltan = None if cantidad is None else cantidad - len(ids)
+            ids.extend(producto_id for _nombre, producto_id in self._resto(palabras, vistos, faltan))
+
+        return ids
+
+
+indice_nombres = IndiceNgramas()
+
+
+def leer_limite(valor):
+    """Límite pedido por query param, acotado a LIMITE_AUTOCOMPLETAR_MAXIMO"""
+    try:
+        limite = int(valor)
+    except (TypeError, ValueError):
+        return LIMITE_AUTOCOMPLETAR
+    return max(1, min(limite, LIMITE_AUTOCOMPLETAR_MAXIMO))
+
+
+def autocompletar(queryset, texto, limite=LIMITE_AUTOCOMPLETAR):
+    """
+    Hasta `limite` productos del queryset (instancias) cuyo nombre coincide con el
+    texto, ordenados por relevancia.
+    """
+    if connection.vendor == 'postgresql':
+        return list(ordenar_por_relevancia(filtrar_busqueda(queryset, texto), texto)[:limite])
+
+    # Recorrer los candidatos del índice en orden y quedarse con los que pasan
+    # los filtros del queryset (alcance del usuario, activo, stock...)
+    cantidad = CANDIDATOS_POR_CONSULTA
+    while True:
+        ids = indice_nombres.buscar(texto, cantidad)
+        encontrados = queryset.in_bulk(ids)
+        resultado = [encontrados[producto_id] for producto_id in ids if producto_id in encontrados]
+        # Si los filtros descartaron demasiados candidatos, pedir más al índice
+        if len(resultado) >= limite or len(ids) < cantidad:
+            break
+        cantidad *= 4
+    return resultado[:limite]
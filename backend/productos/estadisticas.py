@@ -0,0 +1,159 @@
+"""
+Estadísticas de productos por supermercado.
+
+Los números por categoría (productos del supermercado, productos sin stock y
+stock total en sus depósitos) se guardan en EstadisticaCategoria. Los cambios
+de stock o de productos solo marcan como pendientes las categorías que tocan
+(un UPDATE que incrementa `cambios`, al confirmarse la transacción) y la
+lectura recalcula únicamente esas, con una consulta agrupada por categoría.
+Así el tablero lee una fila por categoría y el recálculo no pasa por las
+ventas.
+
+Un producto es del supermercado si tiene registro de stock en alguno de sus
+depósitos. Las actualizaciones masivas de stock (UPDATE sin señales) tienen
+que llamar a `marcar_estadisticas`; `python manage.py recalcular_estadisticas`
+recalcula todo desde cero.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Categoria, EstadisticaCategoria, Producto, ProductoDeposito
+
+
+def _marcar(supermercado_id, categorias_ids):
+    filas = EstadisticaCategoria.objects.all()
+    if supermercado_id is not None:
+        filas = filas.filter(supermercado_id=supermercado_id)
+    if categorias_ids is not None:
+        filas = filas.filter(categoria_id__in=categorias_ids)
+    filas.update(cambios=F('cambios') + 1)
+
+
+def marcar_estadisticas(supermercado=None, categorias_ids=None):
+    """
+    Marca como desactualizadas, al confirmarse la transacción, las estadísticas
+    de las categorías en el supermercado (sin supermercado: en todos; sin
+    categorías: todas).
+    """
+    supermercado_id = getattr(supermercado, 'pk', supermercado)
+    categorias_ids = None if categorias_ids is None else set(categorias_ids)
+    transaction.on_commit(lambda: _marcar(supermercado_id, categorias_ids))
+
+
+def calcular_estadisticas(supermercado, categorias_ids):
+    """{categoria_id: (productos, sin stock, stock total)} con una consulta agrupada"""
+    stocks = ProductoDeposito.objects.filter(producto=OuterRef('pk'), deposito__supermercado=supermercado)
+    stock_producto = stocks.order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+
+    # Subconsultas en lugar de un join con los stocks: cada producto cuenta una sola vez
+    filas = Producto.objects.filter(
+        Exists(stocks),
+        activo=True,
+        categoria_id__in=categorias_ids
+    ).annotate(
+        stock=Coalesce(Subquery(stock_producto), 0)
+    ).order_by().values('categoria_id').annotate(
+        productos=Count('id'),
+        sin_stock=Count('id', filter=Q(stock=0)),
+        total=Sum('stock')
+    ).values_list('categoria_id', 'productos', 'sin_stock', 'total')
+    return {categoria_id: datos for categoria_id, *datos in filas}
+
+
+def estadisticas_supermercado(supermercado):
+    """
+    Estadísticas por categoría de las categorías visibles para el supermercado
+    (globales y propias). Recalcula y guarda solo las que están pendientes o
+    todavía no tienen fila. Devuelve [(categoria, EstadisticaCategoria)].
+    """
+    categorias = list(
+        Categoria.objects.filter(Q(usuario__isnull=True) | Q(usuario=supermercado)).order_by('nombre', 'id')
+    )
+    guardadas = {
+        fila.categoria_id: fila
+        for fila in EstadisticaCategoria.objects.filter(supermercado=supermercado)
+    }
+
+    pendientes = [
+        categoria.id for categoria in categorias
+        if categoria.id not in guardadas or guardadas[categoria.id].cambios != guardadas[categoria.id].cambios_calculados
+    ]
+    if pendientes:
+        calculadas = calcular_estadisticas(supermercado, pendientes)
+        filas = []
+        for categoria_id in pendientes:
+            productos, sin_stock, total = calculadas.get(categoria_id, (0, 0, 0))
+            anterior = guardadas.get(categoria_id)
+            # Los cambios marcados mientras se calculaba quedan pendientes para la próxima lectura
+            cambios = anterior.cambios if anterior else 0
+            filas.append(EstadisticaCategoria(
+                supermercado=supermercado,
+                categoria_id=categoria_id,
+                productos_count=productos,
+                productos_sin_stock=sin_stock,
+                stock_total=total or 0,
+                cambios=cambios,
+                cambios_calculados=cambios
+            ))
+        EstadisticaCategoria.objects.bulk_create(
+            filas,
+            update_conflicts=True,
+            unique_fields=['supermercado', 'categoria'],
+            update_fields=[
+                'productos_count', 'productos_sin_stock', 'stock_total', 'cambios_calculados', 'fecha_actualizacion'
+            ]
+        )
+        guardadas.update((fila.categoria_id, fila) for fila in filas)
+
+    return [(categoria, guardadas[categoria.id]) for categoria in categorias]
+
+
+def recalcular_estadisticas(supermercado=None):
+    """
+    Recalcula todas las categorías del supermercado (o de todos los que tienen
+    depósitos). Devuelve la cantidad de supermercados recalculados.
+    """
+    from django.contrib.auth import get_user_model
+    from inventario.models import Deposito
+
+    if supermercado is None:
+        supermercados = list(get_user_model().objects.filter(id__in=Deposito.objects.values('supermercado_id')))
+    else:
+        supermercados = [supermercado]
+
+    for cada_uno in supermercados:
+        _marcar(cada_uno.pk, None)
+        estadisticas_supermercado(cada_uno)
+    return len(supermercados)
+
+
+@receiver([post_save, post_delete], sender=ProductoDeposito)
+def marcar_por_stock(sender, instance, **kwargs):
+    try:
+        supermercado_id = instance.deposito.supermercado_id
+        categoria_id = instance.producto.categoria_id
+    except ObjectDoesNotExist:
+        # Se borró junto con su depósito o su producto
+        return
+    marcar_estadisticas(supermercado_id, [categoria_id])
+
+
+@receiver(pre_save, sender=Producto)
+def recordar_categoria_anterior(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and 'categoria' not in update_fields):
+        return
+    # Si cambia de categoría hay que recalcular también la anterior
+    instance._categoria_anterior = Producto.objects.filter(
+        pk=instance.pk
+    ).values_list('categoria_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Producto)
+def marcar_por_producto(sender, instance, **kwargs):
+    # El producto puede estar en cualquier supermercado
+    categorias = {instance.categoria_id, getattr(instance, '_categoria_anterior', None)} - {None}
+    marcar_estadisticas(None, categorias)
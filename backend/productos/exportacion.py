@@ -0,0 +1,204 @@
+"""
+Exportación del catálogo con el stock por depósito (CSV o XLSX).
+
+Una fila por producto del supermercado (con stock registrado en alguno de sus
+depósitos) y una columna de stock por depósito. El pivot se arma en la misma
+consulta (una suma filtrada por depósito, agrupada por producto), que se
+recorre con un cursor del lado del servidor en bloques de FILAS_POR_BLOQUE;
+cada bloque se escribe y se envía antes de leer el siguiente, así la memoria
+no depende del tamaño del catálogo.
+
+En el CSV los textos que empiezan con =, +, - o @ (nombres, categorías,
+depósitos) se escriben precedidos de un apóstrofo para que la planilla no los
+ejecute como fórmulas; en el XLSX las celdas de texto ya no se evalúan.
+
+El XLSX se genera sin dependencias: la hoja se escribe como XML con textos en
+línea dentro de un zip que se va enviando a medida que se comprime.
+"""
+import csv
+import io
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import Q, Sum
+
+from inventario.models import Deposito
+from .models import Producto
+
+# Filas por lectura del cursor y por bloque de la respuesta
+FILAS_POR_BLOQUE = 2000
+
+COLUMNAS = ['id', 'nombre', 'categoria', 'precio', 'activo', 'descripcion']
+
+
+def _depositos(supermercado):
+    return list(Deposito.objects.filter(supermercado=supermercado).order_by('nombre', 'id').values_list('id', 'nombre'))
+
+
+def encabezados(depositos):
+    """Columnas fijas, una por depósito (su nombre) y el total"""
+    return COLUMNAS + [nombre for _id, nombre in depositos] + ['stock_total']
+
+
+def productos_exportacion(supermercado, depositos):
+    """Queryset de tuplas: columnas fijas y la cantidad en cada depósito (None si no tiene registro)"""
+    # El filtro y las sumas usan el mismo join con los stocks del supermercado
+    return Producto.objects.filter(
+        stocks__deposito__supermercado=supermercado
+    ).annotate(**{
+        f'stock_{deposito_id}': Sum('stocks__cantidad', filter=Q(stocks__deposito_id=deposito_id))
+        for deposito_id, _nombre in depositos
+    }).order_by('nombre', 'id').values_list(
+        'id', 'nombre', 'categoria__nombre', 'precio', 'activo', 'descripcion',
+        *(f'stock_{deposito_id}' for deposito_id, _nombre in depositos)
+    )
+
+
+def filas_exportacion(supermercado):
+    """Genera el encabezado y después una lista de valores por producto"""
+    depositos = _depositos(supermercado)
+    yield encabezados(depositos)
+    for valores in productos_exportacion(supermercado, depositos).iterator(chunk_size=FILAS_POR_BLOQUE):
+        stocks = valores[len(COLUMNAS):]
+        yield [*valores, sum(cantidad or 0 for cantidad in stocks)]
+
+
+def _bloques(filas):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+# Un texto que empieza así la planilla lo toma como fórmula al abrir el CSV
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _valor_csv(valor):
+    if isinstance(valor, bool):
+        return 'si' if valor else 'no'
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return f"'{valor}"
+    return valor
+
+
+def generar_csv(filas):
+    """CSV en UTF-8 con BOM (para que las planillas reconozcan los acentos), por bloques"""
+    yield '\ufeff'.encode()
+    texto = io.StringIO()
+    escritor = csv.writer(texto)
+    for bloque in _bloques(filas):
+        escritor.writerows([_valor_csv(valor) for valor in fila] for fila in bloque)
+        yield texto.getvalue().encode()
+        texto.seek(0)
+        texto.truncate()
+
+
+class _SalidaZip:
+    """Destino sin posicionamiento para ZipFile: guarda lo escrito hasta que se envía"""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+XLSX_ARCHIVOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Productos" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+# Caracteres de control que XML no admite
+CONTROL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _celda_xlsx(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(CONTROL_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def generar_xlsx(filas):
+    """Libro XLSX de una hoja, comprimido y enviado por bloques de filas"""
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in XLSX_ARCHIVOS.items():
+            libro.writestr(nombre, contenido)
+        with libro.open('xl/worksheets/sheet1.xml', 'w') as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for bloque in _bloques(filas):
+                hoja.write(''.join(
+                    '<row>' + ''.join(_celda_xlsx(valor) for valor in fila) + '</row>'
+                    for fila in bloque
+                ).encode())
+                yield salida.vaciar()
+            hoja.write(b'</sheetData></worksheet>')
+    yield salida.vaciar()
+
+
+FORMATOS = {
+    'csv': (generar_csv, 'text/csv; charset=utf-8', 'csv'),
+    'xlsx': (generar_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def exportar_productos(supermercado, formato='csv'):
+    """(generador de bytes, content type, extensión) de la exportación en el formato pedido"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportación inválido: '{formato}'. Opciones: {', '.join(FORMATOS)}.")
+    generar, content_type, extension = FORMATOS[formato]
+    return generar(filas_exportacion(supermercado)), content_type, extension
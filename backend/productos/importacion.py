@@ -0,0 +1,420 @@
+"""
+Importación masiva de productos y stock desde CSV o JSON.
+
+El archivo se lee de a poco (CSV fila por fila; JSON como array u objetos
+por línea, decodificado por bloques) y se procesa en lotes de
+LOTE_IMPORTACION filas. Cada lote se valida en memoria, resuelve sus
+categorías y depósitos contra mapas cargados una sola vez y se guarda en su
+propia transacción con pocas consultas: productos nuevos con bulk_create, los
+existentes con un upsert por id y el stock con otro por (producto, depósito).
+Las filas con errores se informan con su número y no frenan la importación.
+
+Columnas: nombre, categoria y precio (obligatorias); descripcion, activo,
+deposito (id o nombre), cantidad y cantidad_minima (opcionales). Un producto
+ya existente (mismo nombre normalizado y categoría) se actualiza si es del
+supermercado (de una categoría propia). Los de categorías globales los
+comparten todos los supermercados: si la fila los cambiaría se informa como
+conflicto y no se aplica; si coincide, solo se guarda su stock.
+
+Como bulk_create no pasa por Producto.save() ni disparan
+señales, acá se calcula el nombre normalizado y al final se invalidan el
+índice de búsqueda, la caché del escaneo, la versión del catálogo y las
+estadísticas. Los cambios de precio se registran en el historial y, si el
+producto tiene ofertas, se encola el recálculo de sus asignaciones. Tampoco
+se generan notificaciones de stock mínimo por fila.
+"""
+import csv
+import io
+import itertools
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from inventario.models import Deposito
+from ofertas.asignaciones import encolar_repreciado
+from .busqueda import indice_nombres, normalizar_busqueda
+from .estadisticas import marcar_estadisticas
+from .models import Categoria, HistorialPrecio, Producto, ProductoDeposito
+from .versiones import incrementar_version
+
+# Filas por lote (transacción y consultas)
+LOTE_IMPORTACION = 2000
+
+# Errores de fila que se devuelven en el resultado (se cuentan todos)
+MAXIMO_ERRORES = 1000
+
+FORMATOS = ('csv', 'json')
+
+VALORES_VERDADEROS = {'1', 'true', 'si', 'sí', 'yes', 'x', 'activo'}
+VALORES_FALSOS = {'0', 'false', 'no', 'inactivo'}
+
+PRECIO_MAXIMO = Decimal('99999999.99')
+
+
+class ResultadoImportacion:
+    """Contadores y errores de fila de una importación"""
+
+    def __init__(self):
+        self.filas = 0
+        self.creados = 0
+        self.actualizados = 0
+        self.stocks = 0
+        self.errores = []
+        self.errores_total = 0
+
+    def agregar_error(self, fila, errores):
+        self.errores_total += 1
+        if len(self.errores) < MAXIMO_ERRORES:
+            self.errores.append({'fila': fila, 'errores': errores})
+
+    def como_dict(self):
+        return {
+            'filas': self.filas,
+            'productos_creados': self.creados,
+            'productos_actualizados': self.actualizados,
+            'stocks_guardados': self.stocks,
+            'filas_con_errores': self.errores_total,
+            'errores': self.errores,
+        }
+
+
+def formato_archivo(nombre, formato=None):
+    """Formato pedido o, si no se indica, el de la extensión del archivo"""
+    formato = (formato or nombre.rsplit('.', 1)[-1]).lower()
+    if formato in ('jsonl', 'ndjson'):
+        formato = 'json'
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: '{formato}'. Use CSV o JSON.")
+    return formato
+
+
+def _filas_csv(texto):
+    encabezado = texto.readline()
+    # Las planillas en español suelen exportar con punto y coma
+    separador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+    lector = csv.DictReader(itertools.chain([encabezado], texto), delimiter=separador)
+    lector.fieldnames = [(columna or '').strip().lower() for columna in lector.fieldnames or []]
+    for numero, fila in enumerate(lector, start=2):
+        yield numero, fila
+
+
+SEPARADORES_JSON = re.compile(r'[\s\[\],]*')
+
+
+def _filas_json(texto, bloque=64 * 1024):
+    """Objetos de un array JSON (o uno por línea) decodificados de a bloques"""
+    decodificador = json.JSONDecoder()
+    buffer, posicion, terminado = '', 0, False
+    numero = 0
+    while True:
+        posicion = SEPARADORES_JSON.match(buffer, posicion).end()
+        if posicion < len(buffer):
+            try:
+                objeto, posicion = decodificador.raw_decode(buffer, posicion)
+            except json.JSONDecodeError:
+                if terminado:
+                    raise ValueError(f'JSON inválido cerca del objeto {numero + 1}.')
+            else:
+                numero += 1
+                yield numero, objeto
+                continue
+        elif terminado:
+            return
+        # Hace falta más texto: descartar lo ya leído y agregar otro bloque
+        leido = texto.read(bloque)
+        terminado = not leido
+        buffer, posicion = buffer[posicion:] + leido, 0
+
+
+def leer_filas(archivo, formato):
+    """Genera (número de fila, datos) del archivo binario sin cargarlo entero"""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        return _filas_csv(texto)
+    return _filas_json(texto)
+
+
+def _texto(valor):
+    return '' if valor is None else str(valor).strip()
+
+
+def _entero(valor, campo, errores):
+    texto = _texto(valor)
+    if not texto:
+        return 0
+    try:
+        numero = int(texto)
+    except ValueError:
+        errores[campo] = 'Debe ser un número entero.'
+        return None
+    if numero < 0:
+        errores[campo] = 'No puede ser negativo.'
+        return None
+    return numero
+
+
+def _precio(valor, errores):
+    texto = _texto(valor)
+    if ',' in texto and '.' not in texto:
+        # Coma decimal (1200,50)
+        texto = texto.replace(',', '.')
+    try:
+        precio = Decimal(texto)
+    except InvalidOperation:
+        errores['precio'] = 'Debe ser un número.' if texto else 'Este campo es obligatorio.'
+        return None
+    if not precio.is_finite() or precio <= 0:
+        errores['precio'] = 'El precio debe ser mayor a 0'
+    elif precio.as_tuple().exponent < -2:
+        errores['precio'] = 'No puede tener más de 2 decimales.'
+    elif precio > PRECIO_MAXIMO:
+        errores['precio'] = 'El precio es demasiado alto.'
+    else:
+        return precio
+    return None
+
+
+class _Referencias:
+    """Categorías y depósitos del supermercado cargados una vez por importación"""
+
+    def __init__(self, supermercado, deposito_defecto=None):
+        self.supermercado = supermercado
+        self.categorias = {}
+        # Ids de las categorías propias: sus productos los puede modificar la importación
+        self.propias = set()
+        # Las propias del supermercado tienen prioridad sobre las globales con el mismo nombre
+        for categoria_id, nombre, usuario_id in Categoria.objects.filter(
+            Q(usuario__isnull=True) | Q(usuario=supermercado)
+        ).order_by('usuario_id', 'id').values_list('id', 'nombre', 'usuario_id'):
+            clave = normalizar_busqueda(nombre)
+            if usuario_id is not None or clave not in self.categorias:
+                self.categorias[clave] = categoria_id
+            if usuario_id is not None:
+                self.propias.add(categoria_id)
+        self.depositos = {}
+        for deposito_id, nombre in Deposito.objects.filter(supermercado=supermercado).values_list('id', 'nombre'):
+            self.depositos[str(deposito_id)] = deposito_id
+            self.depositos.setdefault(normalizar_busqueda(nombre), deposito_id)
+        self.deposito_defecto = None
+        if deposito_defecto not in (None, ''):
+            self.deposito_defecto = self.deposito(deposito_defecto)
+            if self.deposito_defecto is None:
+                raise ValueError(f"El depósito '{deposito_defecto}' no existe o no pertenece al supermercado.")
+
+    def deposito(self, valor):
+        texto = _texto(valor)
+        return self.depositos.get(texto) or self.depositos.get(normalizar_busqueda(texto))
+
+    def crear_categorias(self, nombres):
+        """Crea como categorías propias del supermercado las que todavía no existen"""
+        nuevas = {normalizar_busqueda(nombre): nombre for nombre in nombres}
+        nuevas = {clave: nombre for clave, nombre in nuevas.items() if clave not in self.categorias}
+        if not nuevas:
+            return
+        Categoria.objects.bulk_create(
+            [Categoria(nombre=nombre, usuario=self.supermercado) for nombre in nuevas.values()],
+            ignore_conflicts=True
+        )
+        for categoria_id, nombre in Categoria.objects.filter(
+            usuario=self.supermercado, nombre__in=nuevas.values()
+        ).values_list('id', 'nombre'):
+            self.categorias[normalizar_busqueda(nombre)] = categoria_id
+            self.propias.add(categoria_id)
+
+
+def _validar(numero, fila, referencias, resultado):
+    """Datos limpios de la fila o None (y el error queda en el resultado)"""
+    if not isinstance(fila, dict):
+        resultado.agregar_error(numero, {'fila': 'Debe ser un objeto con los datos del producto.'})
+        return None
+
+    errores = {}
+    nombre = ' '.join(_texto(fila.get('nombre')).split())
+    if not nombre:
+        errores['nombre'] = 'Este campo es obligatorio.'
+    elif len(nombre) > 200:
+        errores['nombre'] = 'No puede tener más de 200 caracteres.'
+
+    categoria = ' '.join(_texto(fila.get('categoria')).split())
+    if not categoria:
+        errores['categoria'] = 'Este campo es obligatorio.'
+    elif len(categoria) > 100:
+        errores['categoria'] = 'No puede tener más de 100 caracteres.'
+
+    datos = {
+        'fila': numero,
+        'nombre': nombre,
+        'categoria': categoria,
+        'precio': _precio(fila.get('precio'), errores),
+        'cantidad': _entero(fila.get('cantidad'), 'cantidad', errores),
+        'cantidad_minima': _entero(fila.get('cantidad_minima'), 'cantidad_minima', errores),
+    }
+    if 'descripcion' in fila:
+        datos['descripcion'] = _texto(fila['descripcion']) or None
+    activo = _texto(fila.get('activo')).lower()
+    if activo in VALORES_VERDADEROS:
+        datos['activo'] = True
+    elif activo in VALORES_FALSOS:
+        datos['activo'] = False
+    elif activo:
+        errores['activo'] = 'Debe ser sí o no.'
+
+    deposito = _texto(fila.get('deposito'))
+    datos['deposito_id'] = referencias.deposito(deposito) if deposito else referencias.deposito_defecto
+    if deposito and datos['deposito_id'] is None:
+        errores['deposito'] = 'No existe o no pertenece al supermercado.'
+
+    if errores:
+        resultado.agregar_error(numero, errores)
+        return None
+    return datos
+
+
+def _cambia(producto, datos):
+    """Si la fila modificaría precio, descripción o estado del producto existente"""
+    return (
+        producto.precio != datos['precio']
+        or ('descripcion' in datos and producto.descripcion != datos['descripcion'])
+        or ('activo' in datos and producto.activo != datos['activo'])
+    )
+
+
+def _guardar_lote(lote, referencias, resultado, categorias_tocadas):
+    referencias.crear_categorias(datos['categoria'] for datos in lote)
+
+    # Filas repetidas del mismo producto o del mismo stock: vale la última
+    productos, stocks, filas = {}, {}, {}
+    for datos in lote:
+        clave = (normalizar_busqueda(datos['nombre']), referencias.categorias[normalizar_busqueda(datos['categoria'])])
+        productos[clave] = {**productos.get(clave, {}), **datos}
+        filas.setdefault(clave, []).append(datos['fila'])
+        if datos['deposito_id'] is not None:
+            stocks[(clave, datos['deposito_id'])] = datos
+
+    existentes = {}
+    # De mayor a menor id: si hay duplicados viejos, queda el más antiguo
+    for producto in Producto.objects.filter(
+        nombre_normalizado__in={nombre for nombre, _categoria in productos},
+        categoria_id__in={categoria for _nombre, categoria in productos}
+    ).order_by('-id'):
+        existentes[(producto.nombre_normalizado, producto.categoria_id)] = producto
+
+    ahora = timezone.now()
+    nuevos, actualizados, precios_cambiados = [], [], []
+    for clave, datos in productos.items():
+        producto = existentes.get(clave)
+        if producto is None:
+            producto = Producto(
+                nombre=datos['nombre'],
+                nombre_normalizado=clave[0],
+                categoria_id=clave[1],
+                descripcion=None,
+                activo=True
+            )
+            nuevos.append(producto)
+        elif clave[1] not in referencias.propias:
+            # Compartido con otros supermercados: no se modifica, solo se guarda su stock
+            if _cambia(producto, datos):
+                for numero in filas[clave]:
+                    resultado.agregar_error(numero, {
+                        'nombre': 'Es un producto compartido de una categoría global: '
+                                  'la importación no puede modificarlo.'
+                    })
+                stocks = {par: stock for par, stock in stocks.items() if par[0] != clave}
+            continue
+        else:
+            actualizados.append(producto)
+            if producto.precio != datos['precio']:
+                precios_cambiados.append(HistorialPrecio(
+                    producto_id=producto.pk,
+                    precio_anterior=producto.precio,
+                    precio_nuevo=datos['precio'],
+                    origen='importacion',
+                    usuario=referencias.supermercado
+                ))
+        producto.precio = datos['precio']
+        producto.fecha_modificacion = ahora
+        if 'descripcion' in datos:
+            producto.descripcion = datos['descripcion']
+        if 'activo' in datos:
+            producto.activo = datos['activo']
+        existentes[clave] = producto
+        categorias_tocadas.add(clave[1])
+
+    Producto.objects.bulk_create(nuevos)
+    # Upsert por id en lugar de bulk_update: el CASE por fila de bulk_update es
+    # mucho más lento de armar y de ejecutar con lotes grandes
+    Producto.objects.bulk_create(
+        actualizados,
+        update_conflicts=True,
+        unique_fields=['id'],
+        update_fields=['precio', 'descripcion', 'activo', 'fecha_modificacion']
+    )
+
+    ProductoDeposito.objects.bulk_create(
+        [
+            ProductoDeposito(
+                producto_id=existentes[clave].pk,
+                deposito_id=deposito_id,
+                cantidad=datos['cantidad'],
+                cantidad_minima=datos['cantidad_minima']
+            )
+            for (clave, deposito_id), datos in stocks.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['producto', 'deposito'],
+        update_fields=['cantidad', 'cantidad_minima', 'fecha_modificacion']
+    )
+
+    HistorialPrecio.objects.bulk_create(precios_cambiados)
+    # Las asignaciones de ofertas guardan el precio: recalcularlas en segundo plano
+    encolar_repreciado(cambio.producto_id for cambio in precios_cambiados)
+
+    resultado.creados += len(nuevos)
+    resultado.actualizados += len(actualizados)
+    resultado.stocks += len(stocks)
+
+
+def importar_productos(filas, supermercado, deposito=None, lote=LOTE_IMPORTACION, progreso=None):
+    """
+    Importa las filas ((número, datos) de leer_filas) para el supermercado.
+    `deposito` (id o nombre) es el de las filas que no indican uno. Llama a
+    `progreso(resultado)` después de cada lote. Devuelve el ResultadoImportacion.
+    """
+    referencias = _Referencias(supermercado, deposito)
+    resultado = ResultadoImportacion()
+    categorias_tocadas = set()
+
+    def guardar(validas):
+        with transaction.atomic():
+            _guardar_lote(validas, referencias, resultado, categorias_tocadas)
+        if progreso:
+            progreso(resultado)
+
+    try:
+        validas = []
+        for numero, fila in filas:
+            resultado.filas += 1
+            datos = _validar(numero, fila, referencias, resultado)
+            if datos is not None:
+                validas.append(datos)
+            if len(validas) >= lote:
+                guardar(validas)
+                validas = []
+        if validas:
+            guardar(validas)
+    finally:
+        # Lo guardado hasta acá no pasó por señales
+        if categorias_tocadas:
+            from ventas.escaneo import invalidar_escaneo
+
+            indice_nombres.invalidar()
+            invalidar_escaneo()
+            incrementar_version()
+            marcar_estadisticas(None, categorias_tocadas)
+
+    return resultado
@@ -0,0 +1,56 @@
+"""
+Comando Django para importar productos y stock desde un archivo CSV o JSON
+(ver productos.importacion para las columnas).
+
+Uso: python manage.py importar_productos archivo.csv --supermercado ID [--deposito ID_O_NOMBRE]
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from productos.importacion import LOTE_IMPORTACION, formato_archivo, importar_productos, leer_filas
+
+
+class Command(BaseCommand):
+    help = 'Importa productos y stock de un supermercado desde un archivo CSV o JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo CSV o JSON')
+        parser.add_argument('--supermercado', type=int, required=True, help='ID del supermercado (admin)')
+        parser.add_argument('--deposito', help='Depósito (id o nombre) de las filas que no indican uno')
+        parser.add_argument('--formato', help='csv o json (por defecto, según la extensión)')
+        parser.add_argument('--lote', type=int, default=LOTE_IMPORTACION, help='Filas por lote')
+
+    def handle(self, *args, **options):
+        supermercado = get_user_model().objects.filter(pk=options['supermercado']).first()
+        if supermercado is None:
+            raise CommandError(f"No existe el supermercado {options['supermercado']}")
+
+        def progreso(resultado):
+            self.stdout.write(
+                f'  • {resultado.filas} filas procesadas '
+                f'({resultado.creados} creados, {resultado.actualizados} actualizados, '
+                f'{resultado.errores_total} con errores)'
+            )
+
+        try:
+            formato = formato_archivo(options['archivo'], options['formato'])
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importar_productos(
+                    leer_filas(archivo, formato),
+                    supermercado,
+                    deposito=options['deposito'],
+                    lote=options['lote'],
+                    progreso=progreso
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in resultado.errores[:20]:
+            self.stdout.write(self.style.WARNING(f"⚠️  Fila {error['fila']}: {error['errores']}"))
+        if resultado.errores_total > 20:
+            self.stdout.write(self.style.WARNING(f'⚠️  ... y {resultado.errores_total - 20} filas más con errores'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Importación terminada: {resultado.filas} filas, {resultado.creados} productos creados, '
+            f'{resultado.actualizados} actualizados y {resultado.stocks} stocks guardados'
+        ))
@@ -0,0 +1,31 @@
+"""
+Comando Django para recalcular desde cero las estadísticas de productos por
+categoría (por ejemplo después de cargar stock con SQL o de una restauración).
+
+Uso: python manage.py recalcular_estadisticas [--supermercado ID]
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from productos.estadisticas import recalcular_estadisticas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las estadísticas de productos por categoría de cada supermercado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--supermercado',
+            type=int,
+            help='ID del supermercado (admin) a recalcular; por defecto, todos'
+        )
+
+    def handle(self, *args, **options):
+        supermercado = None
+        if options['supermercado'] is not None:
+            supermercado = get_user_model().objects.filter(pk=options['supermercado']).first()
+            if supermercado is None:
+                raise CommandError(f"No existe el supermercado {options['supermercado']}")
+
+        cantidad = recalcular_estadisticas(supermercado)
+        self.stdout.write(self.style.SUCCESS(f'✅ Estadísticas recalculadas para {cantidad} supermercados'))
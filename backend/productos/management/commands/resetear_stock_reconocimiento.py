@@ -8,6 +8,8 @@ Uso: python manage.py resetear_stock_reconocimiento
 from django.core.management.base import BaseCommand
 from django.db import transaction, models
 from productos.models import Producto, ProductoDeposito
+from productos.estadisticas import marcar_estadisticas
+from productos.versiones import incrementar_version
 
 
 class Command(BaseCommand):
@@ -73,6 +75,9 @@ class Command(BaseCommand):
             stock_actualizado = ProductoDeposito.objects.filter(
                 producto_id__in=productos_ids
             ).update(cantidad=0)
+            # El UPDATE no dispara señales: invalidar el catálogo y las estadísticas de todos
+            incrementar_version()
+            marcar_estadisticas()
 
             self.stdout.write()
             self.stdout.write(self.style.SUCCESS(f'✅ Stock reseteado exitosamente'))
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:31
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar_busqueda(texto):
+    # Copia de productos.busqueda.normalizar_busqueda al momento de esta
+    # migración: los cambios posteriores de esa función no deben alterarla
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def completar_nombres_normalizados(apps, schema_editor):
+    Producto = apps.get_model('productos', 'Producto')
+    productos = list(Producto.objects.only('id', 'nombre'))
+    for producto in productos:
+        producto.nombre_normalizado = normalizar_busqueda(producto.nombre)
+    Producto.objects.bulk_update(productos, ['nombre_normalizado'], batch_size=1000)
+
+
+def crear_indice_trigramas(apps, schema_editor):
+    # Solo PostgreSQL: índice GIN de trigramas para las búsquedas LIKE '%texto%'
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS producto_nombre_trgm_idx '
+        'ON productos_producto USING gin (nombre_normalizado gin_trgm_ops)'
+    )
+
+
+def borrar_indice_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS producto_nombre_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_alter_producto_precio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='nombre_normalizado',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(completar_nombres_normalizados, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice_trigramas, borrar_indice_trigramas),
+    ]
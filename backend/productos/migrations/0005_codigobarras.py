@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('productos', '0004_producto_nombre_normalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodigoBarras',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=50)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_barras', to='productos.producto')),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_barras', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Código de Barras',
+                'verbose_name_plural': 'Códigos de Barras',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='codigobarras',
+            constraint=models.UniqueConstraint(fields=('supermercado', 'codigo'), name='codigo_barras_unico_por_supermercado'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('productos', '0007_producto_producto_nombre_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('productos_count', models.PositiveIntegerField(default=0)),
+                ('productos_sin_stock', models.PositiveIntegerField(default=0)),
+                ('stock_total', models.PositiveBigIntegerField(default=0)),
+                ('cambios', models.PositiveBigIntegerField(default=0)),
+                ('cambios_calculados', models.PositiveBigIntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='productos.categoria')),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_categorias', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Estadística de Categoría',
+                'verbose_name_plural': 'Estadísticas de Categorías',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='estadisticacategoria',
+            constraint=models.UniqueConstraint(fields=('supermercado', 'categoria'), name='estadistica_unica_por_categoria'),
+        ),
+    ]
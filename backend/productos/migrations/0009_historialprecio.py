@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('productos', '0008_estadisticacategoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precio_anterior', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('precio_nuevo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('origen', models.CharField(choices=[('manual', 'Manual'), ('importacion', 'Importación'), ('masivo', 'Actualización masiva')], default='manual', max_length=12)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_precios', to='productos.producto')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Historial de Precio',
+                'verbose_name_plural': 'Historial de Precios',
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='historial_producto_fecha_idx')],
+            },
+        ),
+    ]
@@ -1,14 +1,18 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from inventario.models import Deposito
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from authentication.models import EmpleadoUser
 from notificaciones.models import Notificacion
 from decimal import Decimal
 
+from .busqueda import indice_nombres, normalizar_busqueda
+
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
@@ -36,6 +40,8 @@ class Producto(models.Model):
     )
     descripcion = models.TextField(blank=True, null=True)
     activo = models.BooleanField(default=True)
+    # Nombre en minúsculas y sin acentos para la búsqueda (ver productos.busqueda)
+    nombre_normalizado = models.CharField(max_length=200, db_index=True, editable=False, default='')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
     
@@ -43,6 +49,10 @@ class Producto(models.Model):
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
         ordering = ['nombre']
+        indexes = [
+            # Orden del listado paginado por cursor
+            models.Index(fields=['nombre', 'id'], name='producto_nombre_id_idx'),
+        ]
         
     def clean(self):
         """Validación personalizada del modelo"""
@@ -50,53 +60,81 @@ class Producto(models.Model):
         if self.precio is not None and self.precio <= 0:
             raise ValidationError({'precio': 'El precio debe ser mayor a 0'})
         
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Precio leído de la base: al guardar se sabe si cambió (historial y ofertas.asignaciones)
+        if 'precio' in field_names:
+            instancia._precio_guardado = instancia.precio
+        return instancia
+        
     def save(self, *args, **kwargs):
         """Override save para ejecutar validaciones"""
         self.full_clean()
+        self.nombre_normalizado = normalizar_busqueda(self.nombre)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nombre' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'nombre_normalizado'}
+        precio_anterior = getattr(self, '_precio_guardado', None)
         super().save(*args, **kwargs)
+        if update_fields is None or 'precio' in update_fields:
+            if precio_anterior is not None and precio_anterior != self.precio:
+                HistorialPrecio.objects.create(producto=self, precio_anterior=precio_anterior, precio_nuevo=self.precio)
+            self._precio_guardado = self.precio
         
     def __str__(self):
         return self.nombre
     
+    def precio_resuelto(self, ahora=None):
+        """Precio efectivo y ofertas vigentes (ver ofertas.precios; para varios productos usar resolver_precios)"""
+        from ofertas.precios import resolver_precios
+
+        return resolver_precios([self], ahora)[self.pk]
+
     def tiene_ofertas_activas(self):
         """Verifica si el producto tiene ofertas activas"""
-        from django.utils import timezone
-        from ofertas.models import ProductoOferta
-        
-        return ProductoOferta.objects.filter(
-            producto=self,
-            oferta__activo=True,
-            oferta__fecha_inicio__lte=timezone.now(),
-            oferta__fecha_fin__gte=timezone.now()
-        ).exists()
+        return self.precio_resuelto().tiene_ofertas_activas
     
     def get_precio_con_descuento(self):
         """Obtiene el precio más bajo con descuentos activos"""
-        from django.utils import timezone
-        from ofertas.models import ProductoOferta
-        
-        ofertas_activas = ProductoOferta.objects.filter(
-            producto=self,
-            oferta__activo=True,
-            oferta__fecha_inicio__lte=timezone.now(),
-            oferta__fecha_fin__gte=timezone.now()
-        ).order_by('precio_con_descuento')
-        
-        if ofertas_activas.exists():
-            return ofertas_activas.first().precio_con_descuento
-        return self.precio
+        from ofertas.intervalos import precios_en
+
+        return precios_en([self])[self.pk]
     
     def get_mejor_oferta(self):
         """Obtiene la mejor oferta activa (mayor descuento)"""
-        from django.utils import timezone
-        from ofertas.models import ProductoOferta
-        
-        return ProductoOferta.objects.filter(
-            producto=self,
-            oferta__activo=True,
-            oferta__fecha_inicio__lte=timezone.now(),
-            oferta__fecha_fin__gte=timezone.now()
-        ).order_by('precio_con_descuento').first()
+        from ofertas.intervalos import intervalos_productos
+
+        intervalo = intervalos_productos([self.pk]).get(self.pk)
+        return intervalo.producto_oferta if intervalo else None
+
+class HistorialPrecio(models.Model):
+    """
+    Cambio de precio de un producto. Lo registran Producto.save(), la
+    importación y la actualización masiva de precios (ver productos.precios).
+    """
+    ORIGENES = [
+        ('manual', 'Manual'),
+        ('importacion', 'Importación'),
+        ('masivo', 'Actualización masiva'),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='historial_precios')
+    precio_anterior = models.DecimalField(max_digits=10, decimal_places=2)
+    precio_nuevo = models.DecimalField(max_digits=10, decimal_places=2)
+    origen = models.CharField(max_length=12, choices=ORIGENES, default='manual')
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Historial de Precio"
+        verbose_name_plural = "Historial de Precios"
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='historial_producto_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.precio_anterior} -> {self.precio_nuevo}"
 
 class ProductoDeposito(models.Model):
     """Modelo para gestionar el stock de productos en diferentes depósitos"""
@@ -122,9 +160,124 @@ class ProductoDeposito(models.Model):
         return self.cantidad <= self.cantidad_minima
 
 
+class CodigoBarras(models.Model):
+    """Código de barras de un producto en un supermercado (un producto puede tener varios)"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='codigos_barras')
+    supermercado = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='codigos_barras')
+    codigo = models.CharField(max_length=50)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Código de Barras"
+        verbose_name_plural = "Códigos de Barras"
+        ordering = ['id']
+        constraints = [
+            # También es el índice del escaneo en caja: (supermercado, código) -> producto
+            models.UniqueConstraint(fields=['supermercado', 'codigo'], name='codigo_barras_unico_por_supermercado'),
+        ]
+    
+    def __str__(self):
+        return f"{self.codigo} - {self.producto.nombre}"
+
+
+class VersionCatalogo(models.Model):
+    """
+    Contador de cambios del catálogo (ver productos.versiones). La fila sin
+    supermercado es la versión global (productos, categorías, ofertas); las
+    demás, la del stock y los depósitos de cada supermercado.
+    """
+    supermercado = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='version_catalogo'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Versión del Catálogo"
+        verbose_name_plural = "Versiones del Catálogo"
+
+    def __str__(self):
+        return f"{self.supermercado_id or 'global'}: {self.version}"
+
+
+class EstadisticaCategoria(models.Model):
+    """
+    Resumen precalculado de los productos de una categoría en un supermercado
+    (ver productos.estadisticas). `cambios` cuenta las modificaciones de stock
+    o productos de la categoría; mientras sea distinto de `cambios_calculados`
+    los números están desactualizados y se recalculan en la próxima lectura.
+    """
+    supermercado = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='estadisticas_categorias')
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='estadisticas')
+    productos_count = models.PositiveIntegerField(default=0)
+    productos_sin_stock = models.PositiveIntegerField(default=0)
+    stock_total = models.PositiveBigIntegerField(default=0)
+    cambios = models.PositiveBigIntegerField(default=0)
+    cambios_calculados = models.PositiveBigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Estadística de Categoría"
+        verbose_name_plural = "Estadísticas de Categorías"
+        constraints = [
+            models.UniqueConstraint(fields=['supermercado', 'categoria'], name='estadistica_unica_por_categoria'),
+        ]
+
+    def __str__(self):
+        return f"{self.supermercado_id} - {self.categoria_id}: {self.stock_total}"
+
+
+def anotar_stock(queryset, supermercado):
+    """
+    Anota en un queryset de productos el stock en los depósitos del supermercado:
+    `stock_total`, `depositos_count` y `stock_nivel` ('sin-stock', 'bajo' o 'normal').
+    Se calculan con subconsultas en la misma consulta del listado, así no dependen
+    de los joins que agreguen los filtros ni cuestan una consulta por producto.
+    """
+    stocks = ProductoDeposito.objects.filter(
+        producto=OuterRef('pk'),
+        deposito__supermercado=supermercado
+    )
+    por_producto = stocks.order_by().values('producto')
+
+    return queryset.annotate(
+        stock_total=Coalesce(Subquery(por_producto.annotate(total=Sum('cantidad')).values('total')), 0),
+        depositos_count=Coalesce(Subquery(por_producto.annotate(total=Count('pk')).values('total')), 0),
+    ).annotate(
+        # Stock bajo: algún depósito con stock por debajo de su mínimo (pero no en cero)
+        stock_nivel=Case(
+            When(stock_total=0, then=Value('sin-stock')),
+            When(Exists(stocks.filter(cantidad__gt=0, cantidad__lt=F('cantidad_minima'))), then=Value('bajo')),
+            default=Value('normal'),
+            output_field=models.CharField()
+        )
+    )
+
+
+@receiver(post_save, sender=Producto)
+def actualizar_indice_busqueda(sender, instance: Producto, **kwargs):
+    """Mantiene al día el índice de búsqueda en memoria (solo se usa fuera de PostgreSQL)"""
+    producto_id, nombre = instance.pk, instance.nombre_normalizado
+    # Al confirmarse: un cambio revertido no debe quedar en el índice
+    transaction.on_commit(lambda: indice_nombres.actualizar(producto_id, nombre))
+
+
+@receiver(post_delete, sender=Producto)
+def quitar_de_indice_busqueda(sender, instance: Producto, **kwargs):
+    producto_id = instance.pk
+    transaction.on_commit(lambda: indice_nombres.quitar(producto_id))
+
+
 @receiver(post_save, sender=ProductoDeposito)
 def notificar_stock_minimo(sender, instance: ProductoDeposito, created, **kwargs):
     """Crea notificaciones cuando el stock del depósito alcanza o baja del mínimo."""
+    crear_notificaciones_stock_minimo(instance)
+
+
+def crear_notificaciones_stock_minimo(instance: ProductoDeposito):
+    """
+    Notifica al admin y a los reponedores del depósito si el stock está en el mínimo.
+    Se usa desde la señal y desde las actualizaciones masivas (que no disparan post_save).
+    """
     try:
         if instance.cantidad <= instance.cantidad_minima:
             # Notificar al admin dueño del depósito
@@ -0,0 +1,294 @@
+"""
+Actualización masiva de precios.
+
+Los productos elegidos (por categoría, por ids o ambos) cambian su precio en
+un porcentaje o en un monto fijo, redondeado a un múltiplo de `redondeo`
+(al más cercano, hacia arriba o hacia abajo). El precio nuevo se calcula en
+la base y se guarda con un solo UPDATE; antes se leen los productos que
+cambian para registrar el historial de precios. También se puede subir un
+CSV con las columnas producto_id y precio: esos precios se guardan por lotes
+de LOTE_PRECIOS con un upsert por id, como en la importación.
+
+Solo se modifican los productos del supermercado (los de sus categorías
+propias, igual que en la importación): los ids de productos ajenos o
+compartidos se informan como errores y no se tocan.
+
+Con `simular` no se guarda nada y se devuelven los mismos contadores con una
+muestra de los cambios.
+
+Ni el UPDATE ni el upsert pasan por Producto.save(): acá se incrementa la
+versión del catálogo, se invalida la caché del escaneo y se encola el
+recálculo de las asignaciones de ofertas de los productos que cambiaron.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import models, transaction
+from django.db.models import ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Ceil, Floor, Round
+from django.utils import timezone
+
+from ofertas.asignaciones import encolar_repreciado
+from .importacion import MAXIMO_ERRORES, PRECIO_MAXIMO, _precio
+from .models import Categoria, HistorialPrecio, Producto
+from .versiones import incrementar_version
+
+TIPOS = ('porcentaje', 'monto', 'archivo')
+
+MODOS_REDONDEO = {'cercano': Round, 'arriba': Ceil, 'abajo': Floor}
+
+REDONDEOS = tuple(Decimal(paso) for paso in ('0.01', '0.05', '0.10', '0.50', '1', '5', '10', '50', '100'))
+
+PRECIO_MINIMO = Decimal('0.01')
+
+# Productos por lote del archivo (transacción y consultas)
+LOTE_PRECIOS = 1000
+
+# Cambios que se devuelven como muestra
+MUESTRA = 20
+
+
+class ResultadoPrecios:
+    """Contadores, muestra de cambios y errores de fila de una actualización de precios"""
+
+    def __init__(self, simulacion):
+        self.simulacion = simulacion
+        self.filas = 0
+        self.productos = 0
+        self.cambios = 0
+        self.muestra = []
+        self.errores = []
+        self.errores_total = 0
+
+    def agregar_cambio(self, producto_id, nombre, precio_anterior, precio_nuevo):
+        self.cambios += 1
+        if len(self.muestra) < MUESTRA:
+            self.muestra.append({
+                'producto_id': producto_id,
+                'nombre': nombre,
+                'precio_anterior': f'{precio_anterior:.2f}',
+                'precio_nuevo': f'{precio_nuevo:.2f}',
+            })
+
+    def agregar_error(self, fila, errores):
+        self.errores_total += 1
+        if len(self.errores) < MAXIMO_ERRORES:
+            self.errores.append({'fila': fila, 'errores': errores})
+
+    def como_dict(self):
+        return {
+            'simulacion': self.simulacion,
+            'filas': self.filas,
+            'productos': self.productos,
+            'productos_cambiados': self.cambios,
+            'muestra': self.muestra,
+            'filas_con_errores': self.errores_total,
+            'errores': self.errores,
+        }
+
+
+def _decimal(valor, campo):
+    texto = '' if valor is None else str(valor).strip()
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    try:
+        numero = Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f'{campo} debe ser un número.')
+    if not numero.is_finite():
+        raise ValueError(f'{campo} debe ser un número.')
+    return numero
+
+
+def precio_calculado(tipo, valor, redondeo=Decimal('0.01'), modo='cercano'):
+    """
+    Expresión del precio nuevo de cada producto: el precio actual más el
+    porcentaje o el monto, redondeado a un múltiplo de `redondeo`
+    """
+    if tipo == 'porcentaje':
+        precio = F('precio') * Value(1 + valor / 100)
+    else:
+        precio = F('precio') + Value(valor)
+    paso = Value(redondeo)
+    # El Round a 6 decimales descarta el error de punto flotante de SQLite
+    # (110.00000000000001) antes de Ceil o Floor
+    pasos = Round(ExpressionWrapper(precio / paso, output_field=models.DecimalField()), 6)
+    return ExpressionWrapper(
+        Round(MODOS_REDONDEO[modo](pasos) * paso, 2),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def productos_editables(supermercado):
+    """Productos cuyo precio puede cambiar el supermercado: los de sus categorías propias"""
+    return Producto.objects.filter(categoria__usuario=supermercado)
+
+
+def productos_a_repreciar(supermercado, categoria_id=None, productos_ids=None):
+    """
+    Productos del supermercado de la categoría propia y/o de la lista de ids.
+    Devuelve el queryset y las posiciones (desde 1) e ids de la lista que no
+    son productos del supermercado.
+    """
+    if not categoria_id and not productos_ids:
+        raise ValueError('Indique una categoría o una lista de productos.')
+    productos = productos_editables(supermercado)
+    rechazados = []
+    if categoria_id:
+        if not Categoria.objects.filter(usuario=supermercado, id=categoria_id).exists():
+            raise ValueError('Categoría no encontrada.')
+        productos = productos.filter(categoria_id=categoria_id)
+    if productos_ids:
+        if not isinstance(productos_ids, list) or not all(
+            isinstance(producto_id, int) and not isinstance(producto_id, bool) for producto_id in productos_ids
+        ):
+            raise ValueError('productos_ids debe ser una lista de ids.')
+        propios = set(productos_editables(supermercado).filter(id__in=productos_ids).values_list('id', flat=True))
+        rechazados = [
+            (posicion, producto_id)
+            for posicion, producto_id in enumerate(productos_ids, start=1)
+            if producto_id not in propios
+        ]
+        productos = productos.filter(id__in=propios)
+    return productos, rechazados
+
+
+def ajustar_precios(productos, supermercado, tipo, valor, redondeo='0.01', modo='cercano', simular=False,
+                    rechazados=()):
+    """
+    Aplica el porcentaje o el monto a los productos del queryset. Falla sin
+    guardar nada si algún precio quedaría fuera de rango. Los `rechazados`
+    ((posición, id) de productos_a_repreciar) quedan como errores. Devuelve
+    el ResultadoPrecios.
+    """
+    if tipo not in ('porcentaje', 'monto'):
+        raise ValueError(f"Tipo no soportado: '{tipo}'. Use {', '.join(TIPOS)}.")
+    valor = _decimal(valor, 'valor')
+    if tipo == 'porcentaje' and valor <= -100:
+        raise ValueError('El porcentaje debe ser mayor a -100.')
+    redondeo = _decimal(redondeo, 'redondeo')
+    if redondeo not in REDONDEOS:
+        raise ValueError(f"Redondeo no soportado. Use {', '.join(str(paso) for paso in REDONDEOS)}.")
+    if modo not in MODOS_REDONDEO:
+        raise ValueError(f"Modo de redondeo no soportado. Use {', '.join(MODOS_REDONDEO)}.")
+
+    nuevo = precio_calculado(tipo, valor, redondeo, modo)
+    resultado = ResultadoPrecios(simular)
+    for posicion, producto_id in rechazados:
+        resultado.agregar_error(posicion, {'producto_id': f'El producto {producto_id} no es del supermercado.'})
+    resultado.productos = productos.count()
+
+    fuera_de_rango = productos.annotate(precio_nuevo=nuevo).filter(
+        Q(precio_nuevo__lt=PRECIO_MINIMO) | Q(precio_nuevo__gt=PRECIO_MAXIMO)
+    ).count()
+    if fuera_de_rango:
+        raise ValueError(
+            f'{fuera_de_rango} productos quedarían con un precio menor a {PRECIO_MINIMO} o mayor a {PRECIO_MAXIMO}.'
+        )
+
+    cambian = productos.exclude(precio=nuevo)
+    cambios = cambian.annotate(precio_nuevo=nuevo).values_list('id', 'nombre', 'precio', 'precio_nuevo')
+    if simular:
+        for producto_id, nombre, anterior, precio in cambios[:MUESTRA]:
+            resultado.agregar_cambio(producto_id, nombre, anterior, precio)
+        resultado.cambios = cambian.count()
+        return resultado
+
+    with transaction.atomic():
+        # Bloqueados: el UPDATE escribe los mismos precios que quedan en el historial
+        historial = []
+        for producto_id, nombre, anterior, precio in cambios.select_for_update():
+            resultado.agregar_cambio(producto_id, nombre, anterior, precio)
+            historial.append(HistorialPrecio(
+                producto_id=producto_id,
+                precio_anterior=anterior,
+                precio_nuevo=precio,
+                origen='masivo',
+                usuario=supermercado
+            ))
+        HistorialPrecio.objects.bulk_create(historial, batch_size=LOTE_PRECIOS)
+        cambian.update(precio=nuevo, fecha_modificacion=timezone.now())
+        if historial:
+            _invalidar_precios(cambio.producto_id for cambio in historial)
+    return resultado
+
+
+def _guardar_archivo(lote, supermercado, resultado, cambiados):
+    ahora = timezone.now()
+    with transaction.atomic():
+        productos = productos_editables(supermercado)
+        if not resultado.simulacion:
+            # La simulación no bloquea las filas que usan las ventas y otras actualizaciones
+            productos = productos.select_for_update()
+        productos = productos.in_bulk(lote.keys())
+        historial, actualizados = [], []
+        for producto_id, (numero, precio) in lote.items():
+            producto = productos.get(producto_id)
+            if producto is None:
+                resultado.agregar_error(numero, {'producto_id': 'Producto no encontrado o no es del supermercado.'})
+                continue
+            resultado.productos += 1
+            if producto.precio == precio:
+                continue
+            resultado.agregar_cambio(producto_id, producto.nombre, producto.precio, precio)
+            historial.append(HistorialPrecio(
+                producto_id=producto_id,
+                precio_anterior=producto.precio,
+                precio_nuevo=precio,
+                origen='masivo',
+                usuario=supermercado
+            ))
+            producto.precio = precio
+            producto.fecha_modificacion = ahora
+            actualizados.append(producto)
+
+        if resultado.simulacion:
+            return
+        HistorialPrecio.objects.bulk_create(historial)
+        # Upsert por id en lugar de bulk_update (ver productos.importacion)
+        Producto.objects.bulk_create(
+            actualizados,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['precio', 'fecha_modificacion']
+        )
+    cambiados.extend(producto.pk for producto in actualizados)
+
+
+def precios_desde_archivo(filas, supermercado, simular=False):
+    """
+    Guarda los precios de las filas ((número, datos) de leer_filas, con
+    producto_id y precio). Las filas con errores se informan con su número y
+    no frenan el resto; si un producto se repite en un lote vale la última
+    fila. Devuelve el ResultadoPrecios.
+    """
+    resultado = ResultadoPrecios(simular)
+    lote, cambiados = {}, []
+    for numero, fila in filas:
+        resultado.filas += 1
+        errores = {}
+        producto_id = str(fila.get('producto_id') or '').strip()
+        if not producto_id.isdigit() or int(producto_id) < 1:
+            errores['producto_id'] = 'Debe ser un id de producto.'
+        precio = _precio(fila.get('precio'), errores)
+        if errores:
+            resultado.agregar_error(numero, errores)
+            continue
+        lote[int(producto_id)] = (numero, precio)
+        if len(lote) >= LOTE_PRECIOS:
+            _guardar_archivo(lote, supermercado, resultado, cambiados)
+            lote = {}
+    if lote:
+        _guardar_archivo(lote, supermercado, resultado, cambiados)
+
+    if cambiados:
+        _invalidar_precios(cambiados)
+    return resultado
+
+
+def _invalidar_precios(productos_ids):
+    from ventas.escaneo import invalidar_escaneo
+
+    incrementar_version()
+    transaction.on_commit(invalidar_escaneo)
+    # Las asignaciones de ofertas guardan el precio: recalcularlas en segundo plano
+    encolar_repreciado(productos_ids)
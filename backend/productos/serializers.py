@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Categoria, Producto, ProductoDeposito
+from .models import Categoria, Producto, ProductoDeposito, CodigoBarras
 from inventario.models import Deposito
 from authentication.models import EmpleadoUser
 
@@ -67,59 +67,20 @@ class ProductoSerializer(serializers.ModelSerializer):
         return sum(stock.cantidad for stock in user_stocks)
 
 class ProductoListSerializer(serializers.ModelSerializer):
-    """Serializer optimizado para listados"""
+    """
+    Serializer optimizado para listados.
+    El stock viene anotado en el queryset (ver productos.models.anotar_stock) y
+    solo cuenta los depósitos del usuario actual.
+    """
     categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True)
-    stock_total = serializers.SerializerMethodField()
-    depositos_count = serializers.SerializerMethodField()
-    stock_nivel = serializers.SerializerMethodField()
+    stock_total = serializers.IntegerField(read_only=True)
+    depositos_count = serializers.IntegerField(read_only=True)
+    stock_nivel = serializers.CharField(read_only=True)
     
     class Meta:
         model = Producto
         fields = ['id', 'nombre', 'categoria_nombre', 'precio', 'activo',
                  'stock_total', 'depositos_count', 'stock_nivel', 'fecha_modificacion']
-    
-    def _get_user_stocks(self, obj):
-        """Obtiene los stocks filtrados por el usuario actual"""
-        request = self.context.get('request')
-        if not request or not hasattr(request, 'user'):
-            return obj.stocks.none()
-        
-        user = request.user
-        
-        # Filtrar stocks solo de depósitos que pertenecen al usuario
-        if hasattr(user, 'supermercado'):
-            # Usuario EmpleadoUser - filtrar por supermercado
-            return obj.stocks.filter(deposito__supermercado=user.supermercado)
-        elif hasattr(user, 'depositos'):
-            # Usuario Admin - filtrar por sus depósitos
-            return obj.stocks.filter(deposito__supermercado=user)
-        else:
-            return obj.stocks.none()
-    
-    def get_stock_total(self, obj):
-        """Calcula el stock total solo de los depósitos del usuario actual"""
-        user_stocks = self._get_user_stocks(obj)
-        return sum(stock.cantidad for stock in user_stocks)
-    
-    def get_depositos_count(self, obj):
-        """Cuenta solo los depósitos del usuario actual que tienen este producto"""
-        user_stocks = self._get_user_stocks(obj)
-        return user_stocks.count()
-    
-    def get_stock_nivel(self, obj):
-        """Determina el nivel de stock general del producto (solo depósitos del usuario)"""
-        user_stocks = self._get_user_stocks(obj)
-        total_stock = sum(stock.cantidad for stock in user_stocks)
-        
-        if total_stock == 0:
-            return 'sin-stock'
-        
-        # Verificar si tiene stock bajo en algún depósito del usuario
-        for stock in user_stocks:
-            if stock.cantidad > 0 and stock.cantidad < stock.cantidad_minima:
-                return 'bajo'
-        
-        return 'normal'
 
 class ProductoCreateUpdateSerializer(serializers.ModelSerializer):
     """Serializer para crear/actualizar productos con stock inicial"""
@@ -228,3 +189,23 @@ class ProductoCreateUpdateSerializer(serializers.ModelSerializer):
                 pass
         
         return instance
+
+
+class CodigoBarrasSerializer(serializers.ModelSerializer):
+    """Códigos de barras de un producto en el supermercado del usuario"""
+    
+    class Meta:
+        model = CodigoBarras
+        fields = ['id', 'producto', 'codigo', 'fecha_creacion']
+        read_only_fields = ['producto', 'fecha_creacion']
+    
+    def validate_codigo(self, value):
+        """El código no puede tener espacios y es único dentro del supermercado"""
+        codigo = value.strip()
+        if not codigo or any(caracter.isspace() for caracter in codigo):
+            raise serializers.ValidationError('El código de barras no puede estar vacío ni tener espacios.')
+        
+        supermercado = self.context['supermercado']
+        if CodigoBarras.objects.filter(supermercado=supermercado, codigo=codigo).exists():
+            raise serializers.ValidationError('Este código de barras ya está asignado a un producto.')
+        return codigo
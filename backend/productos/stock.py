@@ -0,0 +1,137 @@
+"""
+Actualización de stock de muchos productos y depósitos en una operación.
+
+Cada fila es (producto, depósito, cantidad, cantidad mínima). Los permisos se
+verifican por conjunto (una consulta para los productos y otra para los
+depósitos permitidos) y los cambios se aplican con un upsert sobre el par
+único (producto, depósito) y un solo DELETE para las filas que quedan en 0/0,
+igual que en la actualización de un producto: sin cantidad ni mínimo no se
+guarda el registro.
+
+Ni el upsert ni el DELETE disparan señales (las de post_delete cargarían el
+depósito y el producto de cada fila borrada), así que acá se incrementa una
+sola vez la versión del catálogo, se marcan las estadísticas y se notifica el
+stock mínimo.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from inventario.models import Deposito
+from .estadisticas import marcar_estadisticas
+from .models import Producto, ProductoDeposito, crear_notificaciones_stock_minimo
+from .versiones import incrementar_version
+
+# Filas aceptadas por pedido
+MAXIMO_FILAS_STOCK = 1000
+
+
+def _entero(valor, minimo=0):
+    if isinstance(valor, str) and valor.strip().isdigit():
+        valor = int(valor)
+    if not isinstance(valor, int) or isinstance(valor, bool) or valor < minimo:
+        return None
+    return valor
+
+
+def _validar(fila):
+    """(producto_id, deposito_id, cantidad, cantidad_minima) o el mensaje de error"""
+    if not isinstance(fila, dict):
+        return 'Cada fila debe ser un objeto.'
+    producto_id = _entero(fila.get('producto_id'), minimo=1)
+    deposito_id = _entero(fila.get('deposito_id'), minimo=1)
+    if producto_id is None or deposito_id is None:
+        return 'producto_id y deposito_id son obligatorios.'
+    cantidad = _entero(fila.get('cantidad', 0))
+    cantidad_minima = _entero(fila.get('cantidad_minima', 0))
+    if cantidad is None or cantidad_minima is None:
+        return 'cantidad y cantidad_minima deben ser enteros no negativos.'
+    return producto_id, deposito_id, cantidad, cantidad_minima
+
+
+def actualizar_stocks(filas, supermercado, deposito_id=None):
+    """
+    Aplica las filas sobre los depósitos del supermercado (o solo sobre
+    `deposito_id`, el asignado a un reponedor). Devuelve un resultado por fila,
+    en el mismo orden: {'producto_id', 'deposito_id', 'accion'} con accion
+    creado, actualizado, eliminado o sin_cambios, o {'error'} si la fila no se
+    aplicó. Si un par se repite vale la última fila.
+    """
+    validas = [_validar(fila) for fila in filas]
+    datos = [fila for fila in validas if isinstance(fila, tuple)]
+
+    productos = Producto.objects.only('id', 'nombre', 'categoria_id').in_bulk({fila[0] for fila in datos})
+    depositos = Deposito.objects.filter(supermercado=supermercado, id__in={fila[1] for fila in datos})
+    if deposito_id is not None:
+        depositos = depositos.filter(id=deposito_id)
+    depositos = depositos.select_related('supermercado').in_bulk()
+
+    resultados, pares = [], {}
+    for fila in validas:
+        if not isinstance(fila, tuple):
+            resultados.append({'error': fila})
+            continue
+        producto_id, deposito, cantidad, cantidad_minima = fila
+        resultado = {'producto_id': producto_id, 'deposito_id': deposito}
+        if producto_id not in productos:
+            resultado['error'] = 'Producto no encontrado.'
+        elif deposito not in depositos:
+            resultado['error'] = 'Depósito no encontrado o sin permiso.'
+        else:
+            pares[(producto_id, deposito)] = (cantidad, cantidad_minima)
+        resultados.append(resultado)
+
+    existentes = set(ProductoDeposito.objects.filter(
+        producto_id__in={producto_id for producto_id, _deposito in pares},
+        deposito_id__in={deposito for _producto, deposito in pares}
+    ).values_list('producto_id', 'deposito_id')) & pares.keys()
+
+    altas, bajas, acciones = [], [], {}
+    for par, (cantidad, cantidad_minima) in pares.items():
+        if cantidad == 0 and cantidad_minima == 0:
+            if par in existentes:
+                bajas.append(par)
+                acciones[par] = 'eliminado'
+            else:
+                acciones[par] = 'sin_cambios'
+            continue
+        producto_id, deposito = par
+        altas.append(ProductoDeposito(
+            producto=productos[producto_id],
+            deposito=depositos[deposito],
+            cantidad=cantidad,
+            cantidad_minima=cantidad_minima
+        ))
+        acciones[par] = 'actualizado' if par in existentes else 'creado'
+
+    with transaction.atomic():
+        ProductoDeposito.objects.bulk_create(
+            altas,
+            update_conflicts=True,
+            unique_fields=['producto', 'deposito'],
+            update_fields=['cantidad', 'cantidad_minima', 'fecha_modificacion']
+        )
+        if bajas:
+            from ventas.models import ReservaStock
+
+            condicion = Q()
+            for producto_id, deposito in bajas:
+                condicion |= Q(producto_id=producto_id, deposito_id=deposito)
+            eliminados = ProductoDeposito.objects.filter(condicion)
+            # Lo que haría el CASCADE, y después un solo DELETE sin señales por fila
+            ReservaStock.objects.filter(stock__in=eliminados).delete()
+            eliminados._raw_delete(eliminados.db)
+        if altas or bajas:
+            categorias = {stock.producto.categoria_id for stock in altas}
+            categorias.update(productos[producto_id].categoria_id for producto_id, _deposito in bajas)
+            incrementar_version(supermercado)
+            marcar_estadisticas(supermercado, categorias)
+
+    # El upsert no dispara post_save: notificar los stocks que quedaron en el mínimo
+    for stock in altas:
+        if stock.cantidad <= stock.cantidad_minima:
+            crear_notificaciones_stock_minimo(stock)
+
+    for resultado in resultados:
+        if 'error' not in resultado:
+            resultado['accion'] = acciones[(resultado['producto_id'], resultado['deposito_id'])]
+    return resultados
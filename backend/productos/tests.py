@@ -1,9 +1,13 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
 
-from productos.models import Categoria, Producto, ProductoDeposito
+from productos.busqueda import indice_nombres, normalizar_busqueda
+from productos.models import Categoria, CodigoBarras, Producto, ProductoDeposito
 from inventario.models import Deposito
 
 
@@ -175,6 +179,8 @@ class ProductosABMTests(TestCase):
 
 from rest_framework import status
 from decimal import Decimal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 
 class StockVisualizationTestCase(TestCase):
@@ -737,3 +743,891 @@ class StockVisualizationSecurityTestCase(TestCase):
 		response = self.client.get(url_stats)
 		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+
+class ProductoListadoStockTestCase(TestCase):
+	"""Tests para el stock anotado en el listado de productos"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		self.admin = User.objects.create_user(
+			email='admin@listado.com',
+			username='admin_listado',
+			password='StrongPass1!',
+			nombre_supermercado='Super Listado',
+			cuil='20222222222',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		otro_admin = User.objects.create_user(
+			email='otro@listado.com',
+			username='otro_listado',
+			password='StrongPass1!',
+			nombre_supermercado='Otro Super',
+			cuil='20333333333',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		self.client.force_authenticate(user=self.admin)
+		self.categoria = Categoria.objects.create(nombre='Almacén')
+		self.depositos = [
+			Deposito.objects.create(nombre=f'Depósito {i}', direccion='Calle 1', supermercado=self.admin)
+			for i in range(2)
+		]
+		self.deposito_ajeno = Deposito.objects.create(
+			nombre='Depósito Ajeno', direccion='Calle 2', supermercado=otro_admin
+		)
+		self.url = reverse('producto-list-create')
+
+	def crear_productos(self, cantidad):
+		for i in range(cantidad):
+			producto = Producto.objects.create(
+				nombre=f'Producto {i:02d}', categoria=self.categoria, precio=Decimal('10.00')
+			)
+			for deposito in self.depositos:
+				ProductoDeposito.objects.create(
+					producto=producto, deposito=deposito, cantidad=10, cantidad_minima=5
+				)
+			ProductoDeposito.objects.create(producto=producto, deposito=self.deposito_ajeno, cantidad=99)
+
+	def test_stock_solo_de_los_depositos_del_usuario(self):
+		"""stock_total, depositos_count y stock_nivel ignoran los depósitos de otros supermercados"""
+		self.crear_productos(3)
+		bajo, sin_stock = Producto.objects.order_by('nombre')[:2]
+		ProductoDeposito.objects.filter(producto=bajo, deposito=self.depositos[0]).update(cantidad=2)
+		ProductoDeposito.objects.filter(producto=sin_stock, deposito__in=self.depositos).update(cantidad=0)
+
+		response = self.client.get(self.url)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		productos = {p['nombre']: p for p in response.data['results']}
+		self.assertEqual(productos['Producto 00']['stock_total'], 12)
+		self.assertEqual(productos['Producto 00']['stock_nivel'], 'bajo')
+		self.assertEqual(productos['Producto 01']['stock_total'], 0)
+		self.assertEqual(productos['Producto 01']['stock_nivel'], 'sin-stock')
+		self.assertEqual(productos['Producto 02']['stock_total'], 20)
+		self.assertEqual(productos['Producto 02']['depositos_count'], 2)
+		self.assertEqual(productos['Producto 02']['stock_nivel'], 'normal')
+
+	def test_filtro_por_deposito_no_duplica_el_stock(self):
+		"""Filtrar por depósito no altera el stock total anotado"""
+		self.crear_productos(2)
+
+		response = self.client.get(self.url, {'deposito': self.depositos[0].id})
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual([p['stock_total'] for p in response.data['results']], [20, 20])
+
+	def test_cantidad_de_consultas_constante(self):
+		"""Una página de 20 productos cuesta las mismas consultas que una de 2"""
+		self.crear_productos(2)
+		with CaptureQueriesContext(connection) as chica:
+			self.client.get(self.url)
+
+		self.crear_productos(20)
+		with CaptureQueriesContext(connection) as grande:
+			response = self.client.get(self.url)
+
+		self.assertEqual(len(response.data['results']), 20)
+		self.assertEqual(len(chica.captured_queries), len(grande.captured_queries))
+		self.assertLessEqual(len(grande.captured_queries), 3)
+
+	def test_paginacion_por_cursor(self):
+		"""Con ?cursor= se recorre el listado por (nombre, id) sin COUNT ni OFFSET"""
+		self.crear_productos(25)
+		nombres, url, params = [], self.url, {'cursor': '', 'page_size': 10}
+
+		while url:
+			with CaptureQueriesContext(connection) as consultas:
+				response = self.client.get(url, params)
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+			self.assertNotIn('count', response.data)
+			self.assertFalse(any('__count' in q['sql'] for q in consultas.captured_queries))
+			nombres += [p['nombre'] for p in response.data['results']]
+			url, params = response.data['next'], None
+
+		self.assertEqual(nombres, [f'Producto {i:02d}' for i in range(25)])
+
+	def test_paginacion_sin_contar(self):
+		"""Con ?contar=false no se cuenta el total y next indica si hay otra página"""
+		self.crear_productos(21)
+
+		with CaptureQueriesContext(connection) as consultas:
+			response = self.client.get(self.url, {'contar': 'false'})
+		self.assertIsNone(response.data['count'])
+		self.assertEqual(len(response.data['results']), 20)
+		self.assertIn('page=2', response.data['next'])
+		self.assertFalse(any('__count' in q['sql'] for q in consultas.captured_queries))
+
+		response = self.client.get(self.url, {'contar': 'false', 'page': 2})
+		self.assertEqual([p['nombre'] for p in response.data['results']], ['Producto 20'])
+		self.assertIsNone(response.data['next'])
+		self.assertIsNotNone(response.data['previous'])
+
+	def test_listado_sin_cambios_responde_304(self):
+		"""Con el ETag vigente el listado responde 304; un cambio de stock lo invalida"""
+		self.crear_productos(2)
+		etag = self.client.get(self.url)['ETag']
+
+		with CaptureQueriesContext(connection) as consultas:
+			response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+		self.assertEqual(len(consultas.captured_queries), 1)
+		# Otros filtros son otra página: otro ETag
+		self.assertNotEqual(self.client.get(self.url, {'stock': 'bajo'})['ETag'], etag)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			stock = ProductoDeposito.objects.filter(deposito=self.depositos[0]).first()
+			stock.cantidad = 1
+			stock.save()
+		response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertNotEqual(response['ETag'], etag)
+
+
+class ProductoBusquedaTestCase(TestCase):
+	"""Tests para la búsqueda normalizada y el autocompletado de productos"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		self.admin = User.objects.create_user(
+			email='admin@busqueda.com',
+			username='admin_busqueda',
+			password='StrongPass1!',
+			nombre_supermercado='Super Búsqueda',
+			cuil='20444444444',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		self.client.force_authenticate(user=self.admin)
+		self.categoria = Categoria.objects.create(nombre='Almacén')
+		for nombre in ['Café Molido', 'Galletitas de Café', 'Caramelos', 'Descafeinado Suave', 'Té Verde']:
+			Producto.objects.create(nombre=nombre, categoria=self.categoria, precio=Decimal('10.00'))
+		# Cada test arranca con el índice en memoria vacío (los ids se reutilizan entre tests)
+		indice_nombres.invalidar()
+		self.url = reverse('autocompletar-productos')
+
+	def _autocompletar(self, q, **params):
+		response = self.client.get(self.url, {'q': q, **params})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return [p['nombre'] for p in response.data]
+
+	def test_normaliza_acentos_y_mayusculas(self):
+		"""El nombre normalizado se guarda sin acentos y en minúsculas"""
+		producto = Producto.objects.get(nombre='Té Verde')
+		self.assertEqual(producto.nombre_normalizado, 'te verde')
+		self.assertEqual(normalizar_busqueda('  CAFÉ   con  Leche '), 'cafe con leche')
+
+	def test_autocompletado_ordenado_por_relevancia(self):
+		"""Primero los que empiezan con el texto, después comienzo de palabra y al final el resto"""
+		self.assertEqual(
+			self._autocompletar('cafe'),
+			['Café Molido', 'Galletitas de Café', 'Descafeinado Suave']
+		)
+		self.assertEqual(self._autocompletar('ca'), ['Café Molido', 'Caramelos', 'Galletitas de Café'])
+		self.assertEqual(self._autocompletar('caf mol'), ['Café Molido'])
+		self.assertEqual(self._autocompletar('de ga'), ['Galletitas de Café'])
+		self.assertEqual(self._autocompletar('cafe', limite=1), ['Café Molido'])
+
+	def test_indice_sigue_los_cambios_de_productos(self):
+		"""Renombrar, crear o borrar productos se refleja en el autocompletado"""
+		self.assertEqual(self._autocompletar('verde'), ['Té Verde'])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			producto = Producto.objects.get(nombre='Té Verde')
+			producto.nombre = 'Té Rojo'
+			producto.save()
+			Producto.objects.create(nombre='Mate Verde', categoria=self.categoria, precio=Decimal('5.00'))
+			Producto.objects.get(nombre='Caramelos').delete()
+
+		self.assertEqual(self._autocompletar('verde'), ['Mate Verde'])
+		self.assertEqual(self._autocompletar('rojo'), ['Té Rojo'])
+		self.assertEqual(self._autocompletar('cara'), [])
+
+	def test_listado_busca_sin_acentos(self):
+		"""El parámetro search del listado ignora acentos"""
+		response = self.client.get(reverse('producto-list-create'), {'search': 'galletitas cafe'})
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual([p['nombre'] for p in response.data['results']], ['Galletitas de Café'])
+
+
+class CodigoBarrasTestCase(TestCase):
+	"""Tests para los códigos de barras de productos por supermercado"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		datos = {'password': 'StrongPass1!', 'provincia': 'Buenos Aires', 'localidad': 'La Plata'}
+		self.admin = User.objects.create_user(
+			email='admin@codigos.com', username='admin_codigos', nombre_supermercado='Super Códigos',
+			cuil='20666666666', **datos
+		)
+		self.otro_admin = User.objects.create_user(
+			email='otro@codigos.com', username='otro_codigos', nombre_supermercado='Otro Super',
+			cuil='20777777777', **datos
+		)
+		categoria = Categoria.objects.create(nombre='Bebidas')
+		self.agua = Producto.objects.create(nombre='Agua', categoria=categoria, precio=Decimal('100.00'))
+		self.soda = Producto.objects.create(nombre='Soda', categoria=categoria, precio=Decimal('80.00'))
+
+	def _agregar(self, usuario, producto, codigo):
+		self.client.force_authenticate(user=usuario)
+		url = reverse('producto-codigos-barras', kwargs={'producto_id': producto.id})
+		return self.client.post(url, {'codigo': codigo}, format='json')
+
+	def test_varios_codigos_por_producto(self):
+		"""Un producto puede tener varios códigos en el mismo supermercado"""
+		self.assertEqual(self._agregar(self.admin, self.agua, ' 7790001 ').status_code, status.HTTP_201_CREATED)
+		self.assertEqual(self._agregar(self.admin, self.agua, '7790002').status_code, status.HTTP_201_CREATED)
+
+		response = self.client.get(reverse('producto-codigos-barras', kwargs={'producto_id': self.agua.id}))
+		self.assertEqual([c['codigo'] for c in response.data], ['7790001', '7790002'])
+
+	def test_codigo_unico_por_supermercado(self):
+		"""El mismo código no se puede repetir en un supermercado, pero sí en otro"""
+		self._agregar(self.admin, self.agua, '7790001')
+
+		response = self._agregar(self.admin, self.soda, '7790001')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertIn('codigo', response.data)
+		self.assertEqual(self._agregar(self.otro_admin, self.soda, '7790001').status_code, status.HTTP_201_CREATED)
+
+	def test_solo_se_borran_codigos_propios(self):
+		"""Un supermercado no puede borrar los códigos de otro"""
+		self._agregar(self.admin, self.agua, '7790001')
+		codigo = CodigoBarras.objects.get()
+
+		self.client.force_authenticate(user=self.otro_admin)
+		url = reverse('codigo-barras-detail', kwargs={'codigo_id': codigo.id})
+		self.assertEqual(self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND)
+		self.client.force_authenticate(user=self.admin)
+		self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+		self.assertFalse(CodigoBarras.objects.exists())
+
+
+class EstadisticasProductosTestCase(TestCase):
+	"""Tests para las estadísticas precalculadas por categoría"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		self.admin = User.objects.create_user(
+			email='admin@estadisticas.com',
+			username='admin_estadisticas',
+			password='StrongPass1!',
+			nombre_supermercado='Super Estadísticas',
+			cuil='20444444444',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		otro_admin = User.objects.create_user(
+			email='otro@estadisticas.com',
+			username='otro_estadisticas',
+			password='StrongPass1!',
+			nombre_supermercado='Otro Super',
+			cuil='20555555555',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		self.client.force_authenticate(user=self.admin)
+		self.bebidas = Categoria.objects.create(nombre='Bebidas')
+		self.almacen = Categoria.objects.create(nombre='Almacén')
+		self.deposito = Deposito.objects.create(nombre='Central', direccion='Calle 1', supermercado=self.admin)
+		ajeno = Deposito.objects.create(nombre='Ajeno', direccion='Calle 2', supermercado=otro_admin)
+
+		self.agua = Producto.objects.create(nombre='Agua', categoria=self.bebidas, precio=Decimal('10.00'))
+		self.soda = Producto.objects.create(nombre='Soda', categoria=self.bebidas, precio=Decimal('10.00'))
+		self.arroz = Producto.objects.create(nombre='Arroz', categoria=self.almacen, precio=Decimal('10.00'))
+		self.stock_agua = ProductoDeposito.objects.create(producto=self.agua, deposito=self.deposito, cantidad=30)
+		ProductoDeposito.objects.create(producto=self.soda, deposito=self.deposito, cantidad=0)
+		# Solo en el depósito de otro supermercado: no cuenta
+		ProductoDeposito.objects.create(producto=self.arroz, deposito=ajeno, cantidad=99)
+		self.url = reverse('estadisticas-productos')
+
+	def _por_categoria(self):
+		response = self.client.get(self.url)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return response.data, {c['categoria']: c for c in response.data['stock_por_categoria']}
+
+	def test_estadisticas_del_supermercado(self):
+		"""Solo cuentan los productos con stock registrado en los depósitos del usuario"""
+		datos, categorias = self._por_categoria()
+
+		self.assertEqual(datos['total_productos'], 2)
+		self.assertEqual(datos['productos_sin_stock'], 1)
+		self.assertEqual(categorias['Bebidas']['stock_total'], 30)
+		self.assertEqual(categorias['Bebidas']['productos_count'], 2)
+		self.assertEqual(categorias['Almacén']['stock_total'], 0)
+		self.assertEqual(categorias['Almacén']['productos_count'], 0)
+
+	def test_lectura_sin_cambios_no_recalcula(self):
+		"""Sin cambios se leen las filas guardadas: consultas fijas, sin importar las categorías"""
+		self.client.get(self.url)
+		for i in range(10):
+			Categoria.objects.create(nombre=f'Extra {i}')
+		self.client.get(self.url)
+
+		with CaptureQueriesContext(connection) as consultas:
+			self.client.get(self.url)
+		self.assertEqual(len(consultas.captured_queries), 2)
+
+	def test_cambio_de_stock_recalcula_solo_su_categoria(self):
+		"""Un cambio de stock marca su categoría y la próxima lectura la recalcula"""
+		self.client.get(self.url)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.stock_agua.cantidad = 0
+			self.stock_agua.save()
+			ProductoDeposito.objects.create(producto=self.arroz, deposito=self.deposito, cantidad=5)
+
+		datos, categorias = self._por_categoria()
+
+		self.assertEqual(datos['productos_sin_stock'], 2)
+		self.assertEqual(categorias['Bebidas']['stock_total'], 0)
+		self.assertEqual(categorias['Almacén']['stock_total'], 5)
+
+	def test_cambio_de_categoria_mueve_el_producto(self):
+		"""Cambiar la categoría de un producto recalcula la anterior y la nueva"""
+		self.client.get(self.url)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.agua.categoria = self.almacen
+			self.agua.save()
+
+		_datos, categorias = self._por_categoria()
+
+		self.assertEqual(categorias['Bebidas']['productos_count'], 1)
+		self.assertEqual(categorias['Almacén']['productos_count'], 1)
+		self.assertEqual(categorias['Almacén']['stock_total'], 30)
+
+	def test_comando_recalcular_estadisticas(self):
+		"""El comando recalcula aunque el stock se haya cambiado sin señales"""
+		self.client.get(self.url)
+		ProductoDeposito.objects.filter(pk=self.stock_agua.pk).update(cantidad=7)
+
+		call_command('recalcular_estadisticas', stdout=StringIO())
+
+		_datos, categorias = self._por_categoria()
+		self.assertEqual(categorias['Bebidas']['stock_total'], 7)
+
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+import io
+import json
+import os
+import tempfile
+
+
+class ImportacionProductosTestCase(TestCase):
+	"""Tests para la importación masiva de productos y stock"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		self.admin = User.objects.create_user(
+			email='admin@importacion.com',
+			username='admin_importacion',
+			password='StrongPass1!',
+			nombre_supermercado='Super Importación',
+			cuil='20666666666',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		self.client.force_authenticate(user=self.admin)
+		self.bebidas = Categoria.objects.create(nombre='Bebidas', usuario=self.admin)
+		self.central = Deposito.objects.create(nombre='Central', direccion='Calle 1', supermercado=self.admin)
+		self.norte = Deposito.objects.create(nombre='Norte', direccion='Calle 2', supermercado=self.admin)
+		self.url = reverse('productos-importar')
+
+	def _importar(self, contenido, nombre='productos.csv', **datos):
+		archivo = SimpleUploadedFile(nombre, contenido.encode('utf-8'))
+		return self.client.post(self.url, {'archivo': archivo, **datos}, format='multipart')
+
+	def test_importar_csv(self):
+		"""Crea productos, categorías faltantes y stock; las filas inválidas se informan"""
+		contenido = (
+			'nombre;categoria;precio;deposito;cantidad;cantidad_minima\n'
+			'Agua Mineral;bebidas;1200,50;Central;10;2\n'
+			'Yerba;Almacén;900;Norte;5;\n'
+			'Sin precio;Bebidas;;Central;1;\n'
+			'Fideos;Almacén;-3;Central;1;\n'
+			'Galletitas;Almacén;100;Inexistente;1;\n'
+		)
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self._importar(contenido)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['filas'], 5)
+		self.assertEqual(response.data['productos_creados'], 2)
+		self.assertEqual(response.data['stocks_guardados'], 2)
+		self.assertEqual(response.data['filas_con_errores'], 3)
+		self.assertEqual([e['fila'] for e in response.data['errores']], [4, 5, 6])
+		self.assertIn('precio', response.data['errores'][0]['errores'])
+		self.assertIn('deposito', response.data['errores'][2]['errores'])
+
+		agua = Producto.objects.get(nombre='Agua Mineral')
+		self.assertEqual(agua.categoria, self.bebidas)
+		self.assertEqual(agua.precio, Decimal('1200.50'))
+		self.assertEqual(agua.nombre_normalizado, normalizar_busqueda('Agua Mineral'))
+		stock = ProductoDeposito.objects.get(producto=agua)
+		self.assertEqual((stock.deposito, stock.cantidad, stock.cantidad_minima), (self.central, 10, 2))
+
+		almacen = Categoria.objects.get(nombre='Almacén')
+		self.assertEqual(almacen.usuario, self.admin)
+		self.assertTrue(ProductoDeposito.objects.filter(producto__nombre='Yerba', deposito=self.norte, cantidad=5).exists())
+
+	def test_importar_json_con_deposito_por_defecto(self):
+		"""Un array JSON se importa y las filas sin depósito van al indicado"""
+		filas = [
+			{'nombre': 'Soda', 'categoria': 'Bebidas', 'precio': '350.00', 'cantidad': 4},
+			{'nombre': 'Jugo', 'categoria': 'Bebidas', 'precio': 500, 'cantidad': 8, 'deposito': self.norte.id},
+		]
+		response = self._importar(json.dumps(filas), nombre='productos.json', deposito=str(self.central.id))
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['productos_creados'], 2)
+		self.assertTrue(ProductoDeposito.objects.filter(producto__nombre='Soda', deposito=self.central, cantidad=4).exists())
+		self.assertTrue(ProductoDeposito.objects.filter(producto__nombre='Jugo', deposito=self.norte, cantidad=8).exists())
+
+	def test_reimportar_actualiza_precio_y_stock(self):
+		"""Un producto existente (mismo nombre y categoría) se actualiza en lugar de duplicarse"""
+		agua = Producto.objects.create(nombre='Agua', categoria=self.bebidas, precio=Decimal('100.00'))
+		ProductoDeposito.objects.create(producto=agua, deposito=self.central, cantidad=3, cantidad_minima=1)
+
+		response = self._importar('nombre,categoria,precio,deposito,cantidad,cantidad_minima\nagua,Bebidas,150,Central,20,4\n')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['productos_creados'], 0)
+		self.assertEqual(response.data['productos_actualizados'], 1)
+		self.assertEqual(Producto.objects.filter(categoria=self.bebidas).count(), 1)
+		agua.refresh_from_db()
+		self.assertEqual(agua.precio, Decimal('150.00'))
+		stock = ProductoDeposito.objects.get(producto=agua, deposito=self.central)
+		self.assertEqual((stock.cantidad, stock.cantidad_minima), (20, 4))
+
+	def test_producto_compartido_no_se_modifica(self):
+		"""Los productos de categorías globales se informan como conflicto si la fila los cambiaría"""
+		limpieza = Categoria.objects.create(nombre='Limpieza')
+		lavandina = Producto.objects.create(nombre='Lavandina', categoria=limpieza, precio=Decimal('50.00'))
+		detergente = Producto.objects.create(nombre='Detergente', categoria=limpieza, precio=Decimal('80.00'))
+
+		response = self._importar(
+			'nombre,categoria,precio,deposito,cantidad\n'
+			'Lavandina,Limpieza,999,Central,5\n'
+			'Detergente,Limpieza,80,Central,7\n'
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['productos_actualizados'], 0)
+		self.assertEqual([e['fila'] for e in response.data['errores']], [2])
+		lavandina.refresh_from_db()
+		self.assertEqual(lavandina.precio, Decimal('50.00'))
+		self.assertFalse(ProductoDeposito.objects.filter(producto=lavandina).exists())
+		# Sin cambios en el producto compartido, su stock en el depósito propio sí se guarda
+		self.assertTrue(ProductoDeposito.objects.filter(producto=detergente, deposito=self.central, cantidad=7).exists())
+
+	def test_formato_no_soportado(self):
+		"""Un archivo que no es CSV ni JSON se rechaza"""
+		response = self._importar('x', nombre='productos.xlsx')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertIn('error', response.data)
+
+	def test_comando_importar_productos(self):
+		"""El comando importa el archivo por lotes y muestra el progreso"""
+		with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as archivo:
+			archivo.write('nombre,categoria,precio,cantidad\n')
+			for i in range(5):
+				archivo.write(f'Producto {i},Bebidas,{10 + i},{i}\n')
+		self.addCleanup(os.remove, archivo.name)
+
+		salida = StringIO()
+		call_command(
+			'importar_productos', archivo.name,
+			supermercado=self.admin.id, deposito='Central', lote=2, stdout=salida
+		)
+
+		self.assertEqual(ProductoDeposito.objects.filter(deposito=self.central).count(), 5)
+		self.assertEqual(salida.getvalue().count('filas procesadas'), 3)
+		self.assertIn('5 productos creados', salida.getvalue())
+
+
+import csv
+import zipfile
+from xml.etree import ElementTree
+
+
+class ExportacionProductosTestCase(TestCase):
+	"""Tests para la exportación del catálogo con stock por depósito"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		self.admin = User.objects.create_user(
+			email='admin@exportacion.com',
+			username='admin_exportacion',
+			password='StrongPass1!',
+			nombre_supermercado='Super Exportación',
+			cuil='20777777777',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		otro_admin = User.objects.create_user(
+			email='otro@exportacion.com',
+			username='otro_exportacion',
+			password='StrongPass1!',
+			nombre_supermercado='Otro Super',
+			cuil='20888888888',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		self.client.force_authenticate(user=self.admin)
+		bebidas = Categoria.objects.create(nombre='Bebidas')
+		central = Deposito.objects.create(nombre='Central', direccion='Calle 1', supermercado=self.admin)
+		norte = Deposito.objects.create(nombre='Norte', direccion='Calle 2', supermercado=self.admin)
+		ajeno = Deposito.objects.create(nombre='Ajeno', direccion='Calle 3', supermercado=otro_admin)
+
+		agua = Producto.objects.create(nombre='Agua', categoria=bebidas, precio=Decimal('10.50'))
+		soda = Producto.objects.create(nombre='Soda "Clásica"', categoria=bebidas, precio=Decimal('20.00'))
+		jugo = Producto.objects.create(nombre='Jugo', categoria=bebidas, precio=Decimal('30.00'))
+		ProductoDeposito.objects.create(producto=agua, deposito=central, cantidad=5)
+		ProductoDeposito.objects.create(producto=agua, deposito=norte, cantidad=7)
+		ProductoDeposito.objects.create(producto=agua, deposito=ajeno, cantidad=100)
+		ProductoDeposito.objects.create(producto=soda, deposito=norte, cantidad=0)
+		# Solo en el depósito de otro supermercado: no se exporta
+		ProductoDeposito.objects.create(producto=jugo, deposito=ajeno, cantidad=3)
+		self.url = reverse('productos-exportar')
+
+	def test_exportar_csv_con_stock_por_deposito(self):
+		"""Una fila por producto y una columna por depósito del supermercado"""
+		response = self.client.get(self.url)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertTrue(response.streaming)
+		self.assertIn('attachment;', response['Content-Disposition'])
+		texto = b''.join(response.streaming_content).decode('utf-8-sig')
+		filas = list(csv.reader(io.StringIO(texto)))
+
+		self.assertEqual(filas[0], ['id', 'nombre', 'categoria', 'precio', 'activo', 'descripcion', 'Central', 'Norte', 'stock_total'])
+		self.assertEqual(len(filas), 3)
+		self.assertEqual(filas[1][1:], ['Agua', 'Bebidas', '10.50', 'si', '', '5', '7', '12'])
+		self.assertEqual(filas[2][1:], ['Soda "Clásica"', 'Bebidas', '20.00', 'si', '', '', '0', '0'])
+
+	def test_exportar_csv_no_deja_formulas(self):
+		"""Los textos que una planilla tomaría como fórmula se escriben con un apóstrofo adelante"""
+		producto = Producto.objects.create(
+			nombre='=HYPERLINK("http://x","y")', categoria=Categoria.objects.create(nombre='@Limpieza'),
+			precio=Decimal('5.00'), descripcion='-2+3'
+		)
+		ProductoDeposito.objects.create(producto=producto, deposito=Deposito.objects.get(nombre='Central'), cantidad=1)
+
+		texto = b''.join(self.client.get(self.url).streaming_content).decode('utf-8-sig')
+		fila = next(fila for fila in csv.reader(io.StringIO(texto)) if fila[0] == str(producto.id))
+
+		self.assertEqual(fila[1:3], ['\'=HYPERLINK("http://x","y")', "'@Limpieza"])
+		self.assertEqual(fila[5], "'-2+3")
+
+	def test_exportar_xlsx(self):
+		"""El XLSX es un zip válido con la misma hoja"""
+		response = self.client.get(self.url, {'formato': 'xlsx'})
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		libro = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+		self.assertIn('xl/workbook.xml', libro.namelist())
+		hoja = ElementTree.fromstring(libro.read('xl/worksheets/sheet1.xml'))
+		espacio = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+		filas = [
+			[''.join(celda.itertext()) for celda in fila]
+			for fila in hoja.iter(f'{espacio}row')
+		]
+		self.assertEqual(len(filas), 3)
+		self.assertEqual(filas[1][1:], ['Agua', 'Bebidas', '10.50', '1', '', '5', '7', '12'])
+
+	def test_exportar_consultas_fijas(self):
+		"""Depósitos y productos se leen con dos consultas, sin importar la cantidad de productos"""
+		with CaptureQueriesContext(connection) as consultas:
+			b''.join(self.client.get(self.url).streaming_content)
+		self.assertEqual(len(consultas.captured_queries), 2)
+
+	def test_formato_invalido(self):
+		response = self.client.get(self.url, {'formato': 'parquet'})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+from authentication.models import EmpleadoUser
+from empleados.models import Empleado
+from productos.versiones import version_catalogo
+
+
+class StockLoteTestCase(TestCase):
+	"""Tests para la actualización de stock por lote"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		self.admin = User.objects.create_user(
+			email='admin@lote.com',
+			username='admin_lote',
+			password='StrongPass1!',
+			nombre_supermercado='Super Lote',
+			cuil='20999999999',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		otro_admin = User.objects.create_user(
+			email='otro@lote.com',
+			username='otro_lote',
+			password='StrongPass1!',
+			nombre_supermercado='Otro Super',
+			cuil='20101010101',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		self.client.force_authenticate(user=self.admin)
+		categoria = Categoria.objects.create(nombre='Lote')
+		self.central = Deposito.objects.create(nombre='Central', direccion='Calle 1', supermercado=self.admin)
+		self.norte = Deposito.objects.create(nombre='Norte', direccion='Calle 2', supermercado=self.admin)
+		self.ajeno = Deposito.objects.create(nombre='Ajeno', direccion='Calle 3', supermercado=otro_admin)
+		self.productos = [
+			Producto.objects.create(nombre=f'Producto {i}', categoria=categoria, precio=Decimal('10.00'))
+			for i in range(3)
+		]
+		self.existente = ProductoDeposito.objects.create(
+			producto=self.productos[0], deposito=self.central, cantidad=5, cantidad_minima=1
+		)
+		ProductoDeposito.objects.create(producto=self.productos[1], deposito=self.central, cantidad=8)
+		self.url = reverse('stock-lote')
+
+	def test_lote_crea_actualiza_y_elimina(self):
+		"""Cada fila informa su acción; las inválidas o ajenas no se aplican"""
+		p0, p1, p2 = self.productos
+		response = self.client.post(self.url, {'stocks': [
+			{'producto_id': p0.id, 'deposito_id': self.central.id, 'cantidad': 20, 'cantidad_minima': 3},
+			{'producto_id': p1.id, 'deposito_id': self.central.id, 'cantidad': 0, 'cantidad_minima': 0},
+			{'producto_id': p2.id, 'deposito_id': self.norte.id, 'cantidad': 7},
+			{'producto_id': p2.id, 'deposito_id': self.central.id, 'cantidad': 0},
+			{'producto_id': p2.id, 'deposito_id': self.ajeno.id, 'cantidad': 1},
+			{'producto_id': 999999, 'deposito_id': self.central.id, 'cantidad': 1},
+			{'producto_id': p2.id, 'deposito_id': self.central.id, 'cantidad': -1},
+		]}, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['actualizados'], 4)
+		acciones = [resultado.get('accion') for resultado in response.data['resultados']]
+		self.assertEqual(acciones, ['actualizado', 'eliminado', 'creado', 'sin_cambios', None, None, None])
+		self.assertIn('error', response.data['resultados'][4])
+
+		self.existente.refresh_from_db()
+		self.assertEqual((self.existente.cantidad, self.existente.cantidad_minima), (20, 3))
+		self.assertFalse(ProductoDeposito.objects.filter(producto=p1, deposito=self.central).exists())
+		self.assertTrue(ProductoDeposito.objects.filter(producto=p2, deposito=self.norte, cantidad=7).exists())
+		self.assertFalse(ProductoDeposito.objects.filter(deposito=self.ajeno).exists())
+
+	def test_lote_consultas_fijas(self):
+		"""La cantidad de consultas no depende de la cantidad de filas"""
+		def consultas(cantidad):
+			stocks = [
+				{'producto_id': producto.id, 'deposito_id': deposito.id, 'cantidad': cantidad}
+				for producto in self.productos for deposito in (self.central, self.norte)
+			]
+			with CaptureQueriesContext(connection) as capturadas:
+				response = self.client.post(self.url, {'stocks': stocks[:cantidad]}, format='json')
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+			return len(capturadas.captured_queries)
+
+		self.assertEqual(consultas(2), consultas(6))
+
+	def test_lote_bajas_consultas_fijas(self):
+		"""Las bajas tampoco hacen consultas por fila, ni al confirmar la transacción"""
+		for producto in self.productos:
+			for deposito in (self.central, self.norte):
+				ProductoDeposito.objects.update_or_create(
+					producto=producto, deposito=deposito, defaults={'cantidad': 3}
+				)
+
+		def consultas(filas):
+			with CaptureQueriesContext(connection) as capturadas:
+				with self.captureOnCommitCallbacks(execute=True):
+					response = self.client.post(self.url, {'stocks': filas}, format='json')
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+			return len(capturadas.captured_queries)
+
+		bajas = [
+			{'producto_id': producto.id, 'deposito_id': deposito.id, 'cantidad': 0}
+			for producto in self.productos for deposito in (self.central, self.norte)
+		]
+		# La primera baja crea la fila de la versión del supermercado
+		consultas(bajas[:1])
+		version = version_catalogo(self.admin)
+		self.assertEqual(consultas(bajas[1:2]), consultas(bajas[2:]))
+		self.assertFalse(ProductoDeposito.objects.filter(producto__in=self.productos).exists())
+		self.assertNotEqual(version_catalogo(self.admin), version)
+
+	def test_reponedor_solo_su_deposito(self):
+		"""Un reponedor solo puede actualizar el depósito que tiene asignado"""
+		Empleado.objects.create(
+			nombre='Ana', apellido='Gómez', email='ana@lote.com', dni='30111222',
+			puesto='REPONEDOR', deposito=self.norte, supermercado=self.admin
+		)
+		self.client.force_authenticate(user=EmpleadoUser.objects.get(email='ana@lote.com'))
+
+		response = self.client.post(self.url, {'stocks': [
+			{'producto_id': self.productos[0].id, 'deposito_id': self.norte.id, 'cantidad': 4},
+			{'producto_id': self.productos[0].id, 'deposito_id': self.central.id, 'cantidad': 4},
+		]}, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['resultados'][0]['accion'], 'creado')
+		self.assertIn('error', response.data['resultados'][1])
+		self.existente.refresh_from_db()
+		self.assertEqual(self.existente.cantidad, 5)
+
+	def test_lote_invalido(self):
+		response = self.client.post(self.url, {'stocks': []}, format='json')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+from unittest.mock import patch
+
+from django.db.models import QuerySet
+from productos.models import HistorialPrecio
+
+
+class PreciosLoteTestCase(TestCase):
+	"""Tests para la actualización masiva de precios"""
+
+	def setUp(self):
+		self.client = APIClient()
+		User = get_user_model()
+		self.admin = User.objects.create_user(
+			email='admin@precios.com',
+			username='admin_precios',
+			password='StrongPass1!',
+			nombre_supermercado='Super Precios',
+			cuil='20121212121',
+			provincia='Buenos Aires',
+			localidad='La Plata',
+		)
+		self.client.force_authenticate(user=self.admin)
+		self.lacteos = Categoria.objects.create(nombre='Lácteos', usuario=self.admin)
+		otra = Categoria.objects.create(nombre='Limpieza', usuario=self.admin)
+		self.leche = Producto.objects.create(nombre='Leche', categoria=self.lacteos, precio=Decimal('100.00'))
+		self.yogur = Producto.objects.create(nombre='Yogur', categoria=self.lacteos, precio=Decimal('333.33'))
+		self.lavandina = Producto.objects.create(nombre='Lavandina', categoria=otra, precio=Decimal('50.00'))
+		self.compartido = Producto.objects.create(
+			nombre='Azúcar', categoria=Categoria.objects.create(nombre='Almacén'), precio=Decimal('80.00')
+		)
+		self.url = reverse('precios-lote')
+
+	def test_porcentaje_por_categoria_con_redondeo(self):
+		"""Aplica el porcentaje a la categoría, redondea y registra el historial"""
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(self.url, {
+				'tipo': 'porcentaje', 'valor': '10', 'categoria_id': self.lacteos.id,
+				'redondeo': '10', 'modo_redondeo': 'arriba'
+			}, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual((response.data['productos'], response.data['productos_cambiados']), (2, 2))
+		self.leche.refresh_from_db()
+		self.yogur.refresh_from_db()
+		self.lavandina.refresh_from_db()
+		# 110 ya es múltiplo de 10 (sin el error de punto flotante no sube a 120)
+		self.assertEqual(self.leche.precio, Decimal('110.00'))
+		self.assertEqual(self.yogur.precio, Decimal('370.00'))
+		self.assertEqual(self.lavandina.precio, Decimal('50.00'))
+
+		historial = HistorialPrecio.objects.get(producto=self.yogur)
+		self.assertEqual((historial.precio_anterior, historial.precio_nuevo), (Decimal('333.33'), Decimal('370.00')))
+		self.assertEqual((historial.origen, historial.usuario), ('masivo', self.admin))
+
+	def test_simular_no_guarda_y_rechaza_precios_invalidos(self):
+		"""La simulación devuelve la muestra sin guardar; un precio inválido rechaza todo"""
+		response = self.client.post(self.url, {
+			'tipo': 'monto', 'valor': '-0,5', 'productos_ids': [self.leche.id, self.lavandina.id], 'simular': True
+		}, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertTrue(response.data['simulacion'])
+		self.assertEqual(response.data['productos_cambiados'], 2)
+		self.assertEqual(
+			{(m['nombre'], m['precio_nuevo']) for m in response.data['muestra']},
+			{('Leche', '99.50'), ('Lavandina', '49.50')}
+		)
+		self.leche.refresh_from_db()
+		self.assertEqual(self.leche.precio, Decimal('100.00'))
+		self.assertFalse(HistorialPrecio.objects.exists())
+
+		response = self.client.post(self.url, {
+			'tipo': 'monto', 'valor': '-150', 'categoria_id': self.lacteos.id
+		}, format='json')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.yogur.refresh_from_db()
+		self.assertEqual(self.yogur.precio, Decimal('333.33'))
+
+	def test_simular_archivo_no_bloquea_filas(self):
+		"""La simulación con archivo no toma bloqueos sobre los productos"""
+		archivo = SimpleUploadedFile('precios.csv', f'producto_id;precio\n{self.leche.id};120\n'.encode('utf-8'))
+		with patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=QuerySet.select_for_update) as bloqueo:
+			response = self.client.post(self.url, {'tipo': 'archivo', 'archivo': archivo, 'simular': 'true'}, format='multipart')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['productos_cambiados'], 1)
+		bloqueo.assert_not_called()
+		self.leche.refresh_from_db()
+		self.assertEqual(self.leche.precio, Decimal('100.00'))
+
+	def test_archivo_csv(self):
+		"""Guarda los precios del CSV e informa las filas con errores"""
+		contenido = (
+			'producto_id;precio\n'
+			f'{self.leche.id};120,5\n'
+			f'{self.yogur.id};333.33\n'
+			'999999;10\n'
+			f'{self.lavandina.id};-1\n'
+		)
+		archivo = SimpleUploadedFile('precios.csv', contenido.encode('utf-8'))
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(self.url, {'tipo': 'archivo', 'archivo': archivo}, format='multipart')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['filas'], 4)
+		self.assertEqual((response.data['productos'], response.data['productos_cambiados']), (2, 1))
+		self.assertEqual([e['fila'] for e in response.data['errores']], [5, 4])
+		self.leche.refresh_from_db()
+		self.assertEqual(self.leche.precio, Decimal('120.50'))
+		self.assertEqual(list(HistorialPrecio.objects.values_list('producto_id', flat=True)), [self.leche.id])
+
+	def test_productos_ajenos_se_rechazan(self):
+		"""Los productos compartidos o inexistentes quedan como errores y no cambian"""
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(self.url, {
+				'tipo': 'porcentaje', 'valor': '10', 'productos_ids': [self.leche.id, self.compartido.id, 999999]
+			}, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual((response.data['productos'], response.data['productos_cambiados']), (1, 1))
+		self.assertEqual([e['fila'] for e in response.data['errores']], [2, 3])
+		self.compartido.refresh_from_db()
+		self.assertEqual(self.compartido.precio, Decimal('80.00'))
+
+		archivo = SimpleUploadedFile('precios.csv', f'producto_id;precio\n{self.compartido.id};90\n'.encode('utf-8'))
+		response = self.client.post(self.url, {'tipo': 'archivo', 'archivo': archivo}, format='multipart')
+		self.assertEqual(response.data['filas_con_errores'], 1)
+		self.compartido.refresh_from_db()
+		self.assertEqual(self.compartido.precio, Decimal('80.00'))
+
+		response = self.client.post(self.url, {
+			'tipo': 'monto', 'valor': '5', 'categoria_id': self.compartido.categoria_id
+		}, format='json')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	def test_guardar_producto_registra_historial(self):
+		"""Un cambio de precio individual también queda en el historial"""
+		self.leche.precio = Decimal('105.00')
+		self.leche.save()
+		self.leche.nombre = 'Leche entera'
+		self.leche.save(update_fields=['nombre'])
+
+		historial = HistorialPrecio.objects.get(producto=self.leche)
+		self.assertEqual((historial.precio_anterior, historial.precio_nuevo), (Decimal('100.00'), Decimal('105.00')))
+		self.assertEqual(historial.origen, 'manual')
@@ -13,13 +13,22 @@ urlpatterns = [
     path('', views.ProductoListCreateView.as_view(), name='producto-list-create'),
     path('<int:pk>/', views.ProductoDetailView.as_view(), name='producto-detail'),
     path('estadisticas/', views.estadisticas_productos, name='estadisticas-productos'),
+    path('exportar/', views.exportar_productos, name='productos-exportar'),
+    path('importar/', views.importar_productos, name='productos-importar'),
+    path('precios/lote/', views.actualizar_precios_lote, name='precios-lote'),
+    path('autocompletar/', views.autocompletar_productos, name='autocompletar-productos'),
     path('mi-deposito/', views.productos_mi_deposito, name='productos-mi-deposito'),
     
     # URLs para stock de productos
     path('<int:producto_id>/stock/', views.gestionar_stock_producto, name='producto-stock'),
     path('<int:producto_id>/stock-completo/', views.obtener_stock_completo_producto, name='producto-stock-completo'),
     path('<int:producto_id>/actualizar-stock/', views.actualizar_stock_completo_producto, name='actualizar-stock-completo'),
+    path('stock/lote/', views.actualizar_stock_lote, name='stock-lote'),
     path('stock/<int:stock_id>/', views.stock_producto_detail, name='stock-detail'),
+    
+    # URLs para códigos de barras
+    path('<int:producto_id>/codigos-barras/', views.codigos_barras_producto, name='producto-codigos-barras'),
+    path('codigos-barras/<int:codigo_id>/', views.codigo_barras_detail, name='codigo-barras-detail'),
     path('deposito/<int:deposito_id>/', views.productos_por_deposito, name='productos-por-deposito'),
     
     # URLs para reconocimiento de productos
@@ -0,0 +1,78 @@
+"""
+Versión del catálogo (productos, precios, ofertas y stock).
+
+Las cajas y los reponedores vuelven a pedir el catálogo muchas veces y casi
+nunca cambia entre un pedido y el siguiente. Cada cambio de productos,
+categorías u ofertas incrementa la versión global y cada cambio de stock, de
+depósitos o de empleados (el depósito asignado) la del supermercado. Con las
+dos se arman los ETag de las lecturas del catálogo y las claves de sus copias
+en la caché: mientras no cambien, el cliente recibe un 304 o la copia guardada
+sin consultar el catálogo.
+
+Las versiones se incrementan al confirmarse la transacción, fuera de ella, para
+no bloquear la fila del contador mientras dura una venta. Las actualizaciones
+masivas (UPDATE sin señales) tienen que llamar a `incrementar_version`.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Categoria, Producto, ProductoDeposito, VersionCatalogo
+
+
+def version_catalogo(supermercado):
+    """Versión del catálogo del supermercado como texto ('global.supermercado')"""
+    supermercado_id = getattr(supermercado, 'pk', supermercado)
+    versiones = {None: 0, supermercado_id: 0}
+    for fila_supermercado, version in VersionCatalogo.objects.filter(
+        Q(supermercado__isnull=True) | Q(supermercado_id=supermercado_id)
+    ).values_list('supermercado_id', 'version'):
+        versiones[fila_supermercado] = max(versiones[fila_supermercado], version)
+    return f'{versiones[None]}.{versiones[supermercado_id]}'
+
+
+def _incrementar(supermercado_id):
+    filas = VersionCatalogo.objects.filter(supermercado_id=supermercado_id)
+    if filas.update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            VersionCatalogo.objects.create(supermercado_id=supermercado_id, version=1)
+    except IntegrityError:
+        # Otro proceso creó la fila al mismo tiempo
+        filas.update(version=F('version') + 1)
+
+
+def incrementar_version(supermercado=None):
+    """
+    Incrementa, al confirmarse la transacción, la versión del supermercado o,
+    sin supermercado, la global (que invalida el catálogo de todos).
+    """
+    supermercado_id = getattr(supermercado, 'pk', supermercado)
+    transaction.on_commit(lambda: _incrementar(supermercado_id))
+
+
+@receiver([post_save, post_delete], sender=Producto)
+@receiver([post_save, post_delete], sender=Categoria)
+@receiver([post_save, post_delete], sender='ofertas.Oferta')
+@receiver([post_save, post_delete], sender='ofertas.ProductoOferta')
+def incrementar_version_global(sender, **kwargs):
+    incrementar_version()
+
+
+@receiver([post_save, post_delete], sender=ProductoDeposito)
+def incrementar_version_stock(sender, instance, **kwargs):
+    try:
+        supermercado_id = instance.deposito.supermercado_id
+    except ObjectDoesNotExist:
+        # Se borró junto con su depósito: la señal del depósito ya incrementa la versión
+        return
+    incrementar_version(supermercado_id)
+
+
+@receiver([post_save, post_delete], sender='inventario.Deposito')
+@receiver([post_save, post_delete], sender='empleados.Empleado')
+def incrementar_version_supermercado(sender, instance, **kwargs):
+    incrementar_version(instance.supermercado_id)
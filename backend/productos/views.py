@@ -2,26 +2,34 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q, Sum, F
-from django.db import models
+from django.db.models import Q, Sum, F, Prefetch
+from django.db import models, transaction, IntegrityError
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+import hashlib
 
-from .models import Categoria, Producto, ProductoDeposito
+from .models import Categoria, Producto, ProductoDeposito, CodigoBarras, anotar_stock
+from .busqueda import q_busqueda, autocompletar, leer_limite
+from .estadisticas import estadisticas_supermercado
+from . import exportacion, importacion, precios
+from .stock import MAXIMO_FILAS_STOCK, actualizar_stocks
+from .versiones import version_catalogo
 from .serializers import (
     CategoriaSerializer, CategoriaListSerializer,
     ProductoSerializer, ProductoListSerializer, ProductoCreateUpdateSerializer,
-    ProductoDepositoSerializer
+    ProductoDepositoSerializer, CodigoBarrasSerializer
 )
+from appproductos.pagination import PaginacionCursorOpcional
 from inventario.models import Deposito
-from authentication.permissions import IsReponedorOrAdmin
+from authentication.permissions import IsReponedorOrAdmin, IsSupermercadoAdmin
 from authentication.models import EmpleadoUser
 from empleados.models import Empleado
 
-class ProductoPagination(PageNumberPagination):
+class ProductoPagination(PaginacionCursorOpcional):
     page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
 
 # === VISTAS PARA CATEGORÍAS ===
 
@@ -123,9 +131,11 @@ def crear_categoria_personalizada(request):
 class ProductoListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsReponedorOrAdmin]
     pagination_class = ProductoPagination
+    # Orden del modo cursor (?cursor=), cubierto por el índice (nombre, id)
+    ordenamiento_cursor = ('nombre', 'id')
     
     def get_queryset(self):
-        queryset = Producto.objects.select_related('categoria').prefetch_related('stocks__deposito')
+        queryset = Producto.objects.select_related('categoria')
         
         # Filtros
         categoria_id = self.request.query_params.get('categoria', None)
@@ -154,7 +164,7 @@ class ProductoListCreateView(generics.ListCreateAPIView):
         
         if search:
             queryset = queryset.filter(
-                Q(nombre__icontains=search) | 
+                q_busqueda(search) | 
                 Q(categoria__nombre__icontains=search)
             )
 
@@ -175,13 +185,33 @@ class ProductoListCreateView(generics.ListCreateAPIView):
                     stocks__cantidad__gte=F('stocks__cantidad_minima')
                 )
         
-        return queryset.distinct().order_by('-activo', 'nombre')
+        queryset = queryset.distinct().order_by('-activo', 'nombre')
+        if self.request.method == 'GET':
+            # Stock de los depósitos del usuario calculado en la misma consulta
+            supermercado = user.supermercado if isinstance(user, EmpleadoUser) else user
+            queryset = anotar_stock(queryset, supermercado)
+        return queryset
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return ProductoCreateUpdateSerializer
         return ProductoListSerializer
 
+    def list(self, request, *args, **kwargs):
+        # La página depende del catálogo, del stock del supermercado, del usuario y
+        # de los filtros: si nada de eso cambió, 304 sin armarla
+        user = request.user
+        supermercado = user.supermercado if isinstance(user, EmpleadoUser) else user
+        firma = f'{version_catalogo(supermercado)}:{type(user).__name__}:{user.pk}:{request.get_full_path()}'
+        etag = quote_etag(hashlib.md5(firma.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
 class ProductoDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Producto.objects.select_related('categoria').prefetch_related('stocks__deposito')
     permission_classes = [IsReponedorOrAdmin]
@@ -300,6 +330,42 @@ def gestionar_stock_producto(request, producto_id):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET', 'POST'])
+@permission_classes([IsReponedorOrAdmin])
+def codigos_barras_producto(request, producto_id):
+    """Listar o agregar códigos de barras de un producto en el supermercado del usuario"""
+    producto = get_object_or_404(Producto, id=producto_id)
+    user = request.user
+    supermercado = user.supermercado if isinstance(user, EmpleadoUser) else user
+    
+    if request.method == 'GET':
+        codigos = CodigoBarras.objects.filter(producto=producto, supermercado=supermercado)
+        return Response(CodigoBarrasSerializer(codigos, many=True).data)
+    
+    serializer = CodigoBarrasSerializer(data=request.data, context={'supermercado': supermercado})
+    if serializer.is_valid():
+        try:
+            with transaction.atomic():
+                serializer.save(producto=producto, supermercado=supermercado)
+        except IntegrityError:
+            # Otro request asignó el mismo código entre la validación y el INSERT
+            return Response(
+                {'codigo': ['Este código de barras ya está asignado a un producto.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['DELETE'])
+@permission_classes([IsReponedorOrAdmin])
+def codigo_barras_detail(request, codigo_id):
+    """Quitar un código de barras del supermercado del usuario"""
+    user = request.user
+    supermercado = user.supermercado if isinstance(user, EmpleadoUser) else user
+    codigo = get_object_or_404(CodigoBarras, id=codigo_id, supermercado=supermercado)
+    codigo.delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsReponedorOrAdmin])
 def stock_producto_detail(request, stock_id):
@@ -538,40 +604,190 @@ def actualizar_stock_completo_producto(request, producto_id):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([IsReponedorOrAdmin])
+def actualizar_stock_lote(request):
+    """
+    Actualizar el stock de muchos productos y depósitos en una sola operación.
+    Recibe `stocks`: [{producto_id, deposito_id, cantidad, cantidad_minima}] y
+    devuelve un resultado por fila, en el mismo orden (ver productos.stock).
+    """
+    stocks_data = request.data.get('stocks')
+    if not isinstance(stocks_data, list) or not stocks_data:
+        return Response({'error': 'Debe enviar la lista "stocks".'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(stocks_data) > MAXIMO_FILAS_STOCK:
+        return Response(
+            {'error': f'Se pueden actualizar hasta {MAXIMO_FILAS_STOCK} stocks por pedido.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    user = request.user
+    supermercado, deposito_id = user, None
+    # Los reponedores solo actualizan su depósito
+    if isinstance(user, EmpleadoUser):
+        emp = Empleado.objects.filter(email=user.email, supermercado=user.supermercado).first()
+        if not emp or not emp.deposito_id:
+            return Response({"detail": "Empleado sin depósito asignado"}, status=status.HTTP_403_FORBIDDEN)
+        supermercado, deposito_id = user.supermercado, emp.deposito_id
+
+    try:
+        resultados = actualizar_stocks(stocks_data, supermercado, deposito_id)
+    except Exception as e:
+        return Response({'error': f'Error al actualizar el stock: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'mensaje': 'Stock actualizado',
+        'actualizados': sum(1 for resultado in resultados if 'error' not in resultado),
+        'resultados': resultados
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsReponedorOrAdmin])
 def estadisticas_productos(request):
-    """Obtener estadísticas generales de productos"""
-    total_productos = Producto.objects.filter(activo=True).count()
-    total_categorias = Categoria.objects.filter(activo=True).count()
-    productos_sin_stock = Producto.objects.filter(
-        activo=True,
-        stocks__cantidad=0
-    ).distinct().count()
-    
-    # Stock total por categoría
-    stock_por_categoria = []
-    categorias = Categoria.objects.filter(activo=True)
-    for categoria in categorias:
-        stock_total = ProductoDeposito.objects.filter(
-            producto__categoria=categoria,
-            producto__activo=True
-        ).aggregate(total=Sum('cantidad'))['total'] or 0
-        
-        stock_por_categoria.append({
-            'categoria': categoria.nombre,
-            'stock_total': stock_total,
-            'productos_count': categoria.productos.filter(activo=True).count()
-        })
-    
+    """
+    Estadísticas de los productos del supermercado del usuario, leídas del
+    resumen por categoría (ver productos.estadisticas)
+    """
+    user = request.user
+    supermercado = user.supermercado if isinstance(user, EmpleadoUser) else user
+    estadisticas = estadisticas_supermercado(supermercado)
+
     return Response({
-        'total_productos': total_productos,
-        'total_categorias': total_categorias,
-        'productos_sin_stock': productos_sin_stock,
-        'stock_por_categoria': stock_por_categoria
+        'total_productos': sum(fila.productos_count for _categoria, fila in estadisticas),
+        'total_categorias': sum(1 for categoria, _fila in estadisticas if categoria.activo),
+        'productos_sin_stock': sum(fila.productos_sin_stock for _categoria, fila in estadisticas),
+        'stock_por_categoria': [
+            {
+                'categoria': categoria.nombre,
+                'stock_total': fila.stock_total,
+                'productos_count': fila.productos_count,
+                'productos_sin_stock': fila.productos_sin_stock,
+            }
+            for categoria, fila in estadisticas if categoria.activo
+        ]
     })
 
 
+@api_view(['POST'])
+@permission_classes([IsSupermercadoAdmin])
+def importar_productos(request):
+    """
+    Importación masiva de productos y stock desde un archivo CSV o JSON (campo
+    `archivo`). `deposito` (id o nombre, opcional) es el depósito de las filas
+    que no indican uno. Devuelve los contadores y los errores por fila.
+    """
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return Response({'error': 'Debe enviar el archivo en el campo "archivo".'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        formato = importacion.formato_archivo(archivo.name, request.data.get('formato'))
+        resultado = importacion.importar_productos(
+            importacion.leer_filas(archivo, formato),
+            request.user,
+            deposito=request.data.get('deposito')
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': f'Error al importar productos: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(resultado.como_dict())
+
+
+@api_view(['POST'])
+@permission_classes([IsSupermercadoAdmin])
+def actualizar_precios_lote(request):
+    """
+    Actualización masiva de precios (ver productos.precios). `tipo`:
+    - porcentaje o monto: `valor` aplicado a los productos de `categoria_id`
+      y/o `productos_ids`, con `redondeo` (0.01 por defecto) y `modo_redondeo`
+      (cercano, arriba o abajo).
+    - archivo: CSV en el campo `archivo` con las columnas producto_id y precio.
+    Con `simular` solo devuelve los contadores y una muestra de los cambios.
+    """
+    datos = request.data
+    tipo = datos.get('tipo')
+    simular = str(datos.get('simular', '')).lower() in ('1', 'true', 'si', 'sí')
+
+    try:
+        if tipo == 'archivo':
+            archivo = request.FILES.get('archivo')
+            if archivo is None:
+                return Response({'error': 'Debe enviar el archivo en el campo "archivo".'}, status=status.HTTP_400_BAD_REQUEST)
+            resultado = precios.precios_desde_archivo(importacion.leer_filas(archivo, 'csv'), request.user, simular)
+        else:
+            productos, rechazados = precios.productos_a_repreciar(
+                request.user, datos.get('categoria_id'), datos.get('productos_ids')
+            )
+            resultado = precios.ajustar_precios(
+                productos,
+                request.user,
+                tipo,
+                datos.get('valor'),
+                redondeo=datos.get('redondeo', '0.01'),
+                modo=datos.get('modo_redondeo', 'cercano'),
+                simular=simular,
+                rechazados=rechazados
+            )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': f'Error al actualizar precios: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(resultado.como_dict())
+
+
+@api_view(['GET'])
+@permission_classes([IsSupermercadoAdmin])
+def exportar_productos(request):
+    """
+    Exporta el catálogo del supermercado con una columna de stock por depósito
+    (`?formato=csv` por defecto, o `xlsx`). El archivo se envía a medida que se
+    leen los productos (ver productos.exportacion).
+    """
+    try:
+        contenido, content_type, extension = exportacion.exportar_productos(
+            request.user, request.query_params.get('formato', 'csv').lower()
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(contenido, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="productos_{timezone.localdate():%Y%m%d}.{extension}"'
+    )
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsReponedorOrAdmin])
+def autocompletar_productos(request):
+    """
+    Autocompletado de productos activos por nombre (?q=, ?limite=), ordenado por
+    relevancia. Pensado para consultarse en cada tecla (ver productos.busqueda).
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response([])
+    
+    productos = autocompletar(
+        Producto.objects.filter(activo=True).select_related('categoria'),
+        query,
+        leer_limite(request.query_params.get('limite'))
+    )
+    return Response([
+        {
+            'id': producto.id,
+            'nombre': producto.nombre,
+            'categoria': producto.categoria.nombre,
+            'precio': str(producto.precio),
+        }
+        for producto in productos
+    ])
+
+
 @api_view(['GET'])
 @permission_classes([IsReponedorOrAdmin])
 def productos_mi_deposito(request):
@@ -586,10 +802,17 @@ def productos_mi_deposito(request):
         stocks = ProductoDeposito.objects.filter(
             deposito=deposito,
             producto__activo=True
-        ).select_related('producto', 'producto__categoria').order_by('producto__nombre')
+        ).select_related('producto', 'producto__categoria').prefetch_related(
+            Prefetch(
+                'producto__codigos_barras',
+                queryset=CodigoBarras.objects.filter(supermercado=deposito.supermercado),
+                to_attr='codigos_supermercado'
+            )
+        ).order_by('producto__nombre')
         
         productos_data = []
         for stock in stocks:
+            codigos = [codigo.codigo for codigo in stock.producto.codigos_supermercado]
             productos_data.append({
                 'id': stock.producto.id,
                 'nombre': stock.producto.nombre,
@@ -599,7 +822,8 @@ def productos_mi_deposito(request):
                     'nombre': stock.producto.categoria.nombre
                 },
                 'precio': float(stock.producto.precio),
-                'codigo_barras': stock.producto.codigo_barras,
+                'codigo_barras': codigos[0] if codigos else None,
+                'codigos_barras': codigos,
                 'activo': stock.producto.activo,
                 'stock': {
                     'cantidad': stock.cantidad,
@@ -0,0 +1,145 @@
+"""
+Cola de tareas en segundo plano sobre la base de datos.
+
+Las tareas se encolan dentro de la misma transacción que las origina, así que
+solo quedan visibles para el worker si esa transacción se confirma. El worker
+(`python manage.py procesar_tareas`) toma cada tarea con un UPDATE condicional,
+de modo que varios workers pueden correr a la vez sin ejecutar dos veces la
+misma tarea. No requiere broker externo.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_registro = {}
+_al_fallar = {}
+
+
+def registrar(tipo, al_fallar=None):
+    """
+    Decorador que registra una función como la implementación de `tipo`.
+    `al_fallar` se llama con los mismos datos cuando la tarea agota sus
+    intentos (los fallos con reintento pendiente no lo llaman).
+    """
+    def decorador(funcion):
+        _registro[tipo] = funcion
+        if al_fallar is not None:
+            _al_fallar[tipo] = al_fallar
+        return funcion
+    return decorador
+
+
+def encolar(tipo, max_intentos=3, **datos):
+    """Crea una tarea pendiente; `datos` debe ser serializable a JSON"""
+    if tipo not in _registro:
+        raise ValueError(f"No hay ninguna tarea registrada como '{tipo}'.")
+    return Tarea.objects.create(tipo=tipo, datos=datos, max_intentos=max_intentos)
+
+
+def tomar_tarea():
+    """
+    Marca como EN_PROCESO la próxima tarea disponible y la devuelve, o None si no hay.
+    El UPDATE solo prospera si la tarea sigue PENDIENTE, así que si otro worker la
+    tomó primero se pasa a la siguiente.
+    """
+    ahora = timezone.now()
+    candidatas = Tarea.objects.filter(
+        estado='PENDIENTE',
+        disponible_desde__lte=ahora
+    ).order_by('id').values_list('id', flat=True)
+
+    for tarea_id in candidatas[:10]:
+        tomada = Tarea.objects.filter(id=tarea_id, estado='PENDIENTE').update(
+            estado='EN_PROCESO',
+            fecha_inicio=ahora,
+            intentos=F('intentos') + 1
+        )
+        if tomada:
+            return Tarea.objects.get(id=tarea_id)
+    return None
+
+
+def ejecutar_tarea(tarea):
+    """
+    Ejecuta una tarea ya tomada y registra el resultado; devuelve True si terminó bien.
+    Cada función maneja sus propias transacciones, así puede dejar registrado un error
+    antes de relanzarlo.
+    """
+    funcion = _registro.get(tarea.tipo)
+    try:
+        if funcion is None:
+            raise LookupError(f"No hay ninguna tarea registrada como '{tarea.tipo}'.")
+        funcion(**tarea.datos)
+    except Exception as e:
+        logger.exception("Error ejecutando la tarea %s", tarea)
+        tarea.error = f"{e}\n{traceback.format_exc()}"
+        if tarea.intentos < tarea.max_intentos:
+            # Reintentar más tarde con espera creciente (30s, 60s, 120s...)
+            tarea.estado = 'PENDIENTE'
+            tarea.disponible_desde = timezone.now() + timedelta(seconds=30 * 2 ** (tarea.intentos - 1))
+        else:
+            tarea.estado = 'FALLIDA'
+            tarea.fecha_fin = timezone.now()
+        tarea.save(update_fields=['estado', 'error', 'disponible_desde', 'fecha_fin'])
+        if tarea.estado == 'FALLIDA':
+            _avisar_fallo(tarea)
+        return False
+
+    tarea.estado = 'COMPLETADA'
+    tarea.error = ''
+    tarea.fecha_fin = timezone.now()
+    tarea.save(update_fields=['estado', 'error', 'fecha_fin'])
+    return True
+
+
+def _avisar_fallo(tarea):
+    al_fallar = _al_fallar.get(tarea.tipo)
+    if al_fallar is None:
+        return
+    try:
+        al_fallar(**tarea.datos)
+    except Exception:
+        logger.exception("Error avisando el fallo definitivo de la tarea %s", tarea)
+
+
+def procesar_pendientes(limite=None):
+    """Ejecuta tareas disponibles hasta vaciar la cola (o hasta `limite`); devuelve cuántas corrió"""
+    procesadas = 0
+    while limite is None or procesadas < limite:
+        tarea = tomar_tarea()
+        if tarea is None:
+            break
+        ejecutar_tarea(tarea)
+        procesadas += 1
+    return procesadas
+
+
+def liberar_tareas_colgadas(minutos=15):
+    """
+    Devuelve a PENDIENTE las tareas EN_PROCESO de un worker que murió sin
+    terminarlas y devuelve cuántas. Las que ya usaron todos sus intentos
+    (por ejemplo, una tarea que tira abajo el worker cada vez) quedan
+    FALLIDA y se avisa su fallo, en lugar de reencolarlas para siempre.
+    """
+    ahora = timezone.now()
+    colgadas = Tarea.objects.filter(estado='EN_PROCESO', fecha_inicio__lt=ahora - timedelta(minutes=minutos))
+
+    for tarea in colgadas.filter(intentos__gte=F('max_intentos')):
+        tarea.estado = 'FALLIDA'
+        tarea.error = 'El worker terminó sin completar la tarea en el último intento.'
+        tarea.fecha_fin = ahora
+        # Condicional como en tomar_tarea: otro worker pudo liberarla primero
+        if Tarea.objects.filter(pk=tarea.pk, estado='EN_PROCESO').update(
+            estado=tarea.estado, error=tarea.error, fecha_fin=tarea.fecha_fin
+        ):
+            logger.error("Tarea %s colgada sin intentos restantes", tarea)
+            _avisar_fallo(tarea)
+
+    return colgadas.update(estado='PENDIENTE')
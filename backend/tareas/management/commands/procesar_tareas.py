@@ -0,0 +1,69 @@
+"""
+Comando Django que ejecuta las tareas en segundo plano encoladas en la base.
+Pensado para correr como proceso aparte junto al servidor (uno o varios).
+
+Uso: python manage.py procesar_tareas [--una-vez] [--intervalo 1.0]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from tareas.cola import procesar_pendientes, liberar_tareas_colgadas
+
+# Cada cuánto el worker busca tareas colgadas mientras corre
+SEGUNDOS_ENTRE_REVISIONES = 60
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas pendientes de la cola (generación de tickets, etc.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesar las tareas disponibles y terminar en lugar de quedar esperando',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Segundos de espera entre consultas cuando la cola está vacía (default: 1.0)',
+        )
+        parser.add_argument(
+            '--minutos-colgada',
+            type=int,
+            default=15,
+            help='Minutos tras los cuales una tarea EN_PROCESO se considera abandonada (default: 15)',
+        )
+
+    def handle(self, *args, **options):
+        minutos_colgada = options['minutos_colgada']
+        self.liberar_colgadas(minutos_colgada)
+
+        if options['una_vez']:
+            procesadas = procesar_pendientes()
+            self.stdout.write(self.style.SUCCESS(f'✅ {procesadas} tareas procesadas'))
+            return
+
+        self.stdout.write(self.style.WARNING('🚀 Worker de tareas iniciado (Ctrl+C para detener)'))
+        proxima_revision = time.monotonic() + SEGUNDOS_ENTRE_REVISIONES
+        try:
+            while True:
+                close_old_connections()
+                # Las tareas que se cuelgan con el worker andando también vuelven a la cola
+                if time.monotonic() >= proxima_revision:
+                    self.liberar_colgadas(minutos_colgada)
+                    proxima_revision = time.monotonic() + SEGUNDOS_ENTRE_REVISIONES
+                procesadas = procesar_pendientes(limite=100)
+                if procesadas:
+                    self.stdout.write(f'  • {procesadas} tareas procesadas')
+                else:
+                    time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('✅ Worker de tareas detenido'))
+
+    def liberar_colgadas(self, minutos):
+        liberadas = liberar_tareas_colgadas(minutos)
+        if liberadas:
+            self.stdout.write(self.style.WARNING(f'⚠️  {liberadas} tareas colgadas devueltas a la cola'))
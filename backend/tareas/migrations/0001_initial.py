@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text='Nombre con el que se registró la función que ejecuta la tarea', max_length=100, verbose_name='Tipo')),
+                ('datos', models.JSONField(blank=True, default=dict, help_text='Argumentos con los que se llama a la función de la tarea', verbose_name='Datos')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En Proceso'), ('COMPLETADA', 'Completada'), ('FALLIDA', 'Fallida')], default='PENDIENTE', max_length=20, verbose_name='Estado')),
+                ('intentos', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3, verbose_name='Máximo de Intentos')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Último Error')),
+                ('disponible_desde', models.DateTimeField(auto_now_add=True, help_text='La tarea no se ejecuta antes de este momento (reintentos con espera)', verbose_name='Disponible Desde')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Inicio')),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Fin')),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'disponible_desde'], name='tarea_estado_disp_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import models
+
+
+class Tarea(models.Model):
+    """Trabajo en segundo plano guardado en la base y ejecutado por `procesar_tareas`"""
+    
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En Proceso'),
+        ('COMPLETADA', 'Completada'),
+        ('FALLIDA', 'Fallida'),
+    ]
+    
+    tipo = models.CharField(
+        max_length=100,
+        verbose_name="Tipo",
+        help_text="Nombre con el que se registró la función que ejecuta la tarea"
+    )
+    
+    datos = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Datos",
+        help_text="Argumentos con los que se llama a la función de la tarea"
+    )
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='PENDIENTE',
+        verbose_name="Estado"
+    )
+    
+    intentos = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Intentos"
+    )
+    
+    max_intentos = models.PositiveSmallIntegerField(
+        default=3,
+        verbose_name="Máximo de Intentos"
+    )
+    
+    error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Último Error"
+    )
+    
+    disponible_desde = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Disponible Desde",
+        help_text="La tarea no se ejecuta antes de este momento (reintentos con espera)"
+    )
+    
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Fecha de Creación"
+    )
+    
+    fecha_inicio = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha de Inicio"
+    )
+    
+    fecha_fin = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha de Fin"
+    )
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde'], name='tarea_estado_disp_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.tipo} #{self.id} ({self.estado})"
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from .cola import encolar, registrar, tomar_tarea, ejecutar_tarea, procesar_pendientes, liberar_tareas_colgadas
+from .models import Tarea
+
+ejecutadas = []
+fallos = []
+
+
+@registrar('tests.anotar')
+def anotar(valor):
+    ejecutadas.append(valor)
+
+
+@registrar('tests.fallar', al_fallar=lambda **datos: fallos.append(datos))
+def fallar(**datos):
+    raise RuntimeError('falla de prueba')
+
+
+class ColaTareasTestCase(TestCase):
+    """Tests para la cola de tareas en segundo plano"""
+
+    def setUp(self):
+        ejecutadas.clear()
+        fallos.clear()
+
+    def test_encolar_tipo_no_registrado_falla(self):
+        """No se pueden encolar tareas sin una función registrada"""
+        with self.assertRaises(ValueError):
+            encolar('tests.inexistente')
+
+    def test_procesar_ejecuta_tareas_en_orden(self):
+        """El worker ejecuta las tareas pendientes en orden y las marca completadas"""
+        for valor in range(3):
+            encolar('tests.anotar', valor=valor)
+
+        salida = StringIO()
+        call_command('procesar_tareas', '--una-vez', stdout=salida)
+
+        self.assertEqual(ejecutadas, [0, 1, 2])
+        self.assertIn('3 tareas procesadas', salida.getvalue())
+        self.assertFalse(Tarea.objects.exclude(estado='COMPLETADA').exists())
+
+    def test_tarea_tomada_no_se_ejecuta_dos_veces(self):
+        """Una tarea EN_PROCESO no la puede tomar otro worker"""
+        encolar('tests.anotar', valor=1)
+        tarea = tomar_tarea()
+
+        self.assertEqual(tarea.estado, 'EN_PROCESO')
+        self.assertEqual(tarea.intentos, 1)
+        self.assertIsNone(tomar_tarea())
+
+    def test_tarea_fallida_se_reintenta_y_luego_queda_fallida(self):
+        """Una tarea que falla vuelve a la cola con espera hasta agotar sus intentos"""
+        tarea = encolar('tests.fallar', max_intentos=2, valor=7)
+
+        self.assertFalse(ejecutar_tarea(tomar_tarea()))
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'PENDIENTE')
+        self.assertGreater(tarea.disponible_desde, timezone.now())
+        self.assertIn('falla de prueba', tarea.error)
+        self.assertEqual(procesar_pendientes(), 0)
+        # Con reintentos pendientes no se avisa el fallo
+        self.assertEqual(fallos, [])
+
+        Tarea.objects.filter(pk=tarea.pk).update(disponible_desde=timezone.now())
+        self.assertEqual(procesar_pendientes(), 1)
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'FALLIDA')
+        self.assertEqual(tarea.intentos, 2)
+        self.assertEqual(fallos, [{'valor': 7}])
+
+    def test_liberar_tareas_colgadas(self):
+        """Las tareas de un worker caído vuelven a quedar pendientes"""
+        tarea = encolar('tests.anotar', valor=1)
+        Tarea.objects.filter(pk=tarea.pk).update(
+            estado='EN_PROCESO',
+            fecha_inicio=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(liberar_tareas_colgadas(minutos=15), 1)
+        self.assertEqual(procesar_pendientes(), 1)
+        self.assertEqual(ejecutadas, [1])
+
+    def test_tarea_colgada_sin_intentos_queda_fallida(self):
+        """Una tarea que mata al worker en su último intento no se reencola: falla y se avisa"""
+        tarea = encolar('tests.fallar', max_intentos=2, valor=3)
+        Tarea.objects.filter(pk=tarea.pk).update(
+            estado='EN_PROCESO',
+            intentos=2,
+            fecha_inicio=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(liberar_tareas_colgadas(minutos=15), 0)
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'FALLIDA')
+        self.assertIsNotNone(tarea.fecha_fin)
+        self.assertEqual(fallos, [{'valor': 3}])
+        self.assertEqual(procesar_pendientes(), 0)
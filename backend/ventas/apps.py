@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VentasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ventas'
+
+    def ready(self):
+        # Señales que limpian la caché del escaneo de códigos de barras
+        from . import escaneo  # noqa: F401
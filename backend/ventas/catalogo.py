@@ -0,0 +1,241 @@
+"""
+Catálogo de productos disponibles para las cajas.
+
+Las cajas descargan el catálogo completo al iniciar sesión, así que se arma
+con una sola consulta agregada (stock sumado por producto, oferta vigente y
+reservas de otros carritos como subconsultas) y se envía como JSON a medida
+que se leen las filas, sin cargar todo el catálogo en memoria.
+
+El catálogo completo además se guarda serializado en la caché de Django por
+supermercado, depósito y versión del catálogo (productos.versiones), con el
+stock confirmado de los depósitos. Lo reservado por los carritos cambia con
+cada item escaneado, así que no entra en la copia ni en la versión: en cada
+lectura se suma con una consulta agrupada y se descuenta solo de las filas
+de los productos reservados. Mientras no cambie el catálogo, las cajas
+reciben la copia (o un 304 si ya la tienen) con dos consultas, la de la
+versión y la de las reservas. Para que la copia se comparta entre los
+procesos del servidor, CACHES tiene que apuntar a una caché compartida.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from ofertas.precios import subconsulta_precio_oferta
+from productos.busqueda import filtrar_busqueda, ordenar_por_relevancia
+from productos.models import Producto
+from productos.versiones import version_catalogo
+from .services import reservas_activas
+
+# Filas por bloque de la respuesta y por lectura del cursor
+FILAS_POR_BLOQUE = 500
+
+
+def contexto_catalogo(user):
+    """Devuelve (supermercado, depósito asignado o None) del usuario que consulta el catálogo"""
+    if not hasattr(user, 'supermercado'):
+        # Es un admin de supermercado: ve todos sus depósitos
+        return user, None
+
+    # Es un empleado (cajero/reponedor): si tiene depósito asignado, solo ve ese
+    from empleados.models import Empleado
+    empleado = Empleado.objects.filter(
+        email=user.email,
+        supermercado=user.supermercado
+    ).select_related('deposito').first()
+    return user.supermercado, empleado.deposito if empleado else None
+
+
+def alcance_stock(supermercado, deposito=None):
+    """Filtros de ProductoDeposito del depósito asignado o de los depósitos activos del supermercado"""
+    if deposito is not None:
+        return {'deposito': deposito}
+    return {'deposito__supermercado': supermercado, 'deposito__activo': True}
+
+
+def productos_con_stock(supermercado, deposito=None):
+    """Productos activos con stock en el alcance del usuario (instancias, sin repetir)"""
+    alcance = alcance_stock(supermercado, deposito)
+    return Producto.objects.filter(
+        activo=True,
+        stocks__cantidad__gt=0,
+        **{f'stocks__{campo}': valor for campo, valor in alcance.items()}
+    ).distinct()
+
+
+def reservas_en_alcance(supermercado, deposito=None):
+    """Reservas activas sobre el stock del depósito (o de los depósitos activos del supermercado)"""
+    return reservas_activas().filter(
+        **{f'stock__{campo}': valor for campo, valor in alcance_stock(supermercado, deposito).items()}
+    )
+
+
+def productos_disponibles(supermercado, deposito=None, busqueda=None, descontar_reservas=True):
+    """
+    Queryset de tuplas con los productos activos con stock del depósito (o de los
+    depósitos activos del supermercado): id, nombre, categoría, precio, descripción,
+    precio de la mejor oferta vigente (o None) y stock disponible, que descuenta lo
+    reservado por los carritos en curso (o, sin `descontar_reservas`, el stock
+    confirmado).
+    """
+    alcance = alcance_stock(supermercado, deposito)
+
+    reservado = reservas_en_alcance(supermercado, deposito).filter(
+        producto=OuterRef('pk')
+    ).order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+
+    # El filtro sobre stocks va antes del annotate: la suma solo cuenta esos registros
+    productos = Producto.objects.filter(
+        activo=True,
+        **{f'stocks__{campo}': valor for campo, valor in alcance.items()}
+    )
+    if busqueda:
+        productos = filtrar_busqueda(productos, busqueda)
+
+    productos = productos.values(
+        'id', 'nombre', 'categoria__nombre', 'precio', 'descripcion'
+    ).annotate(
+        stock_total=Sum('stocks__cantidad'),
+        precio_oferta=subconsulta_precio_oferta(),
+    ).filter(
+        stock_total__gt=0
+    ).annotate(
+        stock_disponible=(
+            Greatest(F('stock_total') - Coalesce(Subquery(reservado), 0), 0)
+            if descontar_reservas else F('stock_total')
+        )
+    )
+    # Las búsquedas se ordenan por relevancia; el catálogo completo, por nombre
+    productos = ordenar_por_relevancia(productos, busqueda) if busqueda else productos.order_by('nombre', 'id')
+
+    return productos.values_list(
+        'id', 'nombre', 'categoria__nombre', 'precio', 'descripcion', 'precio_oferta', 'stock_disponible'
+    )
+
+
+def _filas_json(filas):
+    yield '['
+    bloque = []
+    separador = ''
+    for fila in filas:
+        bloque.append(separador + json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False))
+        separador = ','
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield ''.join(bloque)
+            bloque = []
+    yield ''.join(bloque) + ']'
+
+
+def _precio(valor):
+    # Las expresiones calculadas no siempre vuelven con dos decimales (SQLite)
+    return f'{valor:.2f}'
+
+
+def _filas(productos, descripcion=True):
+    for valores in productos.iterator(chunk_size=FILAS_POR_BLOQUE):
+        id_, nombre, categoria, precio, texto, precio_oferta, stock = valores
+        fila = {
+            'id': id_,
+            'nombre': nombre,
+            'categoria': categoria,
+            'precio': _precio(precio),
+            'precio_oferta': _precio(precio_oferta) if precio_oferta is not None else None,
+            'precio_efectivo': _precio(precio_oferta if precio_oferta is not None else precio),
+        }
+        if descripcion:
+            fila['descripcion'] = texto
+        fila['stock_disponible'] = stock
+        yield fila
+
+
+def respuesta_catalogo(productos, descripcion=True):
+    """Respuesta JSON (lista de objetos) que se envía mientras se recorre el queryset"""
+    return StreamingHttpResponse(_filas_json(_filas(productos, descripcion)), content_type='application/json')
+
+
+def _proximo_cambio():
+    """
+    Próximo momento en que el catálogo cambia sin que cambie su versión: una
+    oferta que empieza o termina (o None)
+    """
+    from ofertas.models import Oferta
+
+    ahora = timezone.now()
+    ofertas = Oferta.objects.filter(activo=True, fecha_fin__gte=ahora).aggregate(
+        inicio=Min('fecha_inicio', filter=Q(fecha_inicio__gt=ahora)),
+        fin=Min('fecha_fin')
+    )
+    return min((momento for momento in (ofertas['inicio'], ofertas['fin']) if momento), default=None)
+
+
+def _copia_base(supermercado, deposito):
+    """
+    (huella, filas) del catálogo con el stock confirmado, desde la caché
+    mientras no cambie la versión. Cada fila es (producto_id, stock, JSON de
+    la fila sin el stock ni la llave de cierre).
+    """
+    clave = f'catalogo:{supermercado.pk}:{getattr(deposito, "pk", 0)}:{version_catalogo(supermercado)}'
+    copia = cache.get(clave)
+    if copia is not None:
+        return copia
+
+    proximo_cambio = _proximo_cambio()
+    huella, filas = hashlib.md5(), []
+    for fila in _filas(productos_disponibles(supermercado, deposito, descontar_reservas=False)):
+        stock = fila.pop('stock_disponible')
+        inicio = json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False)[:-1]
+        huella.update(f'{inicio}|{stock}\n'.encode())
+        filas.append((fila['id'], stock, inicio))
+    copia = (huella.hexdigest(), filas)
+
+    segundos = getattr(settings, 'VENTAS_CATALOGO_CACHE_SEGUNDOS', 3600)
+    if proximo_cambio is not None:
+        segundos = min(segundos, (proximo_cambio - timezone.now()).total_seconds())
+    if segundos > 0:
+        cache.set(clave, copia, segundos)
+    return copia
+
+
+def copia_catalogo(supermercado, deposito=None):
+    """
+    (ETag, función que arma el JSON) del catálogo completo del alcance: la
+    copia en caché con lo reservado por los carritos descontado al leerla.
+    La copia vence cuando cambia la versión del catálogo del supermercado o
+    empieza o termina una oferta; las reservas solo cambian el ETag.
+    """
+    huella, filas = _copia_base(supermercado, deposito)
+    reservado = dict(
+        reservas_en_alcance(supermercado, deposito).order_by().values('producto').annotate(
+            total=Sum('cantidad')
+        ).values_list('producto', 'total')
+    )
+    if reservado:
+        huella = hashlib.md5(f'{huella}:{sorted(reservado.items())}'.encode()).hexdigest()
+
+    def contenido():
+        return ('[' + ','.join(
+            f'{inicio}, "stock_disponible": {max(stock - reservado.get(producto_id, 0), 0)}}}'
+            for producto_id, stock, inicio in filas
+        ) + ']').encode()
+
+    return quote_etag(huella), contenido
+
+
+def respuesta_catalogo_en_cache(request, supermercado, deposito=None):
+    """Catálogo completo desde copia_catalogo; 304 si el cliente ya tiene esa copia (If-None-Match)"""
+    etag, contenido = copia_catalogo(supermercado, deposito)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(contenido(), content_type='application/json')
+    response['ETag'] = etag
+    # El cliente puede guardarlo pero tiene que revalidar cada vez
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,202 @@
+"""
+Escaneo de códigos de barras en caja.
+
+Resuelve código -> producto, precio efectivo (con la mejor oferta vigente,
+leída de la línea de tiempo de precios igual que en el cobro) y stock
+disponible en el alcance del usuario con una sola consulta sobre el índice
+único (supermercado, código). El resultado queda en una caché en memoria
+del proceso: los datos del producto por VENTAS_ESCANEO_CACHE_SEGUNDOS (o
+hasta el próximo cambio de tramo del producto, si es antes) y el stock, que
+cambia con cada venta, por VENTAS_ESCANEO_STOCK_SEGUNDOS. Un escaneo repetido
+se responde sin ir a la base.
+
+Los cambios de productos, códigos y ofertas limpian la caché del proceso que
+los hace (señales); los demás procesos los ven al vencer el TTL. El stock que
+muestra el escaneo es informativo: al agregar el item lo valida la reserva.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from productos.models import CodigoBarras, Producto, ProductoDeposito
+from .catalogo import alcance_stock, contexto_catalogo
+from .services import reservas_activas
+
+
+class CacheTTL:
+    """Diccionario en memoria con vencimiento por entrada y tamaño máximo"""
+
+    def __init__(self, maximo=50000):
+        self.maximo = maximo
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada is None or entrada[0] < time.monotonic():
+            return None
+        return entrada[1]
+
+    def guardar(self, clave, valor, segundos):
+        with self._lock:
+            if len(self._datos) >= self.maximo:
+                # Caché llena: se descarta entera (más simple que un LRU y rara vez pasa)
+                self._datos.clear()
+            self._datos[clave] = (time.monotonic() + segundos, valor)
+
+    def invalidar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+productos_por_codigo = CacheTTL()
+stock_por_producto = CacheTTL()
+contextos = CacheTTL()
+
+
+def _segundos_producto():
+    return getattr(settings, 'VENTAS_ESCANEO_CACHE_SEGUNDOS', 300)
+
+
+def _segundos_stock():
+    return getattr(settings, 'VENTAS_ESCANEO_STOCK_SEGUNDOS', 5)
+
+
+def _stock_disponible(alcance, producto):
+    """Expresión del stock del producto en el alcance menos lo reservado por los carritos"""
+    stock = ProductoDeposito.objects.filter(
+        producto=producto, **alcance
+    ).order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+    reservado = reservas_activas().filter(
+        producto=producto, **{f'stock__{campo}': valor for campo, valor in alcance.items()}
+    ).order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+    return Greatest(Coalesce(Subquery(stock), 0) - Coalesce(Subquery(reservado), 0), 0)
+
+
+def _consultar(supermercado, deposito, codigo):
+    """
+    Consulta completa: producto, precios, stock del código y próximo cambio
+    de tramo del producto (o None)
+    """
+    from ofertas.models import IntervaloPrecio
+    from ofertas.precios import subconsulta_precio_oferta
+
+    ahora = timezone.now()
+    # Primer tramo que termina después de ahora: el vigente o el próximo
+    siguiente = IntervaloPrecio.objects.filter(
+        producto=OuterRef('producto'), hasta__gt=ahora
+    ).order_by('desde')
+
+    fila = CodigoBarras.objects.filter(
+        supermercado=supermercado,
+        codigo=codigo,
+        producto__activo=True
+    ).annotate(
+        precio_oferta=subconsulta_precio_oferta(ahora, producto='producto'),
+        tramo_desde=Subquery(siguiente.values('desde')[:1]),
+        tramo_hasta=Subquery(siguiente.values('hasta')[:1]),
+        stock_disponible=_stock_disponible(alcance_stock(supermercado, deposito), OuterRef('producto'))
+    ).values_list(
+        'producto_id', 'producto__nombre', 'producto__precio', 'precio_oferta',
+        'tramo_desde', 'tramo_hasta', 'stock_disponible'
+    ).first()
+
+    if fila is None:
+        return None, None, None
+
+    producto_id, nombre, precio, precio_oferta, tramo_desde, tramo_hasta, stock = fila
+    # La entrada de la caché no debe sobrevivir al tramo vigente ni al que empieza
+    cambio = None
+    if tramo_desde is not None:
+        cambio = tramo_hasta if tramo_desde <= ahora else tramo_desde
+    datos = {
+        'id': producto_id,
+        'nombre': nombre,
+        'precio': f'{precio:.2f}',
+        'precio_oferta': f'{precio_oferta:.2f}' if precio_oferta is not None else None,
+        'precio_efectivo': f'{precio_oferta if precio_oferta is not None else precio:.2f}',
+    }
+    return datos, cambio, stock
+
+
+def _consultar_stock(supermercado, deposito, producto_id):
+    """Solo el stock disponible del producto (cuando sus datos ya están en la caché)"""
+    return Producto.objects.filter(pk=producto_id).annotate(
+        disponible=_stock_disponible(alcance_stock(supermercado, deposito), OuterRef('pk'))
+    ).values_list('disponible', flat=True).first() or 0
+
+
+def escanear_codigo(supermercado, deposito, codigo):
+    """
+    Devuelve los datos del producto con el código de barras (id, nombre, precio,
+    precio_oferta, precio_efectivo y stock_disponible) o None si no existe o
+    el producto no está activo.
+    """
+    clave_producto = (supermercado.pk, codigo)
+    datos = productos_por_codigo.obtener(clave_producto)
+
+    if datos is None:
+        datos, cambio, stock = _consultar(supermercado, deposito, codigo)
+        if datos is None:
+            return None
+        segundos = _segundos_producto()
+        if cambio is not None:
+            segundos = max(min(segundos, (cambio - timezone.now()).total_seconds()), 0)
+        productos_por_codigo.guardar(clave_producto, datos, segundos)
+        stock_por_producto.guardar(_clave_stock(datos['id'], supermercado, deposito), stock, _segundos_stock())
+    else:
+        clave_stock = _clave_stock(datos['id'], supermercado, deposito)
+        stock = stock_por_producto.obtener(clave_stock)
+        if stock is None:
+            stock = _consultar_stock(supermercado, deposito, datos['id'])
+            stock_por_producto.guardar(clave_stock, stock, _segundos_stock())
+
+    return {**datos, 'stock_disponible': stock}
+
+
+def contexto_escaneo(user):
+    """contexto_catalogo(user) guardado en la caché: evita consultar el empleado en cada escaneo"""
+    clave = ('EMPLEADO' if hasattr(user, 'supermercado') else 'ADMIN', user.pk)
+    contexto = contextos.obtener(clave)
+    if contexto is None:
+        contexto = contexto_catalogo(user)
+        contextos.guardar(clave, contexto, _segundos_producto())
+    return contexto
+
+
+def resolver_producto_id(supermercado, codigo):
+    """Id del producto con el código de barras en el supermercado (o None)"""
+    datos = productos_por_codigo.obtener((supermercado.pk, codigo))
+    if datos is not None:
+        return datos['id']
+    return CodigoBarras.objects.filter(
+        supermercado=supermercado, codigo=codigo
+    ).values_list('producto_id', flat=True).first()
+
+
+def _clave_stock(producto_id, supermercado, deposito):
+    return producto_id, supermercado.pk, getattr(deposito, 'pk', None)
+
+
+def invalidar_escaneo():
+    """Vacía la caché de escaneo de este proceso"""
+    productos_por_codigo.invalidar()
+    stock_por_producto.invalidar()
+    contextos.invalidar()
+
+
+@receiver([post_save, post_delete], sender=Producto)
+@receiver([post_save, post_delete], sender=CodigoBarras)
+@receiver([post_save, post_delete], sender='ofertas.Oferta')
+@receiver([post_save, post_delete], sender='ofertas.ProductoOferta')
+@receiver([post_save, post_delete], sender='empleados.Empleado')
+def invalidar_escaneo_por_cambio(sender, **kwargs):
+    # Cambió un precio, un código, una oferta o un depósito asignado: no vale la pena
+    # adivinar qué entradas afecta
+    invalidar_escaneo()
@@ -0,0 +1,129 @@
+"""
+Tickets de venta en formato ESC/POS para impresoras térmicas de 80mm.
+
+Genera directamente los bytes que entiende la impresora (texto más comandos
+ESC/POS), así la caja no necesita rasterizar un PDF para imprimir. Usa los
+mismos datos que el ticket PDF: encabezado, items, descuentos y totales.
+"""
+import threading
+
+from django.conf import settings
+
+from .ticket_base import DatosTicketMixin
+
+# Comandos ESC/POS
+ESC = b'\x1b'
+GS = b'\x1d'
+INICIALIZAR = ESC + b'@'
+CODEPAGE_PC858 = ESC + b't\x13'  # Latinoamérica/Europa occidental con acentos, ñ y €
+ALINEAR_IZQUIERDA = ESC + b'a\x00'
+ALINEAR_CENTRO = ESC + b'a\x01'
+NEGRITA_ON = ESC + b'E\x01'
+NEGRITA_OFF = ESC + b'E\x00'
+TAMANO_NORMAL = GS + b'!\x00'
+TAMANO_DOBLE = GS + b'!\x11'
+AVANZAR_Y_CORTAR = ESC + b'd\x04' + GS + b'V\x42\x00'
+SALTO = b'\n'
+
+CODIFICACION = 'cp858'
+
+
+def _codificar(texto):
+    return texto.encode(CODIFICACION, errors='replace')
+
+
+class TicketEscPosGenerator(DatosTicketMixin):
+    """Generador de tickets de venta como flujo de bytes ESC/POS"""
+
+    _encabezados = {}
+    _lock_encabezados = threading.Lock()
+
+    def __init__(self, venta):
+        self.venta = venta
+        self.columnas = getattr(settings, 'VENTAS_ESCPOS_COLUMNAS', 48)
+
+    def get_encabezado(self):
+        """Bytes del encabezado del supermercado, armados una vez por proceso"""
+        info = self.get_supermercado_info()
+        nombre = info['nombre'] or 'SUPERMERCADO'
+        clave = (getattr(info['user'], 'pk', None), nombre, self.columnas)
+        encabezado = self._encabezados.get(clave)
+        if encabezado is None:
+            # En tamaño doble cada caracter ocupa dos columnas
+            ancho = self.columnas // 2
+            lineas = [nombre.upper()[i:i + ancho] for i in range(0, len(nombre), ancho)]
+            encabezado = b''.join([
+                ALINEAR_CENTRO, NEGRITA_ON, TAMANO_DOBLE,
+                *[_codificar(linea) + SALTO for linea in lineas],
+                TAMANO_NORMAL, NEGRITA_OFF,
+                b'TICKET DE VENTA', SALTO, SALTO,
+                ALINEAR_IZQUIERDA,
+            ])
+            with self._lock_encabezados:
+                self._encabezados[clave] = encabezado
+        return encabezado
+
+    def _linea(self, izquierda, derecha=''):
+        """Texto a la izquierda y a la derecha de una misma línea del ancho del papel"""
+        espacio = self.columnas - len(derecha)
+        return f"{izquierda[:espacio - 1]:<{espacio}}{derecha}"
+
+    def _fila_item(self, nombre, cantidad, precio, subtotal):
+        # Producto | Cant. | P.Unit | Subtotal, con las columnas numéricas a la derecha
+        ancho_nombre = self.columnas - 27
+        return f"{nombre[:ancho_nombre - 1]:<{ancho_nombre}}{cantidad:>5}{precio:>11}{subtotal:>11}"
+
+    def generate_ticket(self):
+        """Genera el ticket y devuelve los bytes listos para enviar a la impresora"""
+        separador = '=' * self.columnas
+        lineas = [
+            f"N° Venta: {self.venta.numero_venta}",
+            f"Fecha: {self.venta.fecha_creacion.strftime('%d/%m/%Y %H:%M')}",
+            f"Cajero: {self.get_cajero_nombre()}",
+        ]
+        if self.venta.cliente_telefono:
+            lineas.append(f"Cliente: {self.venta.cliente_telefono}")
+        lineas.append(separador)
+
+        partes = [
+            INICIALIZAR,
+            CODEPAGE_PC858,
+            self.get_encabezado(),
+            _codificar('\n'.join(lineas)), SALTO,
+            NEGRITA_ON, _codificar(self._fila_item('Producto', 'Cant.', 'P.Unit', 'Subtotal')), SALTO, NEGRITA_OFF,
+        ]
+
+        filas = []
+        for item in self.get_items():
+            filas.append(self._fila_item(
+                item.producto.nombre, str(item.cantidad), f"${item.precio_unitario}", f"${item.subtotal}"
+            ))
+            if item.descuento_aplicado:
+                filas.append(self._linea(
+                    f"  {item.oferta_nombre or 'Oferta'}", f"-${item.descuento_aplicado} c/u"
+                ))
+        filas.append(separador)
+
+        if self.venta.descuento and self.venta.descuento > 0:
+            filas.append(self._linea('Subtotal:', f"${self.venta.subtotal}"))
+            filas.append(self._linea('Descuento:', f"-${self.venta.descuento}"))
+        partes += [_codificar('\n'.join(filas)), SALTO]
+
+        partes += [
+            NEGRITA_ON, TAMANO_DOBLE,
+            _codificar(f"TOTAL: ${self.venta.total}"), SALTO,
+            TAMANO_NORMAL, NEGRITA_OFF, SALTO,
+            ALINEAR_CENTRO, _codificar("¡Gracias por su compra!"), SALTO,
+            ALINEAR_IZQUIERDA,
+        ]
+
+        if self.venta.observaciones:
+            partes += [_codificar(f"Observaciones: {self.venta.observaciones}"), SALTO]
+
+        partes += [_codificar(separador), SALTO, AVANZAR_Y_CORTAR]
+        return b''.join(partes)
+
+
+def generar_ticket_escpos(venta):
+    """Función helper para generar el ticket ESC/POS"""
+    return TicketEscPosGenerator(venta).generate_ticket()
@@ -0,0 +1,171 @@
+"""
+Idempotencia de las operaciones de caja.
+
+Si el cliente manda el header `Idempotency-Key` en un POST/PUT/PATCH/DELETE,
+la primera ejecución guarda su respuesta y los reintentos con la misma clave
+la reciben de nuevo (con `Idempotent-Replayed: true`) sin volver a ejecutar
+la operación. Así las cajas pueden reintentar con timeouts cortos sin duplicar
+cantidades ni fallar al finalizar una venta que ya se había finalizado.
+
+La respuesta se guarda en la misma transacción que la operación: si el
+proceso muere después de confirmarla, la clave ya tiene su respuesta y un
+reintento no vuelve a ejecutar la operación.
+
+Solo se guardan las respuestas exitosas (2xx): un error se puede reintentar.
+Las claves vencen a las VENTAS_IDEMPOTENCIA_TTL_HORAS y se borran con
+`python manage.py purgar_claves_idempotencia`.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from authentication.models import EmpleadoUser
+from .models import ClaveIdempotencia
+
+HEADER = 'Idempotency-Key'
+METODOS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Un request sin respuesta después de este tiempo se considera abandonado
+# (el proceso murió) y un reintento puede volver a ejecutarlo
+SEGUNDOS_EN_PROCESO = 60
+
+
+def vencimiento_claves():
+    """Momento antes del cual las claves de idempotencia están vencidas"""
+    horas = getattr(settings, 'VENTAS_IDEMPOTENCIA_TTL_HORAS', 24)
+    return timezone.now() - timedelta(hours=horas)
+
+
+def purgar_claves_vencidas():
+    """Borra de una vez todas las claves vencidas; devuelve cuántas se borraron"""
+    borradas, _ = ClaveIdempotencia.objects.filter(fecha_creacion__lt=vencimiento_claves()).delete()
+    return borradas
+
+
+class RespuestaRepetida(Exception):
+    """Corta el request para devolver la respuesta de una clave ya usada"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def _huella(request):
+    try:
+        cuerpo = request.body
+    except RawPostDataException:
+        # El cuerpo ya se leyó al parsear request.data
+        cuerpo = json.dumps(request.data, sort_keys=True, default=str).encode()
+    contenido = b'\n'.join([request.method.encode(), request.get_full_path().encode(), cuerpo])
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def _respuesta_error(mensaje, codigo):
+    return Response({'error': mensaje}, status=codigo)
+
+
+class IdempotenciaMixin:
+    """Mixin de ViewSet que aplica el header Idempotency-Key a los métodos que modifican datos"""
+
+    def initial(self, request, *args, **kwargs):
+        # Autenticación y permisos primero: la clave pertenece al usuario que la envía
+        super().initial(request, *args, **kwargs)
+        self._clave_idempotencia = None
+
+        clave = request.headers.get(HEADER)
+        if not clave or request.method not in METODOS:
+            return
+
+        if len(clave) > 100:
+            raise RespuestaRepetida(_respuesta_error(
+                f'El header {HEADER} no puede tener más de 100 caracteres.',
+                status.HTTP_400_BAD_REQUEST
+            ))
+
+        datos = {
+            'tipo_usuario': 'EMPLEADO' if isinstance(request.user, EmpleadoUser) else 'ADMIN',
+            'usuario_id': request.user.pk,
+            'clave': clave,
+        }
+        huella = _huella(request)
+
+        try:
+            with transaction.atomic():
+                registro = ClaveIdempotencia.objects.create(huella=huella, **datos)
+            return self._tomar_clave(request, registro)
+        except IntegrityError:
+            registro = ClaveIdempotencia.objects.get(**datos)
+
+        if registro.fecha_creacion < vencimiento_claves():
+            # Clave vencida todavía no purgada: se usa como nueva
+            registro.delete()
+            return self._tomar_clave(request, ClaveIdempotencia.objects.create(huella=huella, **datos))
+
+        if registro.huella != huella:
+            raise RespuestaRepetida(_respuesta_error(
+                f'El {HEADER} ya se usó con un request distinto.',
+                status.HTTP_422_UNPROCESSABLE_ENTITY
+            ))
+
+        if registro.codigo_estado is None:
+            abandonado = timezone.now() - timedelta(seconds=SEGUNDOS_EN_PROCESO)
+            # Tomar el request abandonado solo si nadie más lo tomó (UPDATE condicional)
+            tomado = ClaveIdempotencia.objects.filter(
+                pk=registro.pk, codigo_estado__isnull=True, fecha_creacion__lt=abandonado
+            ).update(fecha_creacion=timezone.now())
+            if tomado:
+                return self._tomar_clave(request, registro)
+
+            response = _respuesta_error(
+                'El request original con este Idempotency-Key todavía se está procesando.',
+                status.HTTP_409_CONFLICT
+            )
+            response['Retry-After'] = '1'
+            raise RespuestaRepetida(response)
+
+        response = Response(registro.respuesta, status=registro.codigo_estado)
+        response['Idempotent-Replayed'] = 'true'
+        raise RespuestaRepetida(response)
+
+    def _tomar_clave(self, request, registro):
+        """
+        Ejecuta la operación de este request con la clave tomada: el método
+        del ViewSet corre dentro de una transacción que también guarda la
+        respuesta exitosa en la clave.
+        """
+        self._clave_idempotencia = registro
+        metodo = request.method.lower()
+        handler = getattr(self, metodo)
+
+        @functools.wraps(handler)
+        def ejecutar(request, *args, **kwargs):
+            with transaction.atomic():
+                response = handler(request, *args, **kwargs)
+                if status.is_success(response.status_code) and isinstance(response, Response):
+                    registro.codigo_estado = response.status_code
+                    registro.respuesta = response.data
+                    registro.save(update_fields=['codigo_estado', 'respuesta'])
+            return response
+
+        setattr(self, metodo, ejecutar)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, RespuestaRepetida):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        registro = getattr(self, '_clave_idempotencia', None)
+        if registro is not None:
+            self._clave_idempotencia = None
+            if registro.codigo_estado is None:
+                # Los errores no se guardan: el cliente puede corregir y reintentar con la misma clave
+                registro.delete()
+        return super().finalize_response(request, response, *args, **kwargs)
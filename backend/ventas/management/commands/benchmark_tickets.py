@@ -0,0 +1,94 @@
+"""
+Comando Django para medir la velocidad de generación de tickets.
+Compara el generador PDF original (platypus) con el renderer sobre canvas y
+con la salida ESC/POS para impresoras térmicas, incluyendo en todos los casos
+la lectura de la venta desde la base. Informa tickets/segundo y tamaño en bytes.
+
+Sin --venta arma una venta de prueba que se descarta al terminar.
+
+Uso: python manage.py benchmark_tickets [--venta ID] [--items 20] [--iteraciones 200]
+"""
+
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from productos.models import Categoria, Producto
+from ventas.models import Venta, ItemVenta
+from ventas.escpos import TicketEscPosGenerator
+from ventas.pdf_generator import (
+    TicketPDFGenerator,
+    TicketCanvasRenderer,
+    cargar_venta_para_ticket
+)
+
+
+class Command(BaseCommand):
+    help = 'Mide tickets/segundo y bytes del PDF original, el PDF sobre canvas y ESC/POS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venta', type=int, help='ID de una venta existente a renderizar')
+        parser.add_argument('--items', type=int, default=20, help='Items de la venta de prueba (default: 20)')
+        parser.add_argument('--iteraciones', type=int, default=200, help='Tickets a generar por modo (default: 200)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['venta']:
+                if not Venta.objects.filter(pk=options['venta']).exists():
+                    raise CommandError(f"La venta {options['venta']} no existe")
+                venta_id = options['venta']
+            else:
+                venta_id = self.crear_venta_prueba(options['items'])
+
+            iteraciones = options['iteraciones']
+            modos = [
+                ('PDF platypus (original)', lambda: TicketPDFGenerator(Venta.objects.get(pk=venta_id))),
+                ('PDF canvas', lambda: TicketCanvasRenderer(cargar_venta_para_ticket(venta_id))),
+                ('ESC/POS', lambda: TicketEscPosGenerator(cargar_venta_para_ticket(venta_id))),
+            ]
+
+            resultados = {}
+            for nombre, crear_generador in modos:
+                contenido = crear_generador().generate_ticket()  # calentar caches
+                tamano = len(contenido.getvalue() if hasattr(contenido, 'getvalue') else contenido)
+                inicio = time.perf_counter()
+                for _ in range(iteraciones):
+                    crear_generador().generate_ticket()
+                resultados[nombre] = iteraciones / (time.perf_counter() - inicio)
+                self.stdout.write(f'  • {nombre}: {resultados[nombre]:.1f} tickets/s, {tamano} bytes')
+
+            # No dejar rastros de la venta de prueba
+            transaction.set_rollback(True)
+
+        original = resultados['PDF platypus (original)']
+        for nombre in ('PDF canvas', 'ESC/POS'):
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {nombre} es {resultados[nombre] / original:.1f}x más rápido que el PDF original'
+            ))
+
+    def crear_venta_prueba(self, cantidad_items):
+        User = get_user_model()
+        supermercado = User.objects.filter(username='benchmark_tickets').first() or User.objects.create_user(
+            username='benchmark_tickets',
+            email='benchmark_tickets@example.com',
+            password=None,
+            nombre_supermercado='Supermercado Benchmark',
+            cuil='20999999999',
+            provincia='Buenos Aires',
+            localidad='La Plata'
+        )
+        categoria = Categoria.objects.create(nombre='Benchmark tickets', usuario=supermercado)
+        venta = Venta(cajero=supermercado, estado='COMPLETADA', numero_venta='BENCHMARK')
+        venta.save()
+        for i in range(cantidad_items):
+            producto = Producto.objects.create(
+                nombre=f'Producto de prueba {i}',
+                categoria=categoria,
+                precio=Decimal('100.00') + i
+            )
+            ItemVenta.objects.create(
+                venta=venta, producto=producto, cantidad=i % 3 + 1, precio_unitario=producto.precio
+            )
+        return venta.id
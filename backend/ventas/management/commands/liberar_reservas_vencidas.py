@@ -0,0 +1,17 @@
+"""
+Comando Django para liberar las reservas de stock de carritos abandonados.
+Conviene programarlo (cron) cada pocos minutos.
+
+Uso: python manage.py liberar_reservas_vencidas
+"""
+
+from django.core.management.base import BaseCommand
+from ventas.reservas import liberar_reservas_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Libera las reservas de stock más viejas que VENTAS_RESERVA_MINUTOS'
+
+    def handle(self, *args, **options):
+        liberadas = liberar_reservas_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'✅ {liberadas} reservas de stock vencidas liberadas'))
@@ -0,0 +1,17 @@
+"""
+Comando Django para borrar las claves de idempotencia vencidas.
+Conviene programarlo (cron) una vez por hora o por día.
+
+Uso: python manage.py purgar_claves_idempotencia
+"""
+
+from django.core.management.base import BaseCommand
+from ventas.idempotencia import purgar_claves_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves Idempotency-Key más viejas que VENTAS_IDEMPOTENCIA_TTL_HORAS'
+
+    def handle(self, *args, **options):
+        borradas = purgar_claves_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'✅ {borradas} claves de idempotencia vencidas borradas'))
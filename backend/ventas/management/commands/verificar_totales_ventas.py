@@ -0,0 +1,63 @@
+"""
+Comando Django para verificar los totales de las ventas contra sus items.
+Los totales se mantienen por diferencia en cada cambio de item; este comando
+los recalcula desde cero y reporta (o corrige) las ventas que no coinciden.
+
+Uso: python manage.py verificar_totales_ventas [--corregir]
+"""
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from ventas.models import Venta
+
+
+class Command(BaseCommand):
+    help = 'Verifica que subtotal y total de cada venta coincidan con la suma de sus items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corregir',
+            action='store_true',
+            help='Guardar los totales recalculados en las ventas inconsistentes',
+        )
+
+    def handle(self, *args, **options):
+        # Una sola consulta agrupada encuentra todas las ventas inconsistentes
+        inconsistentes = Venta.objects.annotate(
+            suma_items=Coalesce(
+                Sum('items__subtotal'), Decimal('0.00'), output_field=models.DecimalField()
+            )
+        ).exclude(
+            subtotal=F('suma_items'),
+            total=F('suma_items') - F('descuento')
+        ).values_list('id', 'numero_venta', 'subtotal', 'total', 'suma_items', 'descuento')
+
+        inconsistentes = list(inconsistentes)
+        if not inconsistentes:
+            self.stdout.write(self.style.SUCCESS('✅ Todas las ventas tienen totales consistentes'))
+            return
+
+        for venta_id, numero, subtotal, total, suma_items, descuento in inconsistentes:
+            self.stdout.write(
+                f'  • Venta {numero} (id {venta_id}): guardado {subtotal}/{total}, '
+                f'recalculado {suma_items}/{suma_items - descuento}'
+            )
+
+        if not options['corregir']:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {len(inconsistentes)} ventas inconsistentes (use --corregir para arreglarlas)'
+            ))
+            return
+
+        with transaction.atomic():
+            for venta_id, _numero, _subtotal, _total, suma_items, descuento in inconsistentes:
+                Venta.objects.filter(pk=venta_id).update(
+                    subtotal=suma_items,
+                    total=suma_items - descuento
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(inconsistentes)} ventas corregidas'))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ventas', '0004_itemventa_descuento_aplicado_itemventa_oferta_nombre_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='venta',
+            name='numero_venta',
+            field=models.CharField(help_text='Número de la venta, único por supermercado', max_length=20, verbose_name='Número de Venta'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='venta',
+            unique_together={('cajero', 'numero_venta')},
+        ),
+        migrations.CreateModel(
+            name='SecuenciaVenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('ultimo_numero', models.PositiveIntegerField(default=0, help_text='Último número entregado (incluye los reservados en bloques por terminal)', verbose_name='Último Número')),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='secuencias_venta', to=settings.AUTH_USER_MODEL, verbose_name='Supermercado')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Venta',
+                'verbose_name_plural': 'Secuencias de Venta',
+                'unique_together': {('supermercado', 'fecha')},
+            },
+        ),
+    ]
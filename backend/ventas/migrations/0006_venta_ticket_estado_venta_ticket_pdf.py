@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0005_secuenciaventa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='ticket_estado',
+            field=models.CharField(choices=[('SIN_GENERAR', 'Sin Generar'), ('PENDIENTE', 'Pendiente'), ('LISTO', 'Listo'), ('ERROR', 'Error')], default='SIN_GENERAR', help_text='Estado de la generación en segundo plano del ticket PDF', max_length=20, verbose_name='Estado del Ticket'),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='ticket_pdf',
+            field=models.FileField(blank=True, null=True, upload_to='tickets/', verbose_name='Ticket PDF'),
+        ),
+    ]
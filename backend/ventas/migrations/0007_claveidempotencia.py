@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:14
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0006_venta_ticket_estado_venta_ticket_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_usuario', models.CharField(choices=[('ADMIN', 'Administrador'), ('EMPLEADO', 'Empleado')], max_length=10, verbose_name='Tipo de Usuario')),
+                ('usuario_id', models.PositiveIntegerField(verbose_name='ID de Usuario')),
+                ('clave', models.CharField(help_text='Valor del header Idempotency-Key enviado por el cliente', max_length=100, verbose_name='Clave')),
+                ('huella', models.CharField(help_text='SHA-256 de método, ruta y cuerpo, para detectar claves reutilizadas', max_length=64, verbose_name='Huella del Request')),
+                ('codigo_estado', models.PositiveSmallIntegerField(blank=True, help_text='Vacío mientras el request original se está procesando', null=True, verbose_name='Código de Estado')),
+                ('respuesta', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Respuesta')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha de Creación')),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+                'unique_together': {('tipo_usuario', 'usuario_id', 'clave')},
+            },
+        ),
+    ]
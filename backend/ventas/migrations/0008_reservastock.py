@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_alter_producto_precio'),
+        ('ventas', '0007_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(verbose_name='Cantidad')),
+                ('vence', models.DateTimeField(db_index=True, verbose_name='Vence')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='productos.producto', verbose_name='Producto')),
+                ('stock', models.ForeignKey(help_text='Registro de stock del que se descontará la cantidad al finalizar', on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='productos.productodeposito', verbose_name='Stock')),
+                ('venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='ventas.venta', verbose_name='Venta')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Stock',
+                'verbose_name_plural': 'Reservas de Stock',
+                'indexes': [models.Index(fields=['stock', 'vence'], name='reserva_stock_vence_idx')],
+                'unique_together': {('venta', 'producto')},
+            },
+        ),
+    ]
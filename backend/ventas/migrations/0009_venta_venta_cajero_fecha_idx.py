@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0008_reservastock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['cajero', '-fecha_creacion', '-id'], name='venta_cajero_fecha_idx'),
+        ),
+    ]
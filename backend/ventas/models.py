@@ -1,8 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from decimal import Decimal
-from productos.models import Producto
+from productos.models import Producto, ProductoDeposito
 from authentication.models import EmpleadoUser
 
 User = get_user_model()
@@ -18,11 +21,17 @@ class Venta(models.Model):
         ('CANCELADA', 'Cancelada'),
     ]
     
+    TICKET_ESTADO_CHOICES = [
+        ('SIN_GENERAR', 'Sin Generar'),
+        ('PENDIENTE', 'Pendiente'),
+        ('LISTO', 'Listo'),
+        ('ERROR', 'Error'),
+    ]
+    
     numero_venta = models.CharField(
         max_length=20,
-        unique=True,
         verbose_name="Número de Venta",
-        help_text="Número único de la venta"
+        help_text="Número de la venta, único por supermercado"
     )
     
     cajero = models.ForeignKey(
@@ -104,6 +113,21 @@ class Venta(models.Model):
         verbose_name="PDF Generado"
     )
     
+    ticket_estado = models.CharField(
+        max_length=20,
+        choices=TICKET_ESTADO_CHOICES,
+        default='SIN_GENERAR',
+        verbose_name="Estado del Ticket",
+        help_text="Estado de la generación en segundo plano del ticket PDF"
+    )
+    
+    ticket_pdf = models.FileField(
+        upload_to='tickets/',
+        blank=True,
+        null=True,
+        verbose_name="Ticket PDF"
+    )
+    
     enviado_whatsapp = models.BooleanField(
         default=False,
         verbose_name="Enviado por WhatsApp"
@@ -113,39 +137,224 @@ class Venta(models.Model):
         verbose_name = "Venta"
         verbose_name_plural = "Ventas"
         ordering = ['-fecha_creacion']
+        unique_together = ['cajero', 'numero_venta']
+        indexes = [
+            # Ventas del supermercado paginadas por cursor (más nuevas primero)
+            models.Index(fields=['cajero', '-fecha_creacion', '-id'], name='venta_cajero_fecha_idx'),
+        ]
         
     def __str__(self):
         return f"Venta {self.numero_venta} - {self.cajero} - ${self.total}"
     
     def calcular_total(self):
-        """Calcula el total de la venta sumando todos los items"""
-        total_items = sum(item.subtotal for item in self.items.all())
+        """Recalcula subtotal y total desde los items (no guarda)"""
+        total_items = self.items.aggregate(
+            suma=Coalesce(Sum('subtotal'), Decimal('0.00'), output_field=models.DecimalField())
+        )['suma']
         self.subtotal = total_items
         self.total = self.subtotal - self.descuento
         return self.total
     
-    def generar_numero_venta(self):
-        """Genera un número único de venta"""
-        import datetime
-        from django.db.models import Max
+    def aplicar_delta_total(self, delta):
+        """
+        Suma `delta` al subtotal y al total con aritmética en la base de datos.
+        Los items lo usan al agregarse, modificarse o eliminarse para no recalcular
+        la venta completa en cada cambio.
+        """
+        Venta.objects.filter(pk=self.pk).update(
+            subtotal=F('subtotal') + delta,
+            total=F('total') + delta
+        )
+        self.subtotal += delta
+        self.total += delta
+    
+    def verificar_total(self, corregir=False):
+        """
+        Compara los totales guardados con los recalculados desde los items.
+        Devuelve True si coinciden; con corregir=True guarda los valores recalculados.
+        """
+        self.refresh_from_db(fields=['subtotal', 'descuento', 'total'])
+        subtotal_guardado, total_guardado = self.subtotal, self.total
+        self.calcular_total()
         
-        today = datetime.date.today()
-        prefix = f"{today.strftime('%Y%m%d')}"
+        correcto = self.subtotal == subtotal_guardado and self.total == total_guardado
+        if not correcto:
+            if corregir:
+                self.save(update_fields=['subtotal', 'total'])
+            else:
+                self.subtotal, self.total = subtotal_guardado, total_guardado
+        return correcto
+    
+    def solicitar_ticket(self):
+        """
+        Encola la generación del ticket PDF para que la haga el worker de tareas.
+        Llamada dentro de una transacción, la tarea solo existe si la venta se confirma.
+        """
+        from tareas.cola import encolar
         
-        # Obtener el último número de venta del día
-        ultimo_numero = Venta.objects.filter(
-            numero_venta__startswith=prefix
-        ).aggregate(
-            max_numero=Max('numero_venta')
-        )['max_numero']
+        self.ticket_estado = 'PENDIENTE'
+        Venta.objects.filter(pk=self.pk).update(ticket_estado='PENDIENTE')
+        encolar('ventas.generar_ticket', venta_id=self.pk)
+    
+    def nombre_archivo_ticket(self, extension='pdf'):
+        """Ruta (relativa a MEDIA_ROOT) del único archivo de ticket de esta venta"""
+        return f"tickets/{self.cajero_id}/venta_{self.pk}.{extension}"
+    
+    def generar_numero_venta(self, terminal=None):
+        """
+        Asigna el próximo número de venta del día para el supermercado de la venta.
+        El número sale de la secuencia diaria del supermercado (ver ventas.numeracion),
+        sin recorrer las ventas existentes.
+        """
+        from django.utils import timezone
+        from .numeracion import asignador_numeros
         
-        if ultimo_numero:
-            # Extraer el sufijo y incrementarlo
-            sufijo = int(ultimo_numero[-4:]) + 1
-        else:
-            sufijo = 1
-            
-        self.numero_venta = f"{prefix}{sufijo:04d}"
+        fecha = timezone.localdate()
+        numero = asignador_numeros.siguiente(self.cajero_id, fecha, terminal)
+        self.numero_venta = f"{fecha.strftime('%Y%m%d')}{numero:04d}"
+
+
+class SecuenciaVenta(models.Model):
+    """Último número de venta entregado por supermercado y día"""
+    
+    supermercado = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='secuencias_venta',
+        verbose_name="Supermercado"
+    )
+    
+    fecha = models.DateField(
+        verbose_name="Fecha"
+    )
+    
+    ultimo_numero = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Último Número",
+        help_text="Último número entregado (incluye los reservados en bloques por terminal)"
+    )
+
+    class Meta:
+        verbose_name = "Secuencia de Venta"
+        verbose_name_plural = "Secuencias de Venta"
+        unique_together = ['supermercado', 'fecha']
+        
+    def __str__(self):
+        return f"{self.supermercado_id} - {self.fecha}: {self.ultimo_numero}"
+
+
+class ReservaStock(models.Model):
+    """
+    Cantidad de un producto apartada por una venta en curso. Mientras no vence,
+    esa cantidad no está disponible para otras cajas. Se renueva con cada cambio
+    del carrito y se libera al finalizar, cancelar o vencer.
+    """
+    
+    venta = models.ForeignKey(
+        Venta,
+        on_delete=models.CASCADE,
+        related_name='reservas',
+        verbose_name="Venta"
+    )
+    
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='reservas',
+        verbose_name="Producto"
+    )
+    
+    stock = models.ForeignKey(
+        ProductoDeposito,
+        on_delete=models.CASCADE,
+        related_name='reservas',
+        verbose_name="Stock",
+        help_text="Registro de stock del que se descontará la cantidad al finalizar"
+    )
+    
+    cantidad = models.PositiveIntegerField(
+        verbose_name="Cantidad"
+    )
+    
+    vence = models.DateTimeField(
+        db_index=True,
+        verbose_name="Vence"
+    )
+
+    class Meta:
+        verbose_name = "Reserva de Stock"
+        verbose_name_plural = "Reservas de Stock"
+        unique_together = ['venta', 'producto']
+        indexes = [
+            models.Index(fields=['stock', 'vence'], name='reserva_stock_vence_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Venta {self.venta_id}: {self.producto_id} x{self.cantidad} hasta {self.vence}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de un request de caja enviado con Idempotency-Key.
+    Si el cliente reintenta con la misma clave se devuelve esta respuesta en
+    lugar de volver a ejecutar la operación.
+    """
+    
+    TIPO_USUARIO_CHOICES = [
+        ('ADMIN', 'Administrador'),
+        ('EMPLEADO', 'Empleado'),
+    ]
+    
+    # Admins y empleados son tablas distintas con ids que se pueden repetir
+    tipo_usuario = models.CharField(
+        max_length=10,
+        choices=TIPO_USUARIO_CHOICES,
+        verbose_name="Tipo de Usuario"
+    )
+    
+    usuario_id = models.PositiveIntegerField(
+        verbose_name="ID de Usuario"
+    )
+    
+    clave = models.CharField(
+        max_length=100,
+        verbose_name="Clave",
+        help_text="Valor del header Idempotency-Key enviado por el cliente"
+    )
+    
+    huella = models.CharField(
+        max_length=64,
+        verbose_name="Huella del Request",
+        help_text="SHA-256 de método, ruta y cuerpo, para detectar claves reutilizadas"
+    )
+    
+    codigo_estado = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Código de Estado",
+        help_text="Vacío mientras el request original se está procesando"
+    )
+    
+    respuesta = models.JSONField(
+        null=True,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name="Respuesta"
+    )
+    
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name="Fecha de Creación"
+    )
+
+    class Meta:
+        verbose_name = "Clave de Idempotencia"
+        verbose_name_plural = "Claves de Idempotencia"
+        unique_together = ['tipo_usuario', 'usuario_id', 'clave']
+        
+    def __str__(self):
+        return f"{self.tipo_usuario} {self.usuario_id}: {self.clave}"
 
 
 class ItemVenta(models.Model):
@@ -225,11 +434,48 @@ class ItemVenta(models.Model):
     def __str__(self):
         return f"{self.producto.nombre} x{self.cantidad} - ${self.subtotal}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Recordar el subtotal persistido para aplicar solo la diferencia a la venta
+        instance._subtotal_guardado = instance.__dict__.get('subtotal')
+        return instance
+    
+    def _subtotal_anterior(self):
+        """Subtotal que este item aporta hoy al total de la venta"""
+        if self._state.adding:
+            return Decimal('0.00')
+        anterior = getattr(self, '_subtotal_guardado', None)
+        if anterior is None:
+            anterior = ItemVenta.objects.filter(pk=self.pk).values_list('subtotal', flat=True).first()
+        return anterior or Decimal('0.00')
+    
+    def _aplicar_delta_venta(self, delta):
+        """Aplica la diferencia de subtotal a la venta sin releer sus items"""
+        if not delta:
+            return
+        if ItemVenta.venta.is_cached(self):
+            self.venta.aplicar_delta_total(delta)
+        else:
+            Venta.objects.filter(pk=self.venta_id).update(
+                subtotal=F('subtotal') + delta,
+                total=F('total') + delta
+            )
+    
     def save(self, *args, **kwargs):
-        """Calcula automáticamente el subtotal antes de guardar"""
+        """Calcula automáticamente el subtotal y actualiza el total de la venta por diferencia"""
         self.subtotal = self.cantidad * self.precio_unitario
+        anterior = self._subtotal_anterior()
         super().save(*args, **kwargs)
         
-        # Actualizar el total de la venta
-        self.venta.calcular_total()
-        self.venta.save(update_fields=['subtotal', 'total'])
+        self._aplicar_delta_venta(self.subtotal - anterior)
+        self._subtotal_guardado = self.subtotal
+    
+    def delete(self, *args, **kwargs):
+        """Elimina el item y descuenta su subtotal del total de la venta"""
+        anterior = self._subtotal_anterior()
+        resultado = super().delete(*args, **kwargs)
+        
+        self._aplicar_delta_venta(-anterior)
+        self._subtotal_guardado = None
+        return resultado
@@ -0,0 +1,77 @@
+"""
+Asignación de números de venta.
+
+Cada supermercado tiene una secuencia por día (SecuenciaVenta). Reservar
+números es un UPDATE con incremento atómico sobre esa única fila, así que
+cuesta lo mismo sin importar cuántas ventas haya y dos cajeros nunca reciben
+el mismo número. Las terminales pueden pedir bloques de números para no tocar
+la base en cada venta (setting VENTAS_BLOQUE_NUMERACION).
+"""
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import SecuenciaVenta
+
+
+def reservar_numeros(supermercado_id, fecha, cantidad=1):
+    """
+    Reserva `cantidad` números consecutivos de la secuencia del día y devuelve
+    el rango reservado. Conviene llamarla fuera de transacciones largas: la fila
+    de la secuencia queda bloqueada hasta que termina la transacción que la usa.
+    """
+    secuencia = SecuenciaVenta.objects.filter(supermercado_id=supermercado_id, fecha=fecha)
+
+    with transaction.atomic():
+        if not secuencia.update(ultimo_numero=F('ultimo_numero') + cantidad):
+            try:
+                with transaction.atomic():
+                    SecuenciaVenta.objects.create(
+                        supermercado_id=supermercado_id,
+                        fecha=fecha,
+                        ultimo_numero=cantidad
+                    )
+                return range(1, cantidad + 1)
+            except IntegrityError:
+                # Otro cajero creó la secuencia del día al mismo tiempo
+                secuencia.update(ultimo_numero=F('ultimo_numero') + cantidad)
+
+        ultimo = secuencia.values_list('ultimo_numero', flat=True).get()
+
+    return range(ultimo - cantidad + 1, ultimo + 1)
+
+
+class AsignadorNumerosVenta:
+    """
+    Entrega números de venta de a uno. Sin terminal (o con bloques de tamaño 1)
+    cada número se reserva en la base; con terminal se reserva un bloque y se
+    consume en memoria. Los números de un bloque no usado quedan como huecos.
+    """
+
+    def __init__(self):
+        self._bloques = {}
+        self._lock = threading.Lock()
+
+    def siguiente(self, supermercado_id, fecha, terminal=None):
+        tamano_bloque = getattr(settings, 'VENTAS_BLOQUE_NUMERACION', 1)
+        if terminal is None or tamano_bloque <= 1:
+            return reservar_numeros(supermercado_id, fecha)[0]
+
+        clave = (supermercado_id, fecha, terminal)
+        with self._lock:
+            bloque = self._bloques.get(clave)
+            numero = next(bloque, None) if bloque else None
+            if numero is None:
+                # Descartar bloques de días anteriores de esta terminal
+                self._bloques = {
+                    k: v for k, v in self._bloques.items() if k[1] == fecha
+                }
+                bloque = iter(reservar_numeros(supermercado_id, fecha, tamano_bloque))
+                self._bloques[clave] = bloque
+                numero = next(bloque)
+        return numero
+
+
+asignador_numeros = AsignadorNumerosVenta()
@@ -7,25 +7,21 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from datetime import datetime
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
 import os
+import threading
 from django.conf import settings
-from .serializers import obtener_supermercado_usuario
+from django.db.models import Prefetch
+from .models import Venta, ItemVenta
+from .ticket_base import DatosTicketMixin
 
-class TicketPDFGenerator:
+class TicketPDFGenerator(DatosTicketMixin):
     """Generador de tickets de venta en formato PDF"""
     
     def __init__(self, venta):
         self.venta = venta
         self.buffer = BytesIO()
-    
-    def get_supermercado_info(self):
-        """Obtiene la información del supermercado"""
-        supermercado = obtener_supermercado_usuario(self.venta.cajero)
-        return {
-            'nombre': supermercado.nombre_supermercado if hasattr(supermercado, 'nombre_supermercado') else 'SUPERMERCADO',
-            'user': supermercado
-        }
         
     def generate_ticket(self):
         """Genera el ticket en formato PDF"""
@@ -182,14 +178,10 @@ class TicketPDFGenerator:
         return response
     
     def save_pdf_file(self, filepath=None):
-        """Guarda el PDF en el sistema de archivos"""
+        """Guarda el PDF en el sistema de archivos (por defecto, el archivo de ticket de la venta)"""
         if not filepath:
-            # Crear directorio para tickets si no existe
-            tickets_dir = os.path.join(settings.MEDIA_ROOT, 'tickets')
-            os.makedirs(tickets_dir, exist_ok=True)
-            
-            filename = f"ticket_{self.venta.numero_venta}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            filepath = os.path.join(tickets_dir, filename)
+            filepath = os.path.join(settings.MEDIA_ROOT, self.venta.nombre_archivo_ticket())
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
         pdf_buffer = self.generate_ticket()
         
@@ -199,19 +191,183 @@ class TicketPDFGenerator:
         return filepath
 
 
+class TicketCanvasRenderer(TicketPDFGenerator):
+    """
+    Generador de tickets que dibuja directamente sobre el canvas.
+    
+    El ticket tiene un diseño fijo de 80mm, así que no hace falta el motor de
+    maquetado de platypus: las posiciones se calculan una vez por línea. Las
+    fuentes, anchos de columna y el encabezado de cada supermercado se arman
+    una sola vez por proceso, y los items se leen con su producto en una
+    sola consulta (o desde el prefetch 'items__producto' si ya está hecho).
+    """
+    
+    ANCHO = 80 * mm
+    MARGEN = 3 * mm
+    MARGEN_VERTICAL = 5 * mm
+    ALTO_LINEA = 3.8 * mm
+    FUENTE = 'Helvetica'
+    FUENTE_NEGRITA = 'Helvetica-Bold'
+    # Borde derecho de cada columna de items: Producto, Cant., P.Unit, Subtotal
+    COLUMNAS = (41 * mm, 50 * mm, 63 * mm, 77 * mm)
+    SEPARADOR = '=' * 40
+    
+    _encabezados = {}
+    _lock_encabezados = threading.Lock()
+    
+    def get_encabezado(self):
+        """Líneas del encabezado del supermercado, armadas una vez por proceso"""
+        info = self.get_supermercado_info()
+        clave = (getattr(info['user'], 'pk', None), info['nombre'])
+        encabezado = self._encabezados.get(clave)
+        if encabezado is None:
+            encabezado = simpleSplit(info['nombre'].upper(), self.FUENTE_NEGRITA, 14, self.ANCHO - 2 * self.MARGEN)
+            with self._lock_encabezados:
+                self._encabezados[clave] = encabezado
+        return encabezado
+    
+    def get_lineas_observaciones(self):
+        if not self.venta.observaciones:
+            return []
+        return simpleSplit(
+            f"Observaciones: {self.venta.observaciones}", self.FUENTE, 8, self.ANCHO - 2 * self.MARGEN
+        )
+    
+    def _escribir(self, x, y, cadena, fuente, tamano, alineacion='izquierda'):
+        """Agrega `cadena` al objeto de texto del ticket alineada respecto de x"""
+        if alineacion != 'izquierda':
+            ancho = stringWidth(cadena, fuente, tamano)
+            x -= ancho if alineacion == 'derecha' else ancho / 2
+        if self._fuente != (fuente, tamano):
+            self._texto.setFont(fuente, tamano)
+            self._fuente = (fuente, tamano)
+        self._texto.setTextOrigin(x, y)
+        self._texto.textOut(cadena)
+    
+    def generate_ticket(self):
+        """Genera el ticket en formato PDF"""
+        encabezado = self.get_encabezado()
+        items = self.get_items()
+        observaciones = self.get_lineas_observaciones()
+        con_descuento = self.venta.descuento and self.venta.descuento > 0
+        
+        # El largo de la página se ajusta al contenido: el ticket sale en una sola hoja
+        lineas = (
+            len(encabezado) * 1.4 + 9 + (1 if self.venta.cliente_telefono else 0)
+            + len(items) + (2 if con_descuento else 0) + 6 + len(observaciones)
+        )
+        alto = lineas * self.ALTO_LINEA + 2 * self.MARGEN_VERTICAL
+        
+        pdf = canvas.Canvas(self.buffer, pagesize=(self.ANCHO, alto))
+        # Todo el texto va en un único objeto de texto: evita abrir y cerrar
+        # un bloque BT/ET por cada string como hacen drawString y compañía
+        self._texto = pdf.beginText()
+        self._fuente = None
+        centro = self.ANCHO / 2
+        derecha = self.ANCHO - self.MARGEN
+        y = alto - self.MARGEN_VERTICAL - 4 * mm
+        
+        # Encabezado
+        for linea in encabezado:
+            self._escribir(centro, y, linea, self.FUENTE_NEGRITA, 14, 'centro')
+            y -= 1.4 * self.ALTO_LINEA
+        self._escribir(centro, y, "TICKET DE VENTA", self.FUENTE, 8, 'centro')
+        y -= 1.5 * self.ALTO_LINEA
+        
+        # Información de la venta
+        datos = [
+            ("N° Venta:", self.venta.numero_venta),
+            ("Fecha:", self.venta.fecha_creacion.strftime('%d/%m/%Y %H:%M')),
+            ("Cajero:", self.get_cajero_nombre()),
+        ]
+        if self.venta.cliente_telefono:
+            datos.append(("Cliente:", self.venta.cliente_telefono))
+        for etiqueta, valor in datos:
+            self._escribir(self.MARGEN, y, etiqueta, self.FUENTE_NEGRITA, 8)
+            self._escribir(self.MARGEN + 15 * mm, y, str(valor), self.FUENTE, 8)
+            y -= self.ALTO_LINEA
+        
+        y -= 0.5 * self.ALTO_LINEA
+        self._escribir(centro, y, self.SEPARADOR, self.FUENTE, 8, 'centro')
+        y -= self.ALTO_LINEA
+        
+        # Items de la venta
+        self._escribir(self.MARGEN, y, "Producto", self.FUENTE_NEGRITA, 7)
+        for borde, titulo in zip(self.COLUMNAS[1:], ("Cant.", "P.Unit", "Subtotal")):
+            self._escribir(borde, y, titulo, self.FUENTE_NEGRITA, 7, 'derecha')
+        y -= self.ALTO_LINEA
+        
+        for item in items:
+            self._escribir(self.MARGEN, y, item.producto.nombre[:24], self.FUENTE, 7)
+            self._escribir(self.COLUMNAS[1], y, str(item.cantidad), self.FUENTE, 7, 'derecha')
+            self._escribir(self.COLUMNAS[2], y, f"${item.precio_unitario}", self.FUENTE, 7, 'derecha')
+            self._escribir(self.COLUMNAS[3], y, f"${item.subtotal}", self.FUENTE, 7, 'derecha')
+            y -= self.ALTO_LINEA
+        
+        # Totales
+        self._escribir(centro, y, self.SEPARADOR, self.FUENTE, 8, 'centro')
+        y -= 1.2 * self.ALTO_LINEA
+        
+        if con_descuento:
+            self._escribir(derecha, y, f"Subtotal: ${self.venta.subtotal}", self.FUENTE_NEGRITA, 10, 'derecha')
+            y -= self.ALTO_LINEA
+            self._escribir(derecha, y, f"Descuento: -${self.venta.descuento}", self.FUENTE_NEGRITA, 10, 'derecha')
+            y -= self.ALTO_LINEA
+        
+        self._escribir(centro, y, f"TOTAL: ${self.venta.total}", self.FUENTE_NEGRITA, 14, 'centro')
+        y -= 1.8 * self.ALTO_LINEA
+        
+        # Pie del ticket
+        self._escribir(centro, y, "¡Gracias por su compra!", self.FUENTE, 8, 'centro')
+        y -= self.ALTO_LINEA
+        
+        for linea in observaciones:
+            self._escribir(self.MARGEN, y, linea, self.FUENTE, 8)
+            y -= self.ALTO_LINEA
+        
+        self._escribir(centro, y, self.SEPARADOR, self.FUENTE, 8, 'centro')
+        pdf.drawText(self._texto)
+        
+        pdf.showPage()
+        pdf.save()
+        
+        # Volver al inicio del buffer
+        self.buffer.seek(0)
+        
+        return self.buffer
+
+
+def cargar_venta_para_ticket(venta_id):
+    """Venta con cajero e items+producto precargados (dos consultas en total)"""
+    return Venta.objects.select_related('cajero', 'empleado_cajero').prefetch_related(
+        Prefetch('items', queryset=ItemVenta.objects.select_related('producto'))
+    ).get(pk=venta_id)
+
+
+def crear_generador_ticket(venta):
+    """
+    Devuelve el generador de tickets configurado en VENTAS_TICKET_RENDERER:
+    'canvas' (por defecto, dibujo directo) o 'platypus' (generador original).
+    """
+    if getattr(settings, 'VENTAS_TICKET_RENDERER', 'canvas') == 'platypus':
+        return TicketPDFGenerator(venta)
+    return TicketCanvasRenderer(venta)
+
+
 def generar_ticket_pdf(venta):
     """Función helper para generar ticket PDF"""
-    generator = TicketPDFGenerator(venta)
+    generator = crear_generador_ticket(venta)
     return generator.generate_ticket()
 
 
 def generar_ticket_pdf_response(venta, filename=None):
     """Función helper para generar respuesta HTTP con PDF"""
-    generator = TicketPDFGenerator(venta)
+    generator = crear_generador_ticket(venta)
     return generator.get_pdf_response(filename)
 
 
 def guardar_ticket_pdf(venta, filepath=None):
     """Función helper para guardar PDF en archivo"""
-    generator = TicketPDFGenerator(venta)
-    return generator.save_pdf_file(filepath)
\ No newline at end of file
+    generator = crear_generador_ticket(venta)
+    return generator.save_pdf_file(filepath)
+
@@ -0,0 +1,72 @@
+"""
+Reservas de stock para los carritos en curso.
+
+Agregar o modificar un item aparta la cantidad del carrito con un vencimiento
+(VENTAS_RESERVA_MINUTOS). Otras cajas ven ese stock como no disponible hasta
+que la venta se finaliza, se cancela o la reserva vence. Cada cambio del
+carrito renueva el vencimiento de todas sus reservas; los carritos abandonados
+se liberan en bloque con `python manage.py liberar_reservas_vencidas`.
+
+Las reservas no cambian la versión del catálogo: el catálogo de las cajas
+las descuenta al leer su copia en caché (ver ventas.catalogo).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ReservaStock
+from .services import StockInsuficienteError, bloquear_stocks, reservas_activas
+
+
+def vencimiento_reserva():
+    """Momento en que vence una reserva hecha ahora"""
+    return timezone.now() + timedelta(minutes=getattr(settings, 'VENTAS_RESERVA_MINUTOS', 15))
+
+
+def reservar_stock(venta, producto, cantidad, supermercado):
+    """
+    Reserva `cantidad` (la cantidad total del item, no un incremento) de `producto`
+    para la venta. Lanza StockInsuficienteError si el stock menos lo reservado por
+    otros carritos no alcanza.
+    """
+    with transaction.atomic():
+        # Bloquear el registro de stock serializa las reservas del mismo producto
+        stock = bloquear_stocks([producto.id], supermercado, venta=venta).get(producto.id)
+        disponible = stock.cantidad - stock.reservado if stock else 0
+
+        if disponible < cantidad:
+            raise StockInsuficienteError([{
+                'producto_id': producto.id,
+                'producto_nombre': producto.nombre,
+                'disponible': max(disponible, 0),
+                'necesario': cantidad,
+            }])
+
+        vence = vencimiento_reserva()
+        # Cualquier cambio del carrito mantiene vivas todas sus reservas
+        venta.reservas.update(vence=vence)
+        actualizada = venta.reservas.filter(producto=producto).update(stock=stock, cantidad=cantidad)
+        if not actualizada:
+            ReservaStock.objects.create(
+                venta=venta,
+                producto=producto,
+                stock=stock,
+                cantidad=cantidad,
+                vence=vence
+            )
+
+
+def liberar_reserva(venta, producto=None):
+    """Libera las reservas de la venta (o solo la de `producto`)"""
+    reservas = venta.reservas.all()
+    if producto is not None:
+        reservas = reservas.filter(producto=producto)
+    reservas.delete()
+
+
+def liberar_reservas_vencidas():
+    """Borra de una vez todas las reservas vencidas; devuelve cuántas se liberaron"""
+    liberadas, _ = ReservaStock.objects.filter(vence__lte=timezone.now()).delete()
+    return liberadas
@@ -15,6 +15,39 @@ def obtener_supermercado_usuario(user):
         return user
 
 
+def obtener_terminal(request):
+    """Identificador de la caja que hace el request (header X-Terminal-Id), si lo envía"""
+    return request.headers.get('X-Terminal-Id') or None
+
+
+def obtener_datos_cajero(user):
+    """
+    Verifica que el usuario pueda realizar ventas y devuelve los campos
+    cajero/empleado_cajero que corresponden a la venta.
+    """
+    puede_realizar_ventas = False
+    
+    if hasattr(user, 'puesto'):
+        # Es un EmpleadoUser - verificar que sea cajero
+        if user.puesto == 'CAJERO':
+            puede_realizar_ventas = True
+    elif hasattr(user, 'nombre_supermercado') or user.is_staff:
+        # Es un User admin de supermercado o staff
+        puede_realizar_ventas = True
+    
+    if not puede_realizar_ventas:
+        raise serializers.ValidationError(
+            "Solo los administradores y cajeros pueden realizar ventas."
+        )
+    
+    if hasattr(user, 'puesto'):
+        # Es un EmpleadoUser - su supermercado figura como cajero y él como empleado_cajero
+        return {'cajero': user.supermercado, 'empleado_cajero': user}
+    
+    # Es un User admin - asignarlo directamente
+    return {'cajero': user}
+
+
 class ItemVentaSerializer(serializers.ModelSerializer):
     producto_nombre = serializers.CharField(source='producto.nombre', read_only=True)
     tiene_descuento = serializers.SerializerMethodField()
@@ -90,11 +123,11 @@ class VentaSerializer(serializers.ModelSerializer):
             'id', 'numero_venta', 'cajero', 'cajero_nombre', 'cliente_telefono',
             'subtotal', 'descuento', 'total', 'estado', 'fecha_creacion', 
             'fecha_completada', 'observaciones', 'ticket_pdf_generado', 
-            'enviado_whatsapp', 'items', 'numero_items'
+            'ticket_estado', 'enviado_whatsapp', 'items', 'numero_items'
         ]
         read_only_fields = [
             'id', 'numero_venta', 'cajero', 'empleado_cajero', 'subtotal', 'total', 
-            'fecha_creacion', 'fecha_completada', 'ticket_pdf_generado',
+            'fecha_creacion', 'fecha_completada', 'ticket_pdf_generado', 'ticket_estado',
             'enviado_whatsapp', 'cajero_nombre', 'numero_items'
         ]
     
@@ -139,127 +172,51 @@ class VentaSerializer(serializers.ModelSerializer):
         """Crea una nueva venta"""
         user = self.context['request'].user
         
-        # Verificar que el usuario puede realizar ventas
-        puede_realizar_ventas = False
-        
-        if hasattr(user, 'puesto'):
-            # Es un EmpleadoUser - verificar que sea cajero
-            if user.puesto == 'CAJERO':
-                puede_realizar_ventas = True
-        elif hasattr(user, 'nombre_supermercado') or user.is_staff:
-            # Es un User admin de supermercado o staff
-            puede_realizar_ventas = True
-        
-        if not puede_realizar_ventas:
-            raise serializers.ValidationError(
-                "Solo los administradores y cajeros pueden realizar ventas."
-            )
-        
-        # Asignar el usuario correcto como cajero
-        if hasattr(user, 'puesto'):
-            # Es un EmpleadoUser - asignar su supermercado como cajero y guardarlo como empleado_cajero
-            validated_data['cajero'] = user.supermercado
-            validated_data['empleado_cajero'] = user
-        else:
-            # Es un User admin - asignarlo directamente
-            validated_data['cajero'] = user
-        
-        # Crear la venta
-        venta = Venta.objects.create(**validated_data)
+        # Verificar que el usuario puede realizar ventas y asignar el cajero correcto
+        validated_data.update(obtener_datos_cajero(user))
         
-        # Generar número de venta
-        venta.generar_numero_venta()
+        # Generar número de venta (por terminal si la caja se identifica) y crear la venta
+        venta = Venta(**validated_data)
+        venta.generar_numero_venta(obtener_terminal(self.context['request']))
         venta.save()
         
         return venta
 
 
 class CrearItemVentaSerializer(serializers.Serializer):
-    """Serializer para agregar items a una venta"""
-    producto_id = serializers.IntegerField()
+    """
+    Serializer para agregar items a una venta, por id de producto o por código de barras.
+    El stock no se valida aquí: lo verifica la reserva del carrito (ver ventas.reservas).
+    """
+    producto_id = serializers.IntegerField(required=False)
+    codigo_barras = serializers.CharField(required=False, max_length=50)
     cantidad = serializers.IntegerField(min_value=1)
     
-    def validate_producto_id(self, value):
-        """Validar que el producto existe y está activo"""
-        try:
-            producto = Producto.objects.get(id=value, activo=True)
-            return value
-        except Producto.DoesNotExist:
-            raise serializers.ValidationError("El producto no existe o no está activo.")
-    
     def validate(self, data):
-        """Validaciones adicionales"""
-        producto_id = data.get('producto_id')
-        cantidad = data.get('cantidad')
-        
-        if producto_id and cantidad:
-            producto = Producto.objects.get(id=producto_id)
-            
-            # Verificar stock disponible
-            cajero_supermercado = obtener_supermercado_usuario(self.context['request'].user)
+        """Validar que el producto existe y está activo (una sola consulta)"""
+        if 'codigo_barras' in data:
+            from .escaneo import resolver_producto_id
             
-            try:
-                producto_deposito = ProductoDeposito.objects.filter(
-                    producto=producto,
-                    deposito__supermercado=cajero_supermercado,
-                    deposito__activo=True
-                ).first()
-                
-                if not producto_deposito:
-                    raise serializers.ValidationError(
-                        f"El producto {producto.nombre} no está disponible en ningún depósito."
-                    )
-                
-                if producto_deposito.cantidad < cantidad:
-                    raise serializers.ValidationError(
-                        f"Stock insuficiente para {producto.nombre}. "
-                        f"Stock disponible: {producto_deposito.cantidad}, solicitado: {cantidad}"
-                    )
-                    
-            except Exception as e:
-                raise serializers.ValidationError(f"Error al verificar stock: {str(e)}")
+            supermercado = obtener_supermercado_usuario(self.context['request'].user)
+            data['producto_id'] = resolver_producto_id(supermercado, data['codigo_barras'].strip())
+            if data['producto_id'] is None:
+                raise serializers.ValidationError({'codigo_barras': "No hay ningún producto con este código de barras."})
+        elif 'producto_id' not in data:
+            raise serializers.ValidationError({'producto_id': "Indique producto_id o codigo_barras."})
         
+        try:
+            data['producto'] = Producto.objects.get(id=data['producto_id'], activo=True)
+        except Producto.DoesNotExist:
+            raise serializers.ValidationError({'producto_id': "El producto no existe o no está activo."})
         return data
 
 
 class ActualizarItemVentaSerializer(serializers.Serializer):
-    """Serializer para actualizar la cantidad de un item en una venta"""
+    """
+    Serializer para actualizar la cantidad de un item en una venta.
+    El stock no se valida aquí: lo verifica la reserva del carrito (ver ventas.reservas).
+    """
     cantidad = serializers.IntegerField(min_value=1)
-    
-    def validate_cantidad(self, value):
-        """Validar que hay stock suficiente para la nueva cantidad"""
-        if hasattr(self, 'instance') and self.instance:
-            item = self.instance
-            producto = item.producto
-            
-            # Verificar stock disponible (considerando la cantidad actual del item)
-            cajero_supermercado = obtener_supermercado_usuario(self.context['request'].user)
-            
-            try:
-                producto_deposito = ProductoDeposito.objects.filter(
-                    producto=producto,
-                    deposito__supermercado=cajero_supermercado,
-                    deposito__activo=True
-                ).first()
-                
-                if not producto_deposito:
-                    raise serializers.ValidationError(
-                        f"El producto {producto.nombre} no está disponible en ningún depósito."
-                    )
-                
-                # Stock disponible = stock actual + cantidad ya reservada en este item
-                stock_disponible = producto_deposito.cantidad + item.cantidad
-                
-                if stock_disponible < value:
-                    raise serializers.ValidationError(
-                        f"Stock insuficiente para {producto.nombre}. "
-                        f"Stock disponible: {stock_disponible}, solicitado: {value}"
-                    )
-                    
-            except Exception as e:
-                raise serializers.ValidationError(f"Error al verificar stock: {str(e)}")
-        
-        return value
 
 
 class FinalizarVentaSerializer(serializers.Serializer):
@@ -284,6 +241,29 @@ class FinalizarVentaSerializer(serializers.Serializer):
         return value
 
 
+class ItemCheckoutSerializer(serializers.Serializer):
+    """Línea del carrito enviada en el checkout"""
+    producto_id = serializers.IntegerField()
+    cantidad = serializers.IntegerField(min_value=1)
+
+
+class CheckoutVentaSerializer(FinalizarVentaSerializer):
+    """Serializer para registrar una venta completa (carrito + cierre) en un solo request"""
+    items = ItemCheckoutSerializer(many=True, allow_empty=False)
+    
+    def validate_items(self, value):
+        """Agrupa líneas repetidas del mismo producto sumando sus cantidades"""
+        cantidades = {}
+        for item in value:
+            producto_id = item['producto_id']
+            cantidades[producto_id] = cantidades.get(producto_id, 0) + item['cantidad']
+        
+        return [
+            {'producto_id': producto_id, 'cantidad': cantidad}
+            for producto_id, cantidad in cantidades.items()
+        ]
+
+
 class HistorialVentaSerializer(serializers.ModelSerializer):
     """Serializer para el historial de ventas (solo para administradores)"""
     cajero_nombre = serializers.SerializerMethodField()
@@ -304,7 +284,8 @@ class HistorialVentaSerializer(serializers.ModelSerializer):
             'total',
             'total_formateado',
             'estado',
-            'ticket_pdf_generado'
+            'ticket_pdf_generado',
+            'ticket_estado'
         ]
     
     def get_cajero_nombre(self, obj):
@@ -0,0 +1,246 @@
+"""
+Operaciones de venta que trabajan sobre todos los items de una vez.
+
+Resuelven productos, ofertas y stock con una consulta por conjunto en lugar
+de una por item, para que el costo de cerrar una venta no crezca con el
+tamaño del carrito.
+"""
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, When, F, Q, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Venta, ItemVenta, ReservaStock
+from productos.models import Producto, ProductoDeposito, crear_notificaciones_stock_minimo
+from productos.estadisticas import marcar_estadisticas
+from productos.versiones import incrementar_version
+
+
+class StockInsuficienteError(Exception):
+    """Se lanza cuando uno o más productos de la venta no tienen stock suficiente"""
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        detalle = '; '.join(
+            f"{f['producto_nombre']} (disponible: {f['disponible']}, necesario: {f['necesario']})"
+            for f in faltantes
+        )
+        super().__init__(f"Stock insuficiente para: {detalle}")
+
+
+def precio_item(producto, mejor_oferta=None):
+    """Devuelve los campos de precio de un ItemVenta según la oferta vigente del producto"""
+    if mejor_oferta:
+        # Aplicar precio con descuento
+        return {
+            'precio_unitario': mejor_oferta.precio_con_descuento,
+            'precio_original': producto.precio,
+            'descuento_aplicado': producto.precio - mejor_oferta.precio_con_descuento,
+            'oferta_nombre': mejor_oferta.oferta.nombre,
+        }
+
+    # Precio normal sin oferta
+    return {
+        'precio_unitario': producto.precio,
+        'precio_original': None,
+        'descuento_aplicado': Decimal('0.00'),
+        'oferta_nombre': None,
+    }
+
+
+def obtener_mejores_ofertas(productos_ids, ahora=None):
+    """Devuelve {producto_id: ProductoOferta} con la oferta activa más barata de cada producto"""
+    from ofertas.intervalos import intervalos_productos
+
+    return {
+        producto_id: intervalo.producto_oferta
+        for producto_id, intervalo in intervalos_productos(productos_ids, ahora).items()
+    }
+
+
+def reservas_activas(excluir_venta=None):
+    """Reservas de stock que todavía no vencieron (opcionalmente sin las de una venta)"""
+    reservas = ReservaStock.objects.filter(vence__gt=timezone.now())
+    if excluir_venta is not None:
+        reservas = reservas.exclude(venta=excluir_venta)
+    return reservas
+
+
+def bloquear_stocks(productos_ids, supermercado, venta=None):
+    """
+    Bloquea y devuelve {producto_id: ProductoDeposito} con el stock de cada producto
+    en los depósitos activos del supermercado. Si un producto está en varios depósitos
+    se toma el registro más antiguo, igual que el `.first()` usado al validar items.
+    
+    Cada registro trae `reservado`: la cantidad apartada por los carritos de otras
+    ventas (las reservas de `venta` no cuentan contra ella misma).
+    """
+    reservado = reservas_activas(excluir_venta=venta).filter(
+        stock=OuterRef('pk')
+    ).values('stock').annotate(total=Sum('cantidad')).values('total')
+
+    stocks = ProductoDeposito.objects.select_for_update(of=('self',)).filter(
+        producto_id__in=productos_ids,
+        deposito__supermercado=supermercado,
+        deposito__activo=True
+    ).annotate(
+        reservado=Coalesce(Subquery(reservado), 0)
+    ).order_by('producto_id', 'id')
+
+    por_producto = {}
+    for stock in stocks:
+        por_producto.setdefault(stock.producto_id, stock)
+    return por_producto
+
+
+def descontar_stock(stocks, cantidades, productos):
+    """
+    Descuenta `cantidades` ({producto_id: cantidad}) de los `stocks` bloqueados con
+    un único UPDATE condicional, respetando lo reservado por otras ventas. Lanza
+    StockInsuficienteError con todos los faltantes juntos; si el UPDATE no puede
+    aplicarse a todas las filas no se descuenta nada.
+    """
+    faltantes = []
+    for producto_id, cantidad in cantidades.items():
+        stock = stocks.get(producto_id)
+        # Lo reservado por otros carritos no se puede vender
+        disponible = stock.cantidad - getattr(stock, 'reservado', 0) if stock else 0
+        if disponible < cantidad:
+            faltantes.append({
+                'producto_id': producto_id,
+                'producto_nombre': productos[producto_id].nombre,
+                'disponible': disponible,
+                'necesario': cantidad,
+            })
+
+    if faltantes:
+        raise StockInsuficienteError(faltantes)
+
+    # Cada fila solo se actualiza si todavía alcanza su cantidad; si alguna quedó
+    # afuera (stock modificado por otro proceso) se revierte toda la operación
+    condicion = Q()
+    for producto_id, cantidad in cantidades.items():
+        condicion |= Q(pk=stocks[producto_id].pk, cantidad__gte=cantidad)
+
+    with transaction.atomic():
+        actualizados = ProductoDeposito.objects.filter(condicion).update(
+            cantidad=Case(
+                *[
+                    When(pk=stocks[producto_id].pk, then=F('cantidad') - cantidad)
+                    for producto_id, cantidad in cantidades.items()
+                ],
+                output_field=models.PositiveIntegerField()
+            ),
+            fecha_modificacion=timezone.now()
+        )
+
+        if actualizados != len(cantidades):
+            vigentes = ProductoDeposito.objects.in_bulk(
+                [stocks[producto_id].pk for producto_id in cantidades]
+            )
+            raise StockInsuficienteError([
+                {
+                    'producto_id': producto_id,
+                    'producto_nombre': productos[producto_id].nombre,
+                    'disponible': vigentes[stocks[producto_id].pk].cantidad,
+                    'necesario': cantidad,
+                }
+                for producto_id, cantidad in cantidades.items()
+                if vigentes[stocks[producto_id].pk].cantidad < cantidad
+            ])
+
+    # El UPDATE masivo no dispara post_save: notificar solo los stocks que quedaron en el mínimo
+    for producto_id, cantidad in cantidades.items():
+        stock = stocks[producto_id]
+        stock.cantidad -= cantidad
+        if stock.cantidad <= stock.cantidad_minima:
+            crear_notificaciones_stock_minimo(stock)
+
+
+def descontar_stock_venta(venta, supermercado):
+    """
+    Bloquea de una vez el stock de todos los items de la venta, lo descuenta y
+    libera las reservas del carrito. Espera los items precargados con su
+    producto (prefetch 'items__producto').
+    """
+    items = list(venta.items.all())
+    cantidades = {item.producto_id: item.cantidad for item in items}
+    productos = {item.producto_id: item.producto for item in items}
+
+    stocks = bloquear_stocks(cantidades.keys(), supermercado, venta=venta)
+    descontar_stock(stocks, cantidades, productos)
+
+    # El stock ya salió del depósito: las reservas del carrito no hacen más falta
+    venta.reservas.all().delete()
+    incrementar_version(supermercado)
+    marcar_estadisticas(supermercado, {producto.categoria_id for producto in productos.values()})
+
+
+def registrar_venta_completa(datos_cajero, supermercado, items, cliente_telefono=None,
+                             observaciones=None, terminal=None):
+    """
+    Crea una venta COMPLETADA con todos sus items, precios y descuento de stock
+    en una sola transacción y con una cantidad fija de consultas. Una venta
+    rechazada (producto inactivo, stock insuficiente) no consume número.
+
+    `items` es una lista de {'producto_id', 'cantidad'} sin productos repetidos.
+    """
+    cantidades = {item['producto_id']: item['cantidad'] for item in items}
+
+    venta = Venta(
+        cliente_telefono=cliente_telefono or None,
+        observaciones=observaciones or None,
+        estado='COMPLETADA',
+        **datos_cajero
+    )
+    with transaction.atomic():
+        productos = Producto.objects.filter(
+            id__in=cantidades.keys(),
+            activo=True
+        ).in_bulk()
+
+        inexistentes = [producto_id for producto_id in cantidades if producto_id not in productos]
+        if inexistentes:
+            raise ValueError(
+                f"Los productos {inexistentes} no existen o no están activos."
+            )
+
+        ofertas = obtener_mejores_ofertas(cantidades.keys())
+        stocks = bloquear_stocks(cantidades.keys(), supermercado)
+        descontar_stock(stocks, cantidades, productos)
+        incrementar_version(supermercado)
+        marcar_estadisticas(supermercado, {producto.categoria_id for producto in productos.values()})
+
+        items_venta = []
+        for producto_id, cantidad in cantidades.items():
+            item = ItemVenta(
+                producto=productos[producto_id],
+                cantidad=cantidad,
+                **precio_item(productos[producto_id], ofertas.get(producto_id))
+            )
+            # bulk_create no pasa por ItemVenta.save(): calcular el subtotal aquí
+            item.subtotal = item.cantidad * item.precio_unitario
+            items_venta.append(item)
+
+        subtotal = sum((item.subtotal for item in items_venta), Decimal('0.00'))
+
+        venta.subtotal = subtotal
+        venta.total = subtotal
+        venta.fecha_completada = timezone.now()
+        # El número se toma dentro de la transacción, después de validar productos
+        # y stock: si la venta falla no queda un hueco en la numeración. La fila de
+        # la secuencia del día queda bloqueada solo mientras se guardan la venta y
+        # sus items (con bloques por terminal no se toca la base)
+        venta.generar_numero_venta(terminal)
+        venta.save()
+
+        for item in items_venta:
+            item.venta = venta
+        ItemVenta.objects.bulk_create(items_venta)
+
+        # El ticket PDF lo genera el worker de tareas cuando se confirma la venta
+        venta.solicitar_ticket()
+
+    return venta
@@ -0,0 +1,20 @@
+"""Tareas en segundo plano de ventas (las ejecuta `python manage.py procesar_tareas`)"""
+from tareas.cola import registrar
+from .models import Venta
+from .pdf_generator import cargar_venta_para_ticket
+from .tickets import guardar_ticket
+
+
+def marcar_ticket_con_error(venta_id):
+    """Se llama cuando el último intento de generar el ticket falló"""
+    Venta.objects.filter(pk=venta_id).update(ticket_estado='ERROR')
+
+
+@registrar('ventas.generar_ticket', al_fallar=marcar_ticket_con_error)
+def generar_ticket(venta_id):
+    """
+    Genera el ticket PDF de la venta y lo guarda en el almacén de tickets. Si
+    falla, la venta sigue PENDIENTE mientras la cola tenga reintentos.
+    """
+    venta = cargar_venta_para_ticket(venta_id)
+    guardar_ticket(venta)
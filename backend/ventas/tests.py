@@ -1,3 +1,1072 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from inventario.models import Deposito
+from productos.busqueda import indice_nombres
+from productos.estadisticas import estadisticas_supermercado
+from productos.models import Categoria, CodigoBarras, Producto, ProductoDeposito
+from productos.versiones import version_catalogo
+from tareas.models import Tarea
+from .models import Venta, ItemVenta, SecuenciaVenta, ClaveIdempotencia, ReservaStock
+from .escaneo import invalidar_escaneo
+from .idempotencia import SEGUNDOS_EN_PROCESO
+from .escpos import TicketEscPosGenerator, generar_ticket_escpos
+from .numeracion import AsignadorNumerosVenta, reservar_numeros
+from .pdf_generator import (
+    TicketCanvasRenderer,
+    TicketPDFGenerator,
+    cargar_venta_para_ticket,
+    crear_generador_ticket,
+    generar_ticket_pdf
+)
+from .services import StockInsuficienteError, bloquear_stocks, descontar_stock
+from .tickets import ruta_ticket
+from .views import VentaViewSet
+
+User = get_user_model()
+
+
+class VentaTestMixin:
+    """Datos base compartidos por los tests de ventas"""
+
+    def crear_datos_base(self):
+        self.admin = User.objects.create_user(
+            username='admin_ventas',
+            email='admin_ventas@test.com',
+            password='testpass123',
+            nombre_supermercado='Super Ventas',
+            cuil='20111111111',
+            provincia='Buenos Aires',
+            localidad='La Plata'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.deposito = Deposito.objects.create(
+            nombre='Depósito Ventas',
+            direccion='Calle 1',
+            supermercado=self.admin
+        )
+        self.categoria = Categoria.objects.create(nombre='Almacén')
+
+    def crear_producto(self, nombre, precio, cantidad, cantidad_minima=0):
+        producto = Producto.objects.create(
+            nombre=nombre,
+            categoria=self.categoria,
+            precio=Decimal(precio)
+        )
+        ProductoDeposito.objects.create(
+            producto=producto,
+            deposito=self.deposito,
+            cantidad=cantidad,
+            cantidad_minima=cantidad_minima
+        )
+        return producto
+
+    def leer_catalogo(self, resp):
+        """Lista de productos de una respuesta de catálogo (enviada por streaming o desde la caché)"""
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return json.loads(b''.join(resp.streaming_content) if resp.streaming else resp.content)
+
+
+class CheckoutVentaTestCase(VentaTestMixin, APITestCase):
+    """Tests para el checkout de una venta completa en un solo request"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.url = reverse('venta-checkout')
+        self.productos = [
+            self.crear_producto(f'Producto {i}', '100.00', 50) for i in range(6)
+        ]
+
+    def _payload(self, productos, cantidad=2):
+        return {
+            'items': [{'producto_id': p.id, 'cantidad': cantidad} for p in productos],
+            'cliente_telefono': '221-555-1234',
+        }
+
+    def test_checkout_crea_venta_completada_y_descuenta_stock(self):
+        """El checkout crea la venta, sus items y descuenta el stock"""
+        resp = self.client.post(self.url, self._payload(self.productos[:3]), format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        venta = Venta.objects.get(id=resp.data['venta']['id'])
+        self.assertEqual(venta.estado, 'COMPLETADA')
+        self.assertEqual(venta.cliente_telefono, '2215551234')
+        self.assertEqual(venta.items.count(), 3)
+        self.assertEqual(venta.total, Decimal('600.00'))
+        for producto in self.productos[:3]:
+            stock = ProductoDeposito.objects.get(producto=producto)
+            self.assertEqual(stock.cantidad, 48)
+
+    def test_checkout_agrupa_productos_repetidos(self):
+        """Las líneas repetidas del mismo producto se suman en un único item"""
+        producto = self.productos[0]
+        payload = {'items': [
+            {'producto_id': producto.id, 'cantidad': 1},
+            {'producto_id': producto.id, 'cantidad': 3},
+        ]}
+        resp = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        item = ItemVenta.objects.get(venta_id=resp.data['venta']['id'])
+        self.assertEqual(item.cantidad, 4)
+
+    def test_checkout_sin_stock_informa_todos_los_faltantes(self):
+        """Si falta stock no se registra nada y se informan todos los faltantes"""
+        payload = {'items': [
+            {'producto_id': self.productos[0].id, 'cantidad': 60},
+            {'producto_id': self.productos[1].id, 'cantidad': 1},
+            {'producto_id': self.productos[2].id, 'cantidad': 70},
+        ]}
+        resp = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        faltantes = {f['producto_id'] for f in resp.data['faltantes']}
+        self.assertEqual(faltantes, {self.productos[0].id, self.productos[2].id})
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(ProductoDeposito.objects.get(producto=self.productos[1]).cantidad, 50)
+
+    def test_checkout_rechazado_no_consume_numero(self):
+        """Una venta que falla por stock no deja un hueco en la numeración del día"""
+        resp = self.client.post(self.url, self._payload(self.productos[:1], cantidad=500), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        resp = self.client.post(self.url, self._payload(self.productos[:1]), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        self.assertTrue(Venta.objects.get(id=resp.data['venta']['id']).numero_venta.endswith('0001'))
+
+    def test_checkout_cantidad_de_consultas_constante(self):
+        """La cantidad de consultas no depende del tamaño del carrito"""
+        # La primera venta del día crea la secuencia de numeración
+        self.client.post(self.url, self._payload(self.productos[:1]), format='json')
+
+        with CaptureQueriesContext(connection) as chico:
+            resp = self.client.post(self.url, self._payload(self.productos[:2]), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+
+        with CaptureQueriesContext(connection) as grande:
+            resp = self.client.post(self.url, self._payload(self.productos), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+
+        self.assertEqual(len(chico.captured_queries), len(grande.captured_queries))
+
+    def test_checkout_actualiza_estadisticas(self):
+        """El descuento masivo de stock marca las estadísticas de las categorías vendidas"""
+        estadisticas_supermercado(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self._payload(self.productos[:2], cantidad=5), format='json')
+
+        (_categoria, fila), = estadisticas_supermercado(self.admin)
+        self.assertEqual(fila.stock_total, 6 * 50 - 10)
+
+
+class FinalizarVentaTestCase(VentaTestMixin, APITestCase):
+    """Tests para el descuento de stock en conjunto al finalizar una venta"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.productos = [
+            self.crear_producto(f'Producto {i}', '50.00', 20, cantidad_minima=5) for i in range(6)
+        ]
+
+    def _crear_venta(self, productos, cantidad=2):
+        resp = self.client.post(reverse('venta-list'), {}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        venta = Venta.objects.get(id=resp.data['id'])
+        for producto in productos:
+            ItemVenta.objects.create(
+                venta=venta, producto=producto, cantidad=cantidad, precio_unitario=producto.precio
+            )
+        return venta
+
+    def _finalizar(self, venta):
+        url = reverse('venta-finalizar', kwargs={'pk': venta.id})
+        return self.client.post(url, {}, format='json')
+
+    def test_finalizar_descuenta_stock_de_todos_los_items(self):
+        """Finalizar descuenta el stock de cada producto de la venta"""
+        venta = self._crear_venta(self.productos[:3], cantidad=4)
+
+        resp = self._finalizar(venta)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertEqual(resp.data['venta']['estado'], 'COMPLETADA')
+        for producto in self.productos[:3]:
+            self.assertEqual(ProductoDeposito.objects.get(producto=producto).cantidad, 16)
+
+    def test_finalizar_informa_todos_los_faltantes_sin_descontar(self):
+        """Si falta stock en varios productos se informan todos y no se descuenta ninguno"""
+        venta = self._crear_venta(self.productos[:3], cantidad=4)
+        ProductoDeposito.objects.filter(producto__in=self.productos[:2]).update(cantidad=3)
+
+        resp = self._finalizar(venta)
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        faltantes = {f['producto_id'] for f in resp.data['faltantes']}
+        self.assertEqual(faltantes, {self.productos[0].id, self.productos[1].id})
+        self.assertEqual(ProductoDeposito.objects.get(producto=self.productos[2]).cantidad, 20)
+        venta.refresh_from_db()
+        self.assertEqual(venta.estado, 'PENDIENTE')
+
+    def test_finalizar_notifica_solo_stocks_en_minimo(self):
+        """Solo los productos que quedan en el mínimo generan notificación"""
+        from notificaciones.models import Notificacion
+
+        venta = self._crear_venta(self.productos[:2], cantidad=2)
+        ItemVenta.objects.filter(venta=venta, producto=self.productos[0]).update(cantidad=15)
+
+        resp = self._finalizar(venta)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        notificaciones = Notificacion.objects.filter(admin=self.admin)
+        self.assertEqual(notificaciones.count(), 1)
+        self.assertIn(self.productos[0].nombre, notificaciones.get().mensaje)
+
+    def test_descuento_condicional_no_deja_stock_negativo(self):
+        """Si el stock cambió después de leerlo, el UPDATE condicional no descuenta nada"""
+        productos = self.productos[:2]
+        stocks = bloquear_stocks([p.id for p in productos], self.admin)
+        ProductoDeposito.objects.filter(producto=productos[1]).update(cantidad=1)
+
+        with self.assertRaises(StockInsuficienteError) as contexto:
+            descontar_stock(stocks, {p.id: 5 for p in productos}, {p.id: p for p in productos})
+
+        self.assertEqual([f['producto_id'] for f in contexto.exception.faltantes], [productos[1].id])
+        self.assertEqual(ProductoDeposito.objects.get(producto=productos[0]).cantidad, 20)
+        self.assertEqual(ProductoDeposito.objects.get(producto=productos[1]).cantidad, 1)
+
+    def test_finalizar_cantidad_de_consultas_constante(self):
+        """La cantidad de consultas al finalizar no depende de la cantidad de items"""
+        chica = self._crear_venta(self.productos[:2])
+        grande = self._crear_venta(self.productos)
+
+        with CaptureQueriesContext(connection) as consultas_chica:
+            resp = self._finalizar(chica)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+
+        with CaptureQueriesContext(connection) as consultas_grande:
+            resp = self._finalizar(grande)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+
+        self.assertEqual(len(consultas_chica.captured_queries), len(consultas_grande.captured_queries))
+
+
+class TicketVentaTestCase(VentaTestMixin, APITestCase):
+    """Tests para la generación del ticket PDF en segundo plano"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.producto = self.crear_producto('Yerba', '1500.00', 10)
+
+    def _vender(self):
+        resp = self.client.post(
+            reverse('venta-checkout'),
+            {'items': [{'producto_id': self.producto.id, 'cantidad': 1}]},
+            format='json'
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        venta = Venta.objects.get(id=resp.data['venta']['id'])
+        self.addCleanup(lambda: Venta.objects.get(pk=venta.pk).ticket_pdf.delete(save=False))
+        return venta
+
+    def test_finalizar_encola_el_ticket_sin_generarlo(self):
+        """Finalizar deja el ticket pendiente y encola su generación"""
+        resp = self.client.post(reverse('venta-list'), {}, format='json')
+        venta = Venta.objects.get(id=resp.data['id'])
+        ItemVenta.objects.create(venta=venta, producto=self.producto, cantidad=2, precio_unitario=Decimal('1500.00'))
+
+        resp = self.client.post(reverse('venta-finalizar', kwargs={'pk': venta.id}), {}, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertEqual(resp.data['venta']['ticket_estado'], 'PENDIENTE')
+        venta.refresh_from_db()
+        self.assertFalse(venta.ticket_pdf)
+        tarea = Tarea.objects.get(tipo='ventas.generar_ticket')
+        self.assertEqual(tarea.datos, {'venta_id': venta.id})
+
+    def test_ticket_queda_con_error_solo_al_agotar_los_intentos(self):
+        """Mientras quedan reintentos el ticket sigue pendiente"""
+        venta = self._vender()
+        tarea = Tarea.objects.get(tipo='ventas.generar_ticket')
+
+        with patch('ventas.tareas.guardar_ticket', side_effect=RuntimeError('sin disco')):
+            for intento in range(tarea.max_intentos):
+                Tarea.objects.filter(pk=tarea.pk).update(disponible_desde=timezone.now())
+                call_command('procesar_tareas', '--una-vez', stdout=StringIO())
+                venta.refresh_from_db()
+                estado_esperado = 'ERROR' if intento == tarea.max_intentos - 1 else 'PENDIENTE'
+                self.assertEqual(venta.ticket_estado, estado_esperado)
+
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'FALLIDA')
+
+    def test_ticket_colgado_en_el_ultimo_intento_queda_con_error(self):
+        """Si el worker muere generando el ticket en el último intento, el ticket queda en ERROR"""
+        venta = self._vender()
+        tarea = Tarea.objects.get(tipo='ventas.generar_ticket')
+        Tarea.objects.filter(pk=tarea.pk).update(
+            estado='EN_PROCESO',
+            intentos=tarea.max_intentos,
+            fecha_inicio=timezone.now() - datetime.timedelta(hours=1)
+        )
+
+        call_command('procesar_tareas', '--una-vez', stdout=StringIO())
+
+        venta.refresh_from_db()
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, venta.ticket_estado), ('FALLIDA', 'ERROR'))
+
+    def test_worker_genera_el_ticket_y_se_descarga_el_archivo(self):
+        """El worker guarda el PDF y la descarga sirve el archivo guardado"""
+        venta = self._vender()
+
+        call_command('procesar_tareas', '--una-vez', stdout=StringIO())
+
+        venta.refresh_from_db()
+        self.assertEqual(venta.ticket_estado, 'LISTO')
+        self.assertTrue(venta.ticket_pdf_generado)
+        with venta.ticket_pdf.open('rb') as archivo:
+            guardado = archivo.read()
+
+        resp = self.client.get(reverse('venta-descargar-ticket', kwargs={'pk': venta.id}))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(resp.streaming_content), guardado)
+        self.assertTrue(guardado.startswith(b'%PDF'))
+
+    def test_descarga_genera_el_ticket_si_todavia_no_esta_listo(self):
+        """Si el worker no terminó, la descarga genera el PDF y lo deja guardado"""
+        venta = self._vender()
+
+        resp = self.client.get(reverse('descargar-ticket-pdf', kwargs={'venta_id': venta.id}))
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(b''.join(resp.streaming_content).startswith(b'%PDF'))
+        venta.refresh_from_db()
+        self.assertEqual(venta.ticket_estado, 'LISTO')
+
+    def _descargar(self, venta, **headers):
+        return self.client.get(reverse('venta-descargar-ticket', kwargs={'pk': venta.id}), **headers)
+
+    def test_ticket_se_genera_una_sola_vez(self):
+        """Las descargas y el worker reutilizan el archivo guardado en lugar de regenerarlo"""
+        venta = self._vender()
+
+        with patch('ventas.tickets.generar_ticket_pdf', wraps=generar_ticket_pdf) as generar:
+            primera = b''.join(self._descargar(venta).streaming_content)
+            segunda = b''.join(self._descargar(venta).streaming_content)
+            call_command('procesar_tareas', '--una-vez', stdout=StringIO())
+
+        self.assertEqual(generar.call_count, 1)
+        self.assertEqual(primera, segunda)
+        venta.refresh_from_db()
+        self.assertEqual(venta.ticket_pdf.name, venta.nombre_archivo_ticket())
+
+    def test_get_condicional_devuelve_304(self):
+        """Con el ETag vigente la descarga responde 304 sin cuerpo"""
+        venta = self._vender()
+        etag = self._descargar(venta)['ETag']
+
+        resp = self._descargar(venta, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp['ETag'], etag)
+
+    def test_descarga_por_rangos(self):
+        """Los pedidos de rango devuelven solo los bytes pedidos"""
+        venta = self._vender()
+        completo = b''.join(self._descargar(venta).streaming_content)
+        self.assertEqual(self._descargar(venta)['Accept-Ranges'], 'bytes')
+
+        resp = self._descargar(venta, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(resp.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(resp.streaming_content), completo[10:20])
+        self.assertEqual(resp['Content-Range'], f'bytes 10-19/{len(completo)}')
+
+        resp = self._descargar(venta, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(resp.streaming_content), completo[-5:])
+
+        resp = self._descargar(venta, HTTP_RANGE=f'bytes={len(completo)}-')
+        self.assertEqual(resp.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        # Un rango inválido se ignora: archivo completo
+        resp = self._descargar(venta, HTTP_RANGE='bytes=5-3')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(resp.streaming_content), completo)
+
+    @override_settings(VENTAS_TICKETS_X_ACCEL_PREFIX='/media-interna/')
+    def test_descarga_delegada_al_proxy(self):
+        """Con X-Accel configurado Django solo indica qué archivo debe enviar el proxy"""
+        venta = self._vender()
+
+        resp = self._descargar(venta)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp['X-Accel-Redirect'], f'/media-interna/{venta.nombre_archivo_ticket()}')
+        self.assertEqual(resp.content, b'')
+
+
+class TicketRendererTestCase(VentaTestMixin, APITestCase):
+    """Tests para el renderer de tickets sobre canvas"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        productos = [self.crear_producto(f'Producto {i}', '10.00', 50) for i in range(5)]
+        self.venta = Venta.objects.create(cajero=self.admin, numero_venta='202510160001', estado='COMPLETADA')
+        for producto in productos:
+            ItemVenta.objects.create(venta=self.venta, producto=producto, cantidad=1, precio_unitario=producto.precio)
+
+    def test_renderer_no_consulta_la_base_con_la_venta_precargada(self):
+        """Con la venta precargada el ticket se genera sin consultas adicionales"""
+        venta = cargar_venta_para_ticket(self.venta.id)
+
+        with self.assertNumQueries(0):
+            pdf = TicketCanvasRenderer(venta).generate_ticket().getvalue()
+
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    def test_encabezado_se_reutiliza_y_se_actualiza_si_cambia_el_nombre(self):
+        """El encabezado del supermercado se arma una vez y se rehace si cambia el nombre"""
+        venta = cargar_venta_para_ticket(self.venta.id)
+        primero = TicketCanvasRenderer(venta).get_encabezado()
+        self.assertIs(TicketCanvasRenderer(venta).get_encabezado(), primero)
+
+        venta.cajero.nombre_supermercado = 'Otro Nombre'
+        self.assertEqual(TicketCanvasRenderer(venta).get_encabezado(), ['OTRO NOMBRE'])
+
+    @override_settings(VENTAS_TICKET_RENDERER='platypus')
+    def test_renderer_configurable(self):
+        """El setting permite volver al generador original"""
+        self.assertIsInstance(crear_generador_ticket(self.venta), TicketPDFGenerator)
+        self.assertNotIsInstance(crear_generador_ticket(self.venta), TicketCanvasRenderer)
+
+    def test_ticket_escpos_contiene_items_descuentos_y_totales(self):
+        """El ticket ESC/POS inicializa la impresora, lista los items y corta el papel"""
+        ItemVenta.objects.filter(venta=self.venta).update(
+            descuento_aplicado=Decimal('2.00'), oferta_nombre='Promo Otoño'
+        )
+        venta = cargar_venta_para_ticket(self.venta.id)
+
+        with self.assertNumQueries(0):
+            contenido = TicketEscPosGenerator(venta).generate_ticket()
+
+        self.assertTrue(contenido.startswith(b'\x1b@'))
+        self.assertTrue(contenido.endswith(b'\x1dVB\x00'))
+        self.assertIn(b'Producto 4', contenido)
+        self.assertIn('Promo Otoño'.encode('cp858'), contenido)
+        self.assertIn(f'TOTAL: ${self.venta.total}'.encode(), contenido)
+        fila = next(linea for linea in contenido.split(b'\n') if linea.startswith(b'Producto 4'))
+        self.assertEqual(len(fila), 48)
+
+    def test_descarga_en_formato_escpos(self):
+        """Las descargas de ticket aceptan ?formato=escpos y rechazan formatos desconocidos"""
+        url = reverse('venta-descargar-ticket', kwargs={'pk': self.venta.id})
+        self.addCleanup(lambda: os.remove(ruta_ticket(self.venta, 'escpos')))
+
+        resp = self.client.get(url, {'formato': 'escpos'})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp['Content-Type'], 'application/octet-stream')
+        self.assertEqual(b''.join(resp.streaming_content), generar_ticket_escpos(self.venta))
+        self.assertEqual(self.client.get(url, {'formato': 'zpl'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_comando_benchmark_reporta_tickets_por_segundo(self):
+        """El benchmark compara ambos generadores sin dejar datos de prueba"""
+        salida = StringIO()
+        call_command('benchmark_tickets', '--items', '3', '--iteraciones', '2', stdout=salida)
+
+        self.assertEqual(salida.getvalue().count('tickets/s'), 3)
+        self.assertFalse(Venta.objects.filter(numero_venta='BENCHMARK').exists())
+
+
+class IdempotenciaVentaTestCase(VentaTestMixin, APITestCase):
+    """Tests para los reintentos con Idempotency-Key en las operaciones de caja"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.producto = self.crear_producto('Galletitas', '80.00', 30)
+        resp = self.client.post(reverse('venta-list'), {}, format='json')
+        self.venta = Venta.objects.get(id=resp.data['id'])
+
+    def _agregar(self, clave, cantidad=2):
+        url = reverse('venta-agregar-producto', kwargs={'pk': self.venta.id})
+        return self.client.post(
+            url, {'producto_id': self.producto.id, 'cantidad': cantidad},
+            format='json', HTTP_IDEMPOTENCY_KEY=clave
+        )
+
+    def test_reintento_no_duplica_la_cantidad(self):
+        """Repetir agregar_producto con la misma clave devuelve la respuesta original"""
+        primera = self._agregar('scan-1')
+        segunda = self._agregar('scan-1')
+
+        self.assertEqual(primera.status_code, status.HTTP_200_OK, primera.data)
+        self.assertEqual(segunda.status_code, status.HTTP_200_OK)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(segunda.data, primera.data)
+        self.assertEqual(self.venta.items.get().cantidad, 2)
+
+        self._agregar('scan-2')
+        self.assertEqual(self.venta.items.get().cantidad, 4)
+
+    def test_caida_despues_de_confirmar_no_vuelve_a_ejecutar(self):
+        """Si el proceso muere después de confirmar la operación, la clave ya tiene la respuesta"""
+        with patch.object(VentaViewSet, 'finalize_response', side_effect=RuntimeError('proceso caído')):
+            with self.assertRaises(RuntimeError):
+                self._agregar('scan-1')
+
+        # Pasado el tiempo de un request abandonado, el reintento tampoco la vuelve a ejecutar
+        ClaveIdempotencia.objects.update(
+            fecha_creacion=timezone.now() - datetime.timedelta(seconds=SEGUNDOS_EN_PROCESO + 1)
+        )
+        reintento = self._agregar('scan-1')
+
+        self.assertEqual(reintento.status_code, status.HTTP_200_OK, reintento.data)
+        self.assertEqual(reintento['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.venta.items.get().cantidad, 2)
+
+    def test_reintento_de_finalizar_devuelve_la_venta_finalizada(self):
+        """Un finalizar repetido no falla con 'ya finalizada' ni descuenta stock dos veces"""
+        self._agregar('scan-1')
+        url = reverse('venta-finalizar', kwargs={'pk': self.venta.id})
+
+        primera = self.client.post(url, {}, format='json', HTTP_IDEMPOTENCY_KEY='fin-1')
+        segunda = self.client.post(url, {}, format='json', HTTP_IDEMPOTENCY_KEY='fin-1')
+
+        self.assertEqual(primera.status_code, status.HTTP_200_OK, primera.data)
+        self.assertEqual(segunda.status_code, status.HTTP_200_OK, segunda.data)
+        self.assertEqual(segunda.data['venta']['estado'], 'COMPLETADA')
+        self.assertEqual(ProductoDeposito.objects.get(producto=self.producto).cantidad, 28)
+        # Sin clave, el reintento sí se rechaza
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_clave_reutilizada_con_otro_request(self):
+        """Usar la misma clave para un request distinto se rechaza"""
+        self._agregar('scan-1', cantidad=2)
+
+        resp = self._agregar('scan-1', cantidad=5)
+
+        self.assertEqual(resp.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.venta.items.get().cantidad, 2)
+
+    def test_errores_no_se_guardan(self):
+        """Una respuesta de error no queda guardada y el cliente puede reintentar"""
+        url = reverse('venta-finalizar', kwargs={'pk': self.venta.id})
+
+        resp = self.client.post(url, {}, format='json', HTTP_IDEMPOTENCY_KEY='fin-1')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+    def test_purgar_claves_vencidas(self):
+        """El comando borra solo las claves más viejas que el TTL"""
+        self._agregar('scan-1')
+        self._agregar('scan-2', cantidad=1)
+        ClaveIdempotencia.objects.filter(clave='scan-1').update(
+            fecha_creacion=timezone.now() - datetime.timedelta(hours=25)
+        )
+
+        salida = StringIO()
+        call_command('purgar_claves_idempotencia', stdout=salida)
+
+        self.assertIn('1 claves', salida.getvalue())
+        self.assertEqual(list(ClaveIdempotencia.objects.values_list('clave', flat=True)), ['scan-2'])
+
+
+class ReservaStockTestCase(VentaTestMixin, APITestCase):
+    """Tests para las reservas de stock de los carritos en curso"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.producto = self.crear_producto('Yerba', '900.00', 10)
+
+    def _nueva_venta(self):
+        resp = self.client.post(reverse('venta-list'), {}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        return Venta.objects.get(id=resp.data['id'])
+
+    def _agregar(self, venta, cantidad):
+        url = reverse('venta-agregar-producto', kwargs={'pk': venta.id})
+        return self.client.post(url, {'producto_id': self.producto.id, 'cantidad': cantidad}, format='json')
+
+    def _disponible(self):
+        productos = self.leer_catalogo(self.client.get(reverse('productos-disponibles')))
+        return {p['id']: p['stock_disponible'] for p in productos}.get(self.producto.id)
+
+    def test_otra_caja_no_puede_tomar_stock_reservado(self):
+        """Lo reservado por un carrito no se puede agregar en otro ni aparece como disponible"""
+        primera, segunda = self._nueva_venta(), self._nueva_venta()
+
+        self.assertEqual(self._agregar(primera, 7).status_code, status.HTTP_200_OK)
+        resp = self._agregar(segunda, 4)
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.data['faltantes'][0]['disponible'], 3)
+        self.assertEqual(self._disponible(), 3)
+        self.assertEqual(self._agregar(segunda, 3).status_code, status.HTTP_200_OK)
+        # El stock del depósito recién se descuenta al finalizar
+        self.assertEqual(ProductoDeposito.objects.get(producto=self.producto).cantidad, 10)
+
+    def test_reserva_vencida_libera_el_stock(self):
+        """Cuando la reserva vence el stock vuelve a estar disponible"""
+        primera, segunda = self._nueva_venta(), self._nueva_venta()
+        self._agregar(primera, 8)
+        ReservaStock.objects.update(vence=timezone.now() - datetime.timedelta(minutes=1))
+
+        self.assertEqual(self._disponible(), 10)
+        self.assertEqual(self._agregar(segunda, 5).status_code, status.HTTP_200_OK)
+
+    def test_finalizar_respeta_reservas_de_otros_carritos(self):
+        """Finalizar libera las reservas propias y no vende lo reservado por otro carrito"""
+        primera, segunda = self._nueva_venta(), self._nueva_venta()
+        self._agregar(primera, 4)
+        self._agregar(segunda, 6)
+
+        resp = self.client.post(reverse('venta-finalizar', kwargs={'pk': primera.id}), {}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertFalse(primera.reservas.exists())
+        self.assertEqual(self._disponible(), 0)
+
+        # Stock cargado por fuera del carrito: la venta no puede comerse lo reservado
+        ItemVenta.objects.filter(venta=segunda).update(cantidad=7)
+        resp = self.client.post(reverse('venta-finalizar', kwargs={'pk': segunda.id}), {}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ProductoDeposito.objects.get(producto=self.producto).cantidad, 6)
+
+    def test_cancelar_y_eliminar_item_liberan_la_reserva(self):
+        """Sacar un item o cancelar la venta devuelve el stock a las otras cajas"""
+        venta = self._nueva_venta()
+        self._agregar(venta, 5)
+        item = venta.items.get()
+
+        url = reverse('venta-eliminar-item', kwargs={'pk': venta.id})
+        resp = self.client.delete(url, {'item_id': item.id}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertEqual(self._disponible(), 10)
+
+        self._agregar(venta, 5)
+        resp = self.client.post(reverse('venta-cancelar', kwargs={'pk': venta.id}), {}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertFalse(ReservaStock.objects.exists())
+
+    def test_liberar_reservas_vencidas(self):
+        """El comando borra solo las reservas vencidas"""
+        primera, segunda = self._nueva_venta(), self._nueva_venta()
+        self._agregar(primera, 2)
+        self._agregar(segunda, 3)
+        primera.reservas.update(vence=timezone.now() - datetime.timedelta(minutes=1))
+
+        salida = StringIO()
+        call_command('liberar_reservas_vencidas', stdout=salida)
+
+        self.assertIn('1 reservas', salida.getvalue())
+        self.assertEqual(list(ReservaStock.objects.values_list('venta_id', flat=True)), [segunda.id])
+
+
+class CatalogoCajaTestCase(VentaTestMixin, APITestCase):
+    """Tests para el catálogo de productos disponibles de las cajas"""
+
+    def setUp(self):
+        from ofertas.models import Oferta, ProductoOferta
+
+        self.crear_datos_base()
+        self.arroz = self.crear_producto('Arroz', '500.00', 10)
+        self.fideos = self.crear_producto('Fideos', '300.00', 4)
+        self.sin_stock = self.crear_producto('Harina', '200.00', 0)
+        # Segundo depósito: el stock del catálogo suma todos los depósitos activos
+        otro = Deposito.objects.create(nombre='Depósito 2', direccion='Calle 2', supermercado=self.admin)
+        ProductoDeposito.objects.create(producto=self.arroz, deposito=otro, cantidad=5)
+
+        ahora = timezone.now()
+        oferta = Oferta.objects.create(
+            nombre='Semana del arroz', tipo_descuento='porcentaje', valor_descuento=Decimal('10'),
+            fecha_inicio=ahora - datetime.timedelta(days=1), fecha_fin=ahora + datetime.timedelta(days=1)
+        )
+        ProductoOferta.objects.create(producto=self.arroz, oferta=oferta)
+        indice_nombres.invalidar()
+
+    def test_catalogo_con_stock_y_precio_de_oferta(self):
+        """El catálogo trae solo productos con stock, su stock total y el precio con oferta"""
+        productos = self.leer_catalogo(self.client.get(reverse('productos-disponibles')))
+
+        self.assertEqual([p['nombre'] for p in productos], ['Arroz', 'Fideos'])
+        arroz, fideos = productos
+        self.assertEqual(arroz['stock_disponible'], 15)
+        self.assertEqual(arroz['categoria'], 'Almacén')
+        self.assertEqual(arroz['precio'], '500.00')
+        self.assertEqual(arroz['precio_efectivo'], '450.00')
+        self.assertIsNone(fideos['precio_oferta'])
+        self.assertEqual(fideos['precio_efectivo'], '300.00')
+
+    def test_buscar_productos(self):
+        """La búsqueda filtra por nombre con el mismo formato que el catálogo"""
+        productos = self.leer_catalogo(self.client.get(reverse('buscar-productos'), {'q': 'fid'}))
+
+        self.assertEqual(len(productos), 1)
+        self.assertEqual(productos[0]['id'], self.fideos.id)
+        self.assertNotIn('descripcion', productos[0])
+
+    def test_autocompletar_solo_productos_con_stock(self):
+        """El autocompletado de la caja no sugiere productos sin stock"""
+        url = reverse('autocompletar-productos-caja')
+
+        self.assertEqual(self.client.get(url, {'q': 'harina'}).data, [])
+        resp = self.client.get(url, {'q': 'ARR'})
+        self.assertEqual(resp.data, [{'id': self.arroz.id, 'nombre': 'Arroz', 'precio': '500.00'}])
+
+    def test_catalogo_cantidad_de_consultas_constante(self):
+        """El catálogo cuesta las mismas consultas sin importar cuántos productos tenga"""
+        with CaptureQueriesContext(connection) as chico:
+            self.leer_catalogo(self.client.get(reverse('productos-disponibles')))
+
+        for i in range(20):
+            self.crear_producto(f'Extra {i}', '10.00', 3)
+        with CaptureQueriesContext(connection) as grande:
+            productos = self.leer_catalogo(self.client.get(reverse('productos-disponibles')))
+
+        self.assertEqual(len(productos), 22)
+        self.assertEqual(len(chico.captured_queries), len(grande.captured_queries))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogoVersionadoTestCase(VentaTestMixin, APITestCase):
+    """Tests para la copia en caché del catálogo de las cajas y su ETag"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.producto = self.crear_producto('Aceite', '1200.00', 8)
+        cache.clear()
+
+    def _catalogo(self, **headers):
+        return self.client.get(reverse('productos-disponibles'), **headers)
+
+    def test_catalogo_sin_cambios_sale_de_la_cache(self):
+        """Sin cambios el catálogo se responde con la copia y dos consultas (versión y reservas)"""
+        primera = self._catalogo()
+
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self._catalogo()
+
+        self.assertEqual(len(consultas.captured_queries), 2)
+        self.assertEqual(segunda['ETag'], primera['ETag'])
+        self.assertEqual(json.loads(segunda.content), json.loads(primera.content))
+
+    def test_cliente_al_dia_recibe_304(self):
+        """Con el ETag vigente en If-None-Match la respuesta es 304 sin cuerpo"""
+        etag = self._catalogo()['ETag']
+
+        resp = self._catalogo(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.content, b'')
+
+    def test_cambio_de_stock_cambia_la_version(self):
+        """Guardar el stock incrementa la versión: la próxima lectura trae el dato nuevo"""
+        etag = self._catalogo()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            stock = ProductoDeposito.objects.get(producto=self.producto)
+            stock.cantidad = 3
+            stock.save()
+
+        resp = self._catalogo(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(json.loads(resp.content)[0]['stock_disponible'], 3)
+
+    def test_reserva_no_cambia_la_version_pero_si_el_stock_y_el_etag(self):
+        """Escanear un item no invalida la copia: la reserva se descuenta al leerla"""
+        etag = self._catalogo()['ETag']
+        version = version_catalogo(self.admin)
+        venta = Venta.objects.get(id=self.client.post(reverse('venta-list'), {}, format='json').data['id'])
+        url = reverse('venta-agregar-producto', kwargs={'pk': venta.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'producto_id': self.producto.id, 'cantidad': 5}, format='json')
+
+        self.assertEqual(version_catalogo(self.admin), version)
+        resp = self._catalogo(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(self.leer_catalogo(resp)[0]['stock_disponible'], 3)
+
+        # Al liberar la reserva vuelve el ETag de la copia sin reservas
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('venta-cancelar', kwargs={'pk': venta.id}), {}, format='json')
+        self.assertEqual(self._catalogo(HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_venta_cambia_la_version(self):
+        """Reservar y vender (UPDATE sin señales) se reflejan en el catálogo"""
+        self._catalogo()
+        venta = Venta.objects.get(id=self.client.post(reverse('venta-list'), {}, format='json').data['id'])
+        url = reverse('venta-agregar-producto', kwargs={'pk': venta.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'producto_id': self.producto.id, 'cantidad': 5}, format='json')
+        self.assertEqual(self.leer_catalogo(self._catalogo())[0]['stock_disponible'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('venta-cancelar', kwargs={'pk': venta.id}), {}, format='json')
+            resp = self.client.post(
+                reverse('venta-checkout'),
+                {'items': [{'producto_id': self.producto.id, 'cantidad': 2}]},
+                format='json'
+            )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        self.assertEqual(self.leer_catalogo(self._catalogo())[0]['stock_disponible'], 6)
+
+
+class EscaneoCodigoBarrasTestCase(VentaTestMixin, APITestCase):
+    """Tests para el escaneo de códigos de barras en caja"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.producto = self.crear_producto('Leche', '250.00', 12)
+        CodigoBarras.objects.create(producto=self.producto, supermercado=self.admin, codigo='7790001000012')
+        CodigoBarras.objects.create(producto=self.producto, supermercado=self.admin, codigo='7790001000029')
+        invalidar_escaneo()
+
+    def _escanear(self, codigo):
+        return self.client.get(reverse('escanear-producto', kwargs={'codigo': codigo}))
+
+    def test_escanear_devuelve_producto_precio_y_stock(self):
+        """Cualquiera de los códigos del producto lo resuelve con su precio y stock"""
+        for codigo in ['7790001000012', '7790001000029']:
+            resp = self._escanear(codigo)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+            self.assertEqual(resp.data['id'], self.producto.id)
+            self.assertEqual(resp.data['precio_efectivo'], '250.00')
+            self.assertEqual(resp.data['stock_disponible'], 12)
+
+        self.assertEqual(self._escanear('0000').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_escaneo_repetido_no_consulta_la_base(self):
+        """Un código ya escaneado se responde desde la caché del proceso"""
+        self._escanear('7790001000012')
+
+        with CaptureQueriesContext(connection) as consultas:
+            resp = self._escanear('7790001000012')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(consultas.captured_queries), 0)
+
+    def test_cambio_de_precio_limpia_la_cache(self):
+        """Al guardar el producto el próximo escaneo trae el precio nuevo"""
+        self._escanear('7790001000012')
+        self.producto.precio = Decimal('275.50')
+        self.producto.save()
+
+        self.assertEqual(self._escanear('7790001000012').data['precio'], '275.50')
+
+    def test_precio_de_oferta_sale_de_la_linea_de_tiempo(self):
+        """El escaneo muestra el precio del tramo (el que se cobra) y no lo guarda más allá del tramo"""
+        from ofertas.models import IntervaloPrecio, Oferta, ProductoOferta
+        from .escaneo import productos_por_codigo
+
+        ahora = timezone.now()
+        oferta = Oferta.objects.create(
+            nombre='Leche 20%', tipo_descuento='porcentaje', valor_descuento=Decimal('20'),
+            fecha_inicio=ahora - datetime.timedelta(days=1), fecha_fin=ahora + datetime.timedelta(minutes=2)
+        )
+        ProductoOferta.objects.create(producto=self.producto, oferta=oferta)
+        # La asignación difiere del tramo: manda el tramo, igual que en el cobro
+        ProductoOferta.objects.filter(oferta=oferta).update(precio_con_descuento=Decimal('1.00'))
+        invalidar_escaneo()
+
+        resp = self._escanear('7790001000012')
+
+        self.assertEqual(resp.data['precio_efectivo'], '200.00')
+        tramo = IntervaloPrecio.objects.get(producto=self.producto, hasta__gt=timezone.now())
+        vence = productos_por_codigo._datos[(self.admin.pk, '7790001000012')][0]
+        self.assertLessEqual(vence - time.monotonic(), (tramo.hasta - timezone.now()).total_seconds() + 1)
+
+    def test_codigo_de_otro_supermercado_no_se_resuelve(self):
+        """Los códigos son por supermercado"""
+        otro = User.objects.create_user(
+            username='otro_super', email='otro@test.com', password='testpass123',
+            nombre_supermercado='Otro', cuil='20555555555', provincia='Buenos Aires', localidad='La Plata'
+        )
+        CodigoBarras.objects.create(producto=self.producto, supermercado=otro, codigo='123456')
+
+        self.assertEqual(self._escanear('123456').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_agregar_producto_por_codigo_de_barras(self):
+        """La caja puede agregar items escaneando en lugar de mandar el id"""
+        venta = Venta.objects.get(id=self.client.post(reverse('venta-list'), {}, format='json').data['id'])
+        url = reverse('venta-agregar-producto', kwargs={'pk': venta.id})
+
+        resp = self.client.post(url, {'codigo_barras': '7790001000029', 'cantidad': 2}, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertEqual(venta.items.get().producto, self.producto)
+        resp = self.client.post(url, {'codigo_barras': '999', 'cantidad': 1}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('codigo_barras', resp.data)
+
+
+class TotalesVentaTestCase(VentaTestMixin, APITestCase):
+    """Tests para el mantenimiento por diferencia de los totales de la venta"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.productos = [
+            self.crear_producto(f'Producto {i}', f'{10 * (i + 1)}.50', 100) for i in range(8)
+        ]
+        resp = self.client.post(reverse('venta-list'), {}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        self.venta = Venta.objects.get(id=resp.data['id'])
+
+    def _agregar(self, producto, cantidad=1):
+        url = reverse('venta-agregar-producto', kwargs={'pk': self.venta.id})
+        return self.client.post(url, {'producto_id': producto.id, 'cantidad': cantidad}, format='json')
+
+    def test_totales_se_actualizan_al_agregar_modificar_y_eliminar(self):
+        """Agregar, modificar y eliminar items ajusta subtotal y total"""
+        resp = self._agregar(self.productos[0], 2)
+        self.assertEqual(resp.data['venta']['total'], '21.00')
+        resp = self._agregar(self.productos[1], 1)
+        self.assertEqual(resp.data['venta']['total'], '41.50')
+        resp = self._agregar(self.productos[0], 1)
+        self.assertEqual(resp.data['venta']['total'], '52.00')
+
+        item = self.venta.items.get(producto=self.productos[1])
+        url = reverse('venta-actualizar-item', kwargs={'pk': self.venta.id})
+        resp = self.client.patch(url, {'item_id': item.id, 'cantidad': 3}, format='json')
+        self.assertEqual(resp.data['venta']['total'], '93.00')
+
+        url = reverse('venta-eliminar-item', kwargs={'pk': self.venta.id})
+        resp = self.client.delete(url, {'item_id': item.id}, format='json')
+        self.assertEqual(resp.data['venta']['total'], '31.50')
+
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.subtotal, Decimal('31.50'))
+        self.assertTrue(self.venta.verificar_total())
+
+    def test_guardar_item_no_depende_de_la_cantidad_de_items(self):
+        """Guardar el N-ésimo item cuesta las mismas consultas que guardar el segundo"""
+        def crear_item(producto):
+            return ItemVenta.objects.create(
+                venta=self.venta, producto=producto, cantidad=1, precio_unitario=producto.precio
+            )
+
+        crear_item(self.productos[0])
+        with CaptureQueriesContext(connection) as segundo:
+            crear_item(self.productos[1])
+        for producto in self.productos[2:7]:
+            crear_item(producto)
+        with CaptureQueriesContext(connection) as octavo:
+            crear_item(self.productos[7])
+
+        self.assertEqual(len(segundo.captured_queries), len(octavo.captured_queries))
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.total, sum(p.precio for p in self.productos))
+
+    def test_verificar_total_detecta_y_corrige_inconsistencias(self):
+        """La verificación recalcula desde los items y corrige si se pide"""
+        self._agregar(self.productos[0], 2)
+        Venta.objects.filter(pk=self.venta.pk).update(subtotal=Decimal('1.00'), total=Decimal('1.00'))
+
+        self.assertFalse(self.venta.verificar_total())
+        self.assertEqual(self.venta.total, Decimal('1.00'))
+
+        self.assertFalse(self.venta.verificar_total(corregir=True))
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.total, Decimal('21.00'))
+        self.assertTrue(self.venta.verificar_total())
+
+    def test_comando_verificar_totales_corrige_ventas(self):
+        """El comando encuentra y corrige las ventas inconsistentes"""
+        self._agregar(self.productos[0], 2)
+        Venta.objects.filter(pk=self.venta.pk).update(total=Decimal('5.00'))
+
+        salida = StringIO()
+        call_command('verificar_totales_ventas', '--corregir', stdout=salida)
+
+        self.assertIn('1 ventas corregidas', salida.getvalue())
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.total, Decimal('21.00'))
+
+
+class NumeracionVentaTestCase(TransactionTestCase):
+    """Tests para la asignación concurrente de números de venta"""
+
+    HILOS = 16
+    VENTAS_POR_HILO = 25
+
+    def setUp(self):
+        self.supermercados = [
+            User.objects.create_user(
+                username=f'super_num_{i}',
+                email=f'super_num_{i}@test.com',
+                password='testpass123',
+                nombre_supermercado=f'Super {i}',
+                cuil=f'2022222222{i}',
+                provincia='Buenos Aires',
+                localidad='La Plata'
+            )
+            for i in range(2)
+        ]
+        self.fecha = datetime.date(2025, 10, 16)
+
+    def _en_paralelo(self, funcion):
+        """Ejecuta `funcion` VENTAS_POR_HILO veces en cada hilo y junta los resultados"""
+        def trabajar(_):
+            try:
+                return [funcion() for _ in range(self.VENTAS_POR_HILO)]
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.HILOS) as executor:
+            resultados = executor.map(trabajar, range(self.HILOS))
+        return [numero for lote in resultados for numero in lote]
+
+    def test_reservas_concurrentes_no_repiten_numeros(self):
+        """Muchos cajeros en paralelo reciben números distintos y consecutivos"""
+        supermercado_id = self.supermercados[0].id
+        numeros = self._en_paralelo(lambda: reservar_numeros(supermercado_id, self.fecha)[0])
+
+        total = self.HILOS * self.VENTAS_POR_HILO
+        self.assertEqual(len(numeros), total)
+        self.assertEqual(sorted(numeros), list(range(1, total + 1)))
+
+    @override_settings(VENTAS_BLOQUE_NUMERACION=10)
+    def test_bloques_por_terminal_no_repiten_numeros(self):
+        """Las terminales que reservan bloques tampoco comparten números"""
+        supermercado_id = self.supermercados[0].id
+        asignador = AsignadorNumerosVenta()
+        terminales = iter(range(10 ** 6))
+
+        def vender():
+            # Cada llamada simula una terminal distinta que consume un número de su bloque
+            return asignador.siguiente(supermercado_id, self.fecha, f'caja-{next(terminales) % 4}')
+
+        numeros = self._en_paralelo(vender)
+
+        self.assertEqual(len(numeros), len(set(numeros)))
+        secuencia = SecuenciaVenta.objects.get(supermercado_id=supermercado_id, fecha=self.fecha)
+        self.assertGreaterEqual(secuencia.ultimo_numero, len(numeros))
+
+    def test_secuencias_independientes_por_supermercado_y_dia(self):
+        """Cada supermercado y cada día empiezan su propia numeración"""
+        primero, segundo = self.supermercados
+        self.assertEqual(list(reservar_numeros(primero.id, self.fecha, 3)), [1, 2, 3])
+        self.assertEqual(list(reservar_numeros(segundo.id, self.fecha)), [1])
+        self.assertEqual(list(reservar_numeros(primero.id, self.fecha)), [4])
+        otro_dia = self.fecha + datetime.timedelta(days=1)
+        self.assertEqual(list(reservar_numeros(primero.id, otro_dia)), [1])
@@ -0,0 +1,29 @@
+"""
+Datos de la venta comunes a todos los formatos de ticket (PDF y ESC/POS).
+
+No depende de reportlab, así el ticket ESC/POS no lo importa.
+"""
+from .serializers import obtener_supermercado_usuario
+
+
+class DatosTicketMixin:
+    """Supermercado, items y cajero de `self.venta` tal como se imprimen en el ticket"""
+
+    def get_supermercado_info(self):
+        """Obtiene la información del supermercado"""
+        supermercado = obtener_supermercado_usuario(self.venta.cajero)
+        return {
+            'nombre': supermercado.nombre_supermercado if hasattr(supermercado, 'nombre_supermercado') else 'SUPERMERCADO',
+            'user': supermercado
+        }
+
+    def get_items(self):
+        """Items de la venta con su producto, usando el prefetch si la venta lo trae"""
+        if 'items' in getattr(self.venta, '_prefetched_objects_cache', {}):
+            return list(self.venta.items.all())
+        return list(self.venta.items.select_related('producto'))
+
+    def get_cajero_nombre(self):
+        if self.venta.empleado_cajero:
+            return f"{self.venta.empleado_cajero.nombre} {self.venta.empleado_cajero.apellido}"
+        return self.venta.cajero.get_full_name() or "Administrador"
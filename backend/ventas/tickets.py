@@ -0,0 +1,182 @@
+"""
+Almacén y descarga de tickets de venta.
+
+Cada venta tiene un único archivo de ticket (ver Venta.nombre_archivo_ticket).
+Se genera una sola vez, en el worker de tareas o en la primera descarga, y
+después descargarlo solo cuesta leer el archivo. Las descargas responden GET
+condicionales (ETag / Last-Modified), pedidos de rango de bytes y, si está
+configurado VENTAS_TICKETS_X_ACCEL_PREFIX, delegan el envío al proxy con
+X-Accel-Redirect.
+
+Formatos: 'pdf' (por defecto) y 'escpos' (bytes para impresora térmica).
+"""
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .escpos import generar_ticket_escpos
+from .models import Venta
+from .pdf_generator import generar_ticket_pdf
+
+TAMANO_BLOQUE = 64 * 1024
+
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# formato: (función que genera los bytes, content type, extensión del archivo)
+FORMATOS = {
+    'pdf': (lambda venta: generar_ticket_pdf(venta).getvalue(), 'application/pdf', 'pdf'),
+    'escpos': (generar_ticket_escpos, 'application/octet-stream', 'bin'),
+}
+
+
+def ruta_ticket(venta, formato='pdf'):
+    """Ruta absoluta del archivo de ticket de la venta"""
+    return os.path.join(settings.MEDIA_ROOT, venta.nombre_archivo_ticket(FORMATOS[formato][2]))
+
+
+def guardar_ticket(venta, formato='pdf'):
+    """
+    Genera y guarda el ticket de la venta si todavía no existe; el PDF además se marca
+    como listo en la venta. Devuelve la ruta del archivo. Si ya estaba guardado no
+    vuelve a generarlo.
+    """
+    generar, _content_type, extension = FORMATOS[formato]
+    ruta = ruta_ticket(venta, formato)
+    nombre = venta.nombre_archivo_ticket(extension)
+
+    if not os.path.exists(ruta):
+        contenido = generar(venta)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escribir en un temporal y renombrar: nunca se sirve un ticket a medio escribir
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as archivo:
+            archivo.write(contenido)
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, ruta)
+
+    if formato == 'pdf' and (venta.ticket_estado != 'LISTO' or venta.ticket_pdf.name != nombre):
+        Venta.objects.filter(pk=venta.pk).update(
+            ticket_pdf=nombre,
+            ticket_estado='LISTO',
+            ticket_pdf_generado=True
+        )
+        venta.ticket_pdf.name = nombre
+        venta.ticket_estado = 'LISTO'
+        venta.ticket_pdf_generado = True
+
+    return ruta
+
+
+def _rango_pedido(request, etag, tamano):
+    """
+    Interpreta el header Range. Devuelve None si hay que enviar el archivo completo
+    (sin Range o con uno mal formado), (inicio, fin) con un rango válido, o False si
+    el rango es válido pero empieza después del final del archivo.
+    Solo se atiende un rango por pedido; con varios se envía el archivo completo.
+    """
+    rango = request.META.get('HTTP_RANGE', '').strip()
+    if not rango:
+        return None
+
+    # Si el cliente tiene una versión vieja del archivo, mandarle el actual completo
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+
+    coincidencia = _RANGO.match(rango)
+    if not coincidencia or coincidencia.groups() == ('', ''):
+        return None
+
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        # bytes=-N: los últimos N bytes (con N=0 no hay nada que enviar)
+        if int(fin) == 0 or tamano == 0:
+            return False
+        return max(tamano - int(fin), 0), tamano - 1
+
+    inicio = int(inicio)
+    # Un rango mal formado (bytes=5-3) se ignora y se envía el archivo completo (RFC 9110)
+    if fin and int(fin) < inicio:
+        return None
+    # Válido pero fuera del archivo: 416
+    if inicio >= tamano:
+        return False
+    return inicio, min(int(fin), tamano - 1) if fin else tamano - 1
+
+
+def _leer_bloques(ruta, inicio, fin):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        restante = fin - inicio + 1
+        while restante > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+def respuesta_ticket(request, venta, formato='pdf', filename=None):
+    """Respuesta HTTP con el ticket guardado de la venta (generándolo una vez si hace falta)"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de ticket inválido: '{formato}'. Opciones: {', '.join(FORMATOS)}.")
+    if not filename:
+        filename = f"ticket_{venta.numero_venta}.{FORMATOS[formato][2]}"
+
+    ruta = guardar_ticket(venta, formato)
+    estado = os.stat(ruta)
+    etag = quote_etag(f"{venta.pk}-{estado.st_size}-{int(estado.st_mtime)}")
+    ultima_modificacion = int(estado.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        response = _respuesta_archivo(request, venta, formato, ruta, estado.st_size, etag, filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ultima_modificacion)
+    return response
+
+
+def _respuesta_archivo(request, venta, formato, ruta, tamano, etag, filename):
+    _generar, content_type, extension = FORMATOS[formato]
+    disposicion = f'attachment; filename="{filename}"'
+
+    prefijo = getattr(settings, 'VENTAS_TICKETS_X_ACCEL_PREFIX', '')
+    if prefijo:
+        # El proxy lee el archivo y se encarga también de los rangos
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{prefijo.rstrip('/')}/{venta.nombre_archivo_ticket(extension)}"
+        response['Content-Disposition'] = disposicion
+        return response
+
+    rango = _rango_pedido(request, etag, tamano)
+    if rango is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return response
+
+    if rango is None:
+        response = FileResponse(
+            open(ruta, 'rb'),
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type
+        )
+    else:
+        inicio, fin = rango
+        response = StreamingHttpResponse(
+            _leer_bloques(ruta, inicio, fin),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+        response['Content-Length'] = str(fin - inicio + 1)
+        response['Content-Disposition'] = disposicion
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
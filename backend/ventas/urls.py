@@ -4,6 +4,8 @@ from .views import (
     VentaViewSet, 
     obtener_productos_disponibles, 
     buscar_productos,
+    autocompletar_productos,
+    escanear_producto,
     historial_ventas,
     descargar_ticket_pdf
 )
@@ -15,6 +17,8 @@ urlpatterns = [
     path('', include(router.urls)),
     path('productos-disponibles/', obtener_productos_disponibles, name='productos-disponibles'),
     path('buscar-productos/', buscar_productos, name='buscar-productos'),
+    path('autocompletar-productos/', autocompletar_productos, name='autocompletar-productos-caja'),
+    path('escanear/<str:codigo>/', escanear_producto, name='escanear-producto'),
     path('historial/', historial_ventas, name='historial-ventas'),
     path('ticket/<int:venta_id>/pdf/', descargar_ticket_pdf, name='descargar-ticket-pdf'),
 ]
@@ -5,6 +5,7 @@ from rest_framework.viewsets import ModelViewSet
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.db import transaction, models
+from django.db.models import prefetch_related_objects
 from django.http import HttpResponse
 from decimal import Decimal
 
@@ -15,18 +16,41 @@ from .serializers import (
     CrearItemVentaSerializer,
     ActualizarItemVentaSerializer,
     FinalizarVentaSerializer,
-    HistorialVentaSerializer
+    CheckoutVentaSerializer,
+    HistorialVentaSerializer,
+    obtener_datos_cajero,
+    obtener_supermercado_usuario,
+    obtener_terminal
 )
-from productos.models import Producto, ProductoDeposito
+from .services import (
+    precio_item,
+    registrar_venta_completa,
+    descontar_stock_venta,
+    StockInsuficienteError
+)
+from appproductos.pagination import PaginacionCursorOpcional
 from authentication.models import EmpleadoUser
 from authentication.permissions import IsCajeroOrAdmin, IsSupermercadoAdmin
-from .pdf_generator import generar_ticket_pdf_response, guardar_ticket_pdf
+from .idempotencia import IdempotenciaMixin
+from .reservas import reservar_stock, liberar_reserva
+from .catalogo import (
+    contexto_catalogo,
+    productos_con_stock,
+    productos_disponibles,
+    respuesta_catalogo,
+    respuesta_catalogo_en_cache
+)
+from productos.busqueda import autocompletar, leer_limite
+from .escaneo import contexto_escaneo, escanear_codigo
+from .tickets import respuesta_ticket, FORMATOS as FORMATOS_TICKET
 
 
-class VentaViewSet(ModelViewSet):
-    """ViewSet para gestionar las ventas"""
+class VentaViewSet(IdempotenciaMixin, ModelViewSet):
+    """ViewSet para gestionar las ventas (acepta Idempotency-Key en las operaciones que modifican)"""
     serializer_class = VentaSerializer
     permission_classes = [permissions.IsAuthenticated, IsCajeroOrAdmin]
+    pagination_class = PaginacionCursorOpcional
+    ordenamiento_cursor = ('-fecha_creacion', '-id')
     
     def get_queryset(self):
         """Filtrar ventas por el supermercado del usuario"""
@@ -81,64 +105,34 @@ class VentaViewSet(ModelViewSet):
         
         try:
             with transaction.atomic():
-                producto_id = serializer.validated_data['producto_id']
+                producto = serializer.validated_data['producto']
                 cantidad = serializer.validated_data['cantidad']
                 
-                producto = Producto.objects.get(id=producto_id)
-                
                 # Verificar si el producto ya existe en la venta
-                item_existente = ItemVenta.objects.filter(
-                    venta=venta,
-                    producto=producto
-                ).first()
+                item_existente = venta.items.filter(producto=producto).first()
+                nueva_cantidad = cantidad + (item_existente.cantidad if item_existente else 0)
+                
+                # Reservar la cantidad total del item (valida el stock contra otros carritos)
+                reservar_stock(venta, producto, nueva_cantidad, obtener_supermercado_usuario(request.user))
                 
                 if item_existente:
                     # Actualizar cantidad del item existente
-                    nueva_cantidad = item_existente.cantidad + cantidad
-                    
-                    # Validar stock para la nueva cantidad total
-                    update_serializer = ActualizarItemVentaSerializer(
-                        instance=item_existente,
-                        data={'cantidad': nueva_cantidad},
-                        context={'request': request}
-                    )
-                    update_serializer.is_valid(raise_exception=True)
-                    
                     item_existente.cantidad = nueva_cantidad
                     item_existente.save()
                     item = item_existente
                 else:
-                    # Verificar si hay oferta activa
-                    mejor_oferta = producto.get_mejor_oferta()
-                    
-                    if mejor_oferta:
-                        # Aplicar precio con descuento
-                        precio_venta = mejor_oferta.precio_con_descuento
-                        precio_original = producto.precio
-                        descuento = precio_original - precio_venta
-                        oferta_nombre = mejor_oferta.oferta.nombre
-                    else:
-                        # Precio normal sin oferta
-                        precio_venta = producto.precio
-                        precio_original = None
-                        descuento = Decimal('0.00')
-                        oferta_nombre = None
-                    
-                    # Crear nuevo item con información de oferta
+                    # Crear nuevo item con el precio de la oferta activa (si hay)
                     item = ItemVenta.objects.create(
                         venta=venta,
                         producto=producto,
                         cantidad=cantidad,
-                        precio_unitario=precio_venta,
-                        precio_original=precio_original,
-                        descuento_aplicado=descuento,
-                        oferta_nombre=oferta_nombre
+                        **precio_item(producto, producto.get_mejor_oferta())
                     )
                 
                 # Cambiar estado a PROCESANDO si está PENDIENTE
                 if venta.estado == 'PENDIENTE':
                     venta.estado = 'PROCESANDO'
-                    venta.save()
+                    venta.save(update_fields=['estado'])
                 
                 return Response(
                     {
@@ -149,6 +143,11 @@ class VentaViewSet(ModelViewSet):
                     status=status.HTTP_200_OK
                 )
                 
+        except StockInsuficienteError as e:
+            return Response(
+                {'error': f'Error al agregar producto: {str(e)}', 'faltantes': e.faltantes},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'error': f'Error al agregar producto: {str(e)}'},
@@ -175,7 +174,7 @@ class VentaViewSet(ModelViewSet):
             )
         
         try:
-            item = ItemVenta.objects.get(id=item_id, venta=venta)
+            item = venta.items.select_related('producto').get(id=item_id)
         except ItemVenta.DoesNotExist:
             return Response(
                 {'error': 'Item no encontrado en esta venta.'},
@@ -192,6 +191,7 @@ class VentaViewSet(ModelViewSet):
         try:
             with transaction.atomic():
                 item.cantidad = serializer.validated_data['cantidad']
+                reservar_stock(venta, item.producto, item.cantidad, obtener_supermercado_usuario(request.user))
                 item.save()
                 
                 return Response(
@@ -202,6 +202,11 @@ class VentaViewSet(ModelViewSet):
                     },
                     status=status.HTTP_200_OK
                 )
+        except StockInsuficienteError as e:
+            return Response(
+                {'error': f'Error al actualizar item: {str(e)}', 'faltantes': e.faltantes},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'error': f'Error al actualizar item: {str(e)}'},
@@ -228,7 +233,7 @@ class VentaViewSet(ModelViewSet):
             )
         
         try:
-            item = ItemVenta.objects.get(id=item_id, venta=venta)
+            item = venta.items.get(id=item_id)
         except ItemVenta.DoesNotExist:
             return Response(
                 {'error': 'Item no encontrado en esta venta.'},
@@ -237,11 +242,9 @@ class VentaViewSet(ModelViewSet):
         
         try:
             with transaction.atomic():
+                # Al eliminarse, el item descuenta su subtotal del total de la venta
                 item.delete()
-                
-                # Recalcular total de la venta
-                venta.calcular_total()
-                venta.save()
+                liberar_reserva(venta, item.producto_id)
                 
                 return Response(
                     {
@@ -261,8 +264,11 @@ class VentaViewSet(ModelViewSet):
         """Finalizar la venta y ajustar el stock"""
         venta = self.get_object()
         
+        # Cargar una sola vez los items con sus productos (stock, ticket y respuesta)
+        prefetch_related_objects([venta], 'items__producto')
+        
         # Verificar que la venta tenga items
-        if not venta.items.exists():
+        if not venta.items.all():
             return Response(
                 {'error': 'No se puede finalizar una venta sin productos.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -287,47 +293,18 @@ class VentaViewSet(ModelViewSet):
                 if serializer.validated_data.get('observaciones'):
                     venta.observaciones = serializer.validated_data['observaciones']
                 
-                # Ajustar el stock de todos los productos
-                from .serializers import obtener_supermercado_usuario
-                cajero_supermercado = obtener_supermercado_usuario(request.user)
-                
-                for item in venta.items.all():
-                    # Buscar el stock del producto en el depósito del supermercado
-                    producto_deposito = ProductoDeposito.objects.filter(
-                        producto=item.producto,
-                        deposito__supermercado=cajero_supermercado,
-                        deposito__activo=True
-                    ).first()
-                    
-                    if not producto_deposito:
-                        raise Exception(
-                            f"No se encontró stock para el producto {item.producto.nombre}"
-                        )
-                    
-                    # Verificar stock suficiente
-                    if producto_deposito.cantidad < item.cantidad:
-                        raise Exception(
-                            f"Stock insuficiente para {item.producto.nombre}. "
-                            f"Disponible: {producto_deposito.cantidad}, necesario: {item.cantidad}"
-                        )
-                    
-                    # Reducir stock
-                    producto_deposito.cantidad -= item.cantidad
-                    producto_deposito.save()
+                # Ajustar el stock de todos los productos con un bloqueo y un UPDATE
+                descontar_stock_venta(venta, obtener_supermercado_usuario(request.user))
                 
                 # Cambiar estado de la venta
                 venta.estado = 'COMPLETADA'
                 venta.fecha_completada = timezone.now()
-                venta.save()
+                venta.save(update_fields=[
+                    'cliente_telefono', 'observaciones', 'estado', 'fecha_completada'
+                ])
                 
-                # Generar PDF del ticket
-                try:
-                    pdf_path = guardar_ticket_pdf(venta)
-                    venta.ticket_pdf_generado = True
-                    venta.save(update_fields=['ticket_pdf_generado'])
-                except Exception as e:
-                    print(f"Error generando PDF: {e}")
-                    # No fallar la venta por error en PDF
+                # El ticket PDF lo genera el worker de tareas, fuera de esta transacción
+                venta.solicitar_ticket()
                 
                 # Enviar por WhatsApp si se solicita (implementar después)
                 if serializer.validated_data.get('enviar_whatsapp') and venta.cliente_telefono:
@@ -342,12 +319,57 @@ class VentaViewSet(ModelViewSet):
                     status=status.HTTP_200_OK
                 )
                 
+        except StockInsuficienteError as e:
+            return Response(
+                {'error': f'Error al finalizar venta: {str(e)}', 'faltantes': e.faltantes},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'error': f'Error al finalizar venta: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """Registrar y finalizar una venta completa (todos los items) en un solo request"""
+        serializer = CheckoutVentaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        datos_cajero = obtener_datos_cajero(request.user)
+        
+        try:
+            venta = registrar_venta_completa(
+                datos_cajero,
+                obtener_supermercado_usuario(request.user),
+                serializer.validated_data['items'],
+                cliente_telefono=serializer.validated_data.get('cliente_telefono'),
+                observaciones=serializer.validated_data.get('observaciones'),
+                terminal=obtener_terminal(request)
+            )
+        except StockInsuficienteError as e:
+            return Response(
+                {'error': f'Error al registrar la venta: {str(e)}', 'faltantes': e.faltantes},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {'error': f'Error al registrar la venta: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Recargar con items y productos para serializar sin N+1
+        venta = Venta.objects.select_related(
+            'cajero', 'empleado_cajero'
+        ).prefetch_related('items__producto').get(pk=venta.pk)
+        
+        return Response(
+            {
+                'message': 'Venta registrada exitosamente',
+                'venta': VentaSerializer(venta, context={'request': request}).data
+            },
+            status=status.HTTP_201_CREATED
+        )
+    
     @action(detail=True, methods=['post'])
     def cancelar(self, request, pk=None):
         """Cancelar una venta"""
@@ -362,7 +384,8 @@ class VentaViewSet(ModelViewSet):
         
         try:
             venta.estado = 'CANCELADA'
-            venta.save()
+            venta.save(update_fields=['estado'])
+            liberar_reserva(venta)
             
             return Response(
                 {
@@ -379,7 +402,7 @@ class VentaViewSet(ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def descargar_ticket(self, request, pk=None):
-        """Descargar el ticket de la venta en PDF"""
+        """Descargar el ticket de la venta en PDF (o ESC/POS con ?formato=escpos)"""
         venta = self.get_object()
         
         # Verificar que la venta esté completada
@@ -389,9 +412,16 @@ class VentaViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        formato = request.query_params.get('formato', 'pdf')
+        if formato not in FORMATOS_TICKET:
+            return Response(
+                {'error': f"Formato inválido. Opciones: {', '.join(FORMATOS_TICKET)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
-            # Generar y retornar el PDF
-            return generar_ticket_pdf_response(venta)
+            # Servir el ticket guardado (se genera una sola vez si todavía no está)
+            return respuesta_ticket(request, venta, formato)
         except Exception as e:
             return Response(
                 {'error': f'Error al generar PDF: {str(e)}'},
@@ -402,74 +432,16 @@ class VentaViewSet(ModelViewSet):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated, IsCajeroOrAdmin])
 def obtener_productos_disponibles(request):
-    """Obtener lista de productos disponibles para venta"""
+    """
+    Obtener lista de productos disponibles para venta.
+    Empleados con depósito asignado ven solo ese depósito; el resto, todos los
+    depósitos activos del supermercado. Las cajas descargan el catálogo completo:
+    se responde desde la copia de la versión vigente, con ETag (304 si el
+    cliente ya la tiene).
+    """
     try:
-        # Determinar el supermercado y depósito según el tipo de usuario
-        if hasattr(request.user, 'supermercado'):
-            # Es un empleado (cajero/reponedor)
-            cajero_supermercado = request.user.supermercado
-            
-            # Obtener el depósito asignado al empleado
-            from empleados.models import Empleado
-            try:
-                empleado = Empleado.objects.get(
-                    email=request.user.email,
-                    supermercado=cajero_supermercado
-                )
-                deposito_empleado = empleado.deposito
-            except Empleado.DoesNotExist:
-                deposito_empleado = None
-        else:
-            # Es un admin de supermercado
-            cajero_supermercado = request.user
-            deposito_empleado = None
-        
-        # Filtrar productos según si tiene depósito asignado o no
-        if deposito_empleado:
-            # Empleado con depósito asignado: solo productos de su depósito
-            productos_con_stock = Producto.objects.filter(
-                activo=True,
-                stocks__deposito=deposito_empleado,
-                stocks__cantidad__gt=0
-            ).distinct().select_related('categoria').prefetch_related('stocks')
-        else:
-            # Admin o empleado sin depósito: todos los productos del supermercado
-            productos_con_stock = Producto.objects.filter(
-                activo=True,
-                stocks__deposito__supermercado=cajero_supermercado,
-                stocks__deposito__activo=True,
-                stocks__cantidad__gt=0
-            ).distinct().select_related('categoria').prefetch_related('stocks')
-        
-        productos_data = []
-        for producto in productos_con_stock:
-            # Calcular stock según el depósito
-            if deposito_empleado:
-                # Stock solo de su depósito
-                stock_total = sum(
-                    stock.cantidad for stock in producto.stocks.filter(
-                        deposito=deposito_empleado
-                    )
-                )
-            else:
-                # Stock total de todos los depósitos activos del supermercado
-                stock_total = sum(
-                    stock.cantidad for stock in producto.stocks.filter(
-                        deposito__supermercado=cajero_supermercado,
-                        deposito__activo=True
-                    )
-                )
-            
-            productos_data.append({
-                'id': producto.id,
-                'nombre': producto.nombre,
-                'categoria': producto.categoria.nombre,
-                'precio': str(producto.precio),
-                'descripcion': producto.descripcion,
-                'stock_disponible': stock_total
-            })
-        
-        return Response(productos_data, status=status.HTTP_200_OK)
+        supermercado, deposito = contexto_catalogo(request.user)
+        return respuesta_catalogo_en_cache(request, supermercado, deposito)
         
     except Exception as e:
         return Response(
@@ -481,7 +453,7 @@ def obtener_productos_disponibles(request):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated, IsCajeroOrAdmin])
 def buscar_productos(request):
-    """Buscar productos por nombre o código"""
+    """Buscar productos por nombre (hasta 20 resultados, con el mismo alcance que el catálogo)"""
     query = request.GET.get('q', '').strip()
     
     if len(query) < 2:
@@ -491,73 +463,63 @@ def buscar_productos(request):
         )
     
     try:
-        # Determinar el supermercado y depósito según el tipo de usuario
-        if hasattr(request.user, 'supermercado'):
-            # Es un empleado (cajero/reponedor)
-            cajero_supermercado = request.user.supermercado
-            
-            # Obtener el depósito asignado al empleado
-            from empleados.models import Empleado
-            try:
-                empleado = Empleado.objects.get(
-                    email=request.user.email,
-                    supermercado=cajero_supermercado
-                )
-                deposito_empleado = empleado.deposito
-            except Empleado.DoesNotExist:
-                deposito_empleado = None
-        else:
-            # Es un admin de supermercado
-            cajero_supermercado = request.user
-            deposito_empleado = None
-        
-        # Buscar productos según si tiene depósito asignado o no
-        if deposito_empleado:
-            # Empleado con depósito asignado: solo productos de su depósito
-            productos = Producto.objects.filter(
-                activo=True,
-                nombre__icontains=query,
-                stocks__deposito=deposito_empleado,
-                stocks__cantidad__gt=0
-            ).distinct().select_related('categoria')[:20]
-        else:
-            # Admin o empleado sin depósito: todos los productos del supermercado
-            productos = Producto.objects.filter(
-                activo=True,
-                nombre__icontains=query,
-                stocks__deposito__supermercado=cajero_supermercado,
-                stocks__deposito__activo=True,
-                stocks__cantidad__gt=0
-            ).distinct().select_related('categoria')[:20]
-        
-        productos_data = []
-        for producto in productos:
-            # Calcular stock según el depósito
-            if deposito_empleado:
-                # Stock solo de su depósito
-                stock_total = sum(
-                    stock.cantidad for stock in producto.stocks.filter(
-                        deposito=deposito_empleado
-                    )
-                )
-            else:
-                # Stock total de todos los depósitos activos del supermercado
-                stock_total = sum(
-                    stock.cantidad for stock in producto.stocks.filter(
-                        deposito__supermercado=cajero_supermercado,
-                        deposito__activo=True
-                    )
-                )
-            
-            productos_data.append({
-                'id': producto.id,
-                'nombre': producto.nombre,
-                'categoria': producto.categoria.nombre,
-                'precio': str(producto.precio),
-                'stock_disponible': stock_total
-            })
+        supermercado, deposito = contexto_catalogo(request.user)
+        productos = productos_disponibles(supermercado, deposito, busqueda=query)[:20]
+        return respuesta_catalogo(productos, descripcion=False)
         
-        return Response(productos_data, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {'error': f'Error en la búsqueda: {str(e)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsCajeroOrAdmin])
+def escanear_producto(request, codigo):
+    """
+    Resolver un código de barras escaneado en caja: producto, precio efectivo y
+    stock disponible en el alcance del usuario (ver ventas.escaneo).
+    """
+    try:
+        supermercado, deposito = contexto_escaneo(request.user)
+        producto = escanear_codigo(supermercado, deposito, codigo.strip())
+    except Exception as e:
+        return Response(
+            {'error': f'Error al escanear: {str(e)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if producto is None:
+        return Response(
+            {'error': 'No hay ningún producto activo con este código de barras.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(producto)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsCajeroOrAdmin])
+def autocompletar_productos(request):
+    """
+    Autocompletado para la caja (?q=, ?limite=): productos con stock en el alcance
+    del usuario, ordenados por relevancia. Se consulta en cada tecla.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response([])
+    
+    try:
+        supermercado, deposito = contexto_catalogo(request.user)
+        productos = autocompletar(
+            productos_con_stock(supermercado, deposito),
+            query,
+            leer_limite(request.query_params.get('limite'))
+        )
+        return Response([
+            {'id': producto.id, 'nombre': producto.nombre, 'precio': str(producto.precio)}
+            for producto in productos
+        ])
         
     except Exception as e:
         return Response(
@@ -665,7 +627,15 @@ def descargar_ticket_pdf(request, venta_id):
     Vista para descargar el ticket PDF de una venta específica.
     - Administradores: Pueden descargar tickets de cualquier venta de su supermercado
     - Cajeros: Pueden descargar tickets solo de sus propias ventas
+    Con ?formato=escpos devuelve los bytes ESC/POS para la impresora térmica.
     """
+    formato = request.query_params.get('formato', 'pdf')
+    if formato not in FORMATOS_TICKET:
+        return Response(
+            {'error': f"Formato inválido. Opciones: {', '.join(FORMATOS_TICKET)}."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
     try:
         # Filtrar según el tipo de usuario
         if isinstance(request.user, EmpleadoUser):
@@ -682,9 +652,8 @@ def descargar_ticket_pdf(request, venta_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Generar y devolver el PDF
-        response = generar_ticket_pdf_response(venta)
-        return response
+        # Servir el ticket guardado (se genera una sola vez si todavía no está)
+        return respuesta_ticket(request, venta, formato)
         
     except Venta.DoesNotExist:
         return Response(